@@ -0,0 +1,31 @@
+"""Replay throughput of the backtest engine on a synthetic recording.
+
+    python benchmarks/bench_backtest.py [ticks]
+"""
+
+import os
+import sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, ROOT)
+from synthetic import make_series
+from makerbot.core import type_map, default_map
+from makerbot.helpers import get_config, OrderBookSeries
+from makerbot.backtest import run_backtest, market_info
+
+SEGMENT = 100000
+
+
+def main(count=1000000):
+    config = get_config(type_map, 'eth_usdc', os.path.join(ROOT, 'default.ini'), default_map)
+    series = make_series(count, seed=3)
+    segments = [OrderBookSeries(series.t[idx:idx + SEGMENT], series.data[idx:idx + SEGMENT])
+                for idx in range(0, count, SEGMENT)]
+    result = run_backtest(segments, market_info(config), config)
+    print("{} ticks in {:.2f}s, {:.0f} ticks/s, {} decisions, {} fills, pnl {}".format(
+        result.ticks, result.elapsed, result.ticks_per_second, result.decisions,
+        len(result.fills), result.pnl))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,50 @@
+"""Import time and memory of the package entry points, each in a fresh interpreter.
+
+    python benchmarks/bench_import.py [runs]
+
+Reports the best time of runs, the peak RSS and which heavy dependencies
+ended up loaded.
+"""
+
+import os
+import sys
+import subprocess
+
+# Runs from anywhere, the children import the package from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ('pandas', 'nash', 'docopt')
+CASES = [('import makerbot', 'import makerbot'),
+         ('helpers Order', 'from makerbot.helpers import Order, OrderBookSeries'),
+         ('import makerbot.core', 'import makerbot.core'),
+         ('makerbot --version', "sys.argv = ['makerbot', '--version']\n"
+                                "try:\n    from makerbot.core import main; main()\n"
+                                "except SystemExit:\n    pass")]
+CHILD = """import sys, time, resource
+start = time.perf_counter()
+{}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+      ','.join(name for name in {!r} if name in sys.modules) or '-')
+"""
+
+
+def measure(statement, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD.format(statement, HEAVY)], env=os.environ,
+                                cwd=ROOT, stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        elapsed, rss, loaded = output.splitlines()[-1].split()
+        results.append((float(elapsed), int(rss), loaded))
+    return min(results)
+
+
+def main(runs=5):
+    print("{:<24}{:>10}{:>12}  {}".format('case', 'ms', 'RSS MB', 'loaded'))
+    for name, statement in CASES:
+        elapsed, rss, loaded = measure(statement, runs)
+        print("{:<24}{:>10.1f}{:>12.1f}  {}".format(name, elapsed * 1e3, rss / 1024, loaded))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,42 @@
+"""Per-tick cost of get_obs_dataframe against MarketMetrics as history grows.
+
+    python benchmarks/bench_metrics.py
+"""
+
+import os
+import sys
+import time
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import orderbook_stream
+from makerbot.core import get_obs_dataframe
+from makerbot.helpers import OrderBookRing
+from makerbot.metrics import MarketMetrics
+
+SIZES = [1000, 10000, 100000]
+UPDATES = 200
+
+
+def main():
+    books = list(orderbook_stream(UPDATES))
+    print("{:>10} {:>16} {:>16}".format("max_obs", "dataframe (us)", "metrics (us)"))
+    for size in SIZES:
+        obs = OrderBookRing(size)
+        for book in orderbook_stream(size, seed=1):
+            obs.update(book)
+        metrics = MarketMetrics.from_series(obs)
+
+        before = time.perf_counter()
+        for _ in books:
+            get_obs_dataframe(obs).Pmicro.iloc[-1]
+        frame_us = (time.perf_counter() - before) / UPDATES * 1e6
+
+        before = time.perf_counter()
+        for _ in books:
+            metrics.update(obs).Pmicro[-1]
+        metrics_us = (time.perf_counter() - before) / UPDATES * 1e6
+        print("{:>10} {:>16.1f} {:>16.1f}".format(size, frame_us, metrics_us))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Per-update cost of the OrderBookSeries backends as history grows.
+
+    python benchmarks/bench_obs_update.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import orderbook_stream
+from makerbot.helpers import OBS_DEPTH, OBS_DTYPE, OrderBookSeries, OrderBookRing
+
+SIZES = [1000, 10000, 100000, 1000000]
+# Appending copies the whole history, past this size it takes minutes to run
+MAX_APPEND_SIZE = 100000
+UPDATES = 500
+
+
+def full_series(size):
+    return OrderBookSeries(np.zeros(size, dtype="datetime64[ns]"),
+                           np.zeros((size, OBS_DEPTH), dtype=OBS_DTYPE))
+
+def per_update(obs, size, books):
+    before = time.perf_counter()
+    for book in books:
+        obs = obs.update(book, size)
+    return (time.perf_counter() - before) / len(books)
+
+def main():
+    books = list(orderbook_stream(UPDATES))
+    print("{:>10} {:>14} {:>14}".format("max_obs", "append (us)", "ring (us)"))
+    for size in SIZES:
+        ring = OrderBookRing(size)
+        # Wrap the ring once so updates overwrite old rows as in steady state
+        if size <= MAX_APPEND_SIZE:
+            for _ in range(size // UPDATES + 1):
+                per_update(ring, size, books)
+        ring_us = per_update(ring, size, books) * 1e6
+        append_us = per_update(full_series(size), size, books) * 1e6 if size <= MAX_APPEND_SIZE else float('nan')
+        print("{:>10} {:>14.1f} {:>14.1f}".format(size, append_us, ring_us))
+
+
+if __name__ == "__main__":
+    main()
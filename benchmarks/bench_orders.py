@@ -0,0 +1,101 @@
+"""Time and allocations of parsing listed orders, Order against the previous
+dict based implementation that deep copied on every replace.
+
+    python benchmarks/bench_orders.py
+"""
+
+import os
+import sys
+import copy
+import time
+import tracemalloc
+from decimal import Decimal
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import make_api_orders
+from makerbot.core import get_orders_by_side
+
+COUNTS = [1000, 10000]
+
+
+def parse_positive_decimal(value, label):
+    val = Decimal(str(value))
+    if val < 0:
+        raise Exception("{} must be positive.".format(label))
+    return val
+
+def parse_str_option(string, options):
+    option = string.strip().upper()
+    if option not in options:
+        raise Exception("Option must be one of {}".format(option, options))
+    return option
+
+
+class LegacyOrder:
+    """Order as it was before slots and trusted construction, parsing
+    included, so the comparison doesn't follow later changes to Order.
+    """
+
+    parse_map = {'price': lambda val: parse_positive_decimal(val, 'price'),
+                 'amount': lambda val: parse_positive_decimal(val, 'amount'),
+                 'buy_or_sell': lambda val: parse_str_option(val, ('BUY', 'SELL')),
+                 'amount_remaining': lambda val: parse_positive_decimal(val, 'amount_remaining'),
+                 'id': lambda val: str(int(val)),
+                 'type': lambda val: parse_str_option(val, ('LIMIT', 'MARKET', 'STOP_LIMIT', 'STOP_MARKET')),
+                 'cancellation_policy': lambda val: parse_str_option(val, ('FILL_OR_KILL', 'GOOD_TIL_CANCELLED',
+                                                                           'GOOD_TIL_TIME', 'IMMEDIATE_OR_CANCEL')),
+                 'allow_taker': bool,
+                 'placed_at': lambda val: val,
+                 'status': lambda val: parse_str_option(val, ('CANCELLED', 'FILLED', 'OPEN', 'PENDING'))}
+
+    def __init__(self, price, amount, buy_or_sell, amount_remaining=-1, id='-1', type='LIMIT',
+                 cancellation_policy='GOOD_TIL_CANCELLED', allow_taker=True, placed_at=None,
+                 status='PENDING'):
+        amount_remaining = Decimal(amount_remaining if amount_remaining != -1 else amount)
+        values = dict(price=price, amount=amount, buy_or_sell=buy_or_sell,
+                      amount_remaining=amount_remaining, id=id, type=type,
+                      cancellation_policy=cancellation_policy, allow_taker=allow_taker,
+                      placed_at=placed_at, status=status)
+        for key, value in values.items():
+            object.__setattr__(self, key, self.parse_map[key](value))
+
+    def __setattr__(self, *args):
+        raise TypeError
+
+    def replace(self, **kwargs):
+        new_order = copy.deepcopy(self)
+        for key in kwargs:
+            object.__setattr__(new_order, key, self.parse_map[key](kwargs[key]))
+        return new_order
+
+    def from_api(order):
+        return LegacyOrder(price=Decimal(order.limit_price.amount), amount=Decimal(order.amount.amount),
+                           buy_or_sell=order.buy_or_sell,
+                           amount_remaining=Decimal(order.amount_remaining.amount), id=order.id,
+                           type=order.type, cancellation_policy=order.cancellation_policy,
+                           placed_at=order.placed_at, status=order.status)
+
+def measure(func):
+    tracemalloc.start()
+    before = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - before
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1e3, peak / 1024, result
+
+def main():
+    print("{:>7} {:>8} {:>20} {:>10} {:>10}".format("orders", "order", "operation", "time (ms)", "peak (KiB)"))
+    for count in COUNTS:
+        orders = make_api_orders(count)
+        cases = [("legacy", lambda: [LegacyOrder.from_api(o) for o in orders if o.buy_or_sell == 'SELL']),
+                 ("slotted", lambda: get_orders_by_side(orders, 'SELL'))]
+        for name, func in cases:
+            elapsed, peak, listed = measure(func)
+            print("{:>7} {:>8} {:>20} {:>10.1f} {:>10.0f}".format(count, name, "get_orders_by_side", elapsed, peak))
+            elapsed, peak, _ = measure(lambda: [o.replace(price = '150.5').replace(buy_or_sell = 'BUY') for o in listed])
+            print("{:>7} {:>8} {:>20} {:>10.1f} {:>10.0f}".format(count, name, "2x replace", elapsed, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Order book parsing cost and snapshot size, per-level loop against book_snapshot.
+
+    python benchmarks/bench_snapshot.py
+"""
+
+import os
+import sys
+import time
+import numpy as np
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import make_orderbook
+from makerbot.helpers import OBS_DTYPE, FLOAT_TYPES, book_snapshot
+
+DEPTHS = [10, 25, 100]
+REPEAT = 2000
+
+
+def loop_snapshot(orderbook, depth):
+    """The per-level parser OrderBookSeries.update used before book_snapshot."""
+    data = np.full(depth, np.nan, dtype=OBS_DTYPE)
+    for idx, ask in enumerate(orderbook.asks):
+        if idx == depth: break
+        data['Pask'][idx] = np.longdouble(ask.price.amount)
+        data['Qask'][idx] = np.longdouble(ask.amount.amount)
+    for idx, bid in enumerate(orderbook.bids[::-1]):
+        if idx == depth: break
+        data['Pbid'][idx] = np.longdouble(bid.price.amount)
+        data['Qbid'][idx] = np.longdouble(bid.amount.amount)
+    return data
+
+def timed(func, *args):
+    before = time.perf_counter()
+    for _ in range(REPEAT):
+        row = func(*args)
+    return (time.perf_counter() - before) / REPEAT * 1e6, row.nbytes
+
+def main():
+    print("{:>6} {:>12} {:>12} {:>10}".format("depth", "parser", "time (us)", "bytes"))
+    for depth in DEPTHS:
+        book = make_orderbook(depth=depth)
+        print("{:>6} {:>12} {:>12.1f} {:>10}".format(depth, "loop", *timed(loop_snapshot, book, depth)))
+        for name, float_type in FLOAT_TYPES.items():
+            print("{:>6} {:>12} {:>12.1f} {:>10}".format(depth, name, *timed(book_snapshot, book, depth, float_type)))
+
+
+if __name__ == "__main__":
+    main()
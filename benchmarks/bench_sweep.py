@@ -0,0 +1,39 @@
+"""Parameter sweep throughput against the number of worker processes.
+
+    python benchmarks/bench_sweep.py [ticks]
+"""
+
+import os
+import sys
+import time
+import tempfile
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, ROOT)
+from synthetic import make_series, write_recording
+from makerbot.core import type_map, default_map
+from makerbot.helpers import get_config
+from makerbot.sweep import parse_grid, grid_points, run_sweep
+
+GRID = ['straddle=0.5,1,2,3', 'buy_down_interval=0.25,0.5,1,2']
+
+
+def main(count=300000):
+    config = get_config(type_map, 'eth_usdc', os.path.join(ROOT, 'default.ini'), default_map)
+    grid = parse_grid(GRID, type_map)
+    points = len(grid_points(grid))
+    with tempfile.TemporaryDirectory() as root:
+        write_recording(root, 'eth_usdc', make_series(count, seed=3))
+        workers, baseline = 1, None
+        while workers <= (os.cpu_count() or 1):
+            before = time.perf_counter()
+            run_sweep(root, config, grid, workers=workers)
+            elapsed = time.perf_counter() - before
+            baseline = baseline or elapsed
+            print("{:3d} workers: {} points x {} ticks in {:.2f}s, speedup {:.2f}".format(
+                workers, points, count, elapsed, baseline / elapsed))
+            workers *= 2
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
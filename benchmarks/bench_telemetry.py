@@ -0,0 +1,61 @@
+"""Instrumentation overhead of a tick against the cost of the tick itself.
+
+    python benchmarks/bench_telemetry.py
+"""
+
+import os
+import sys
+import time
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from synthetic import orderbook_stream
+from makerbot.helpers import OrderBookRing
+from makerbot.metrics import MarketMetrics
+from makerbot.telemetry import Registry
+
+TICKS = 20000
+
+
+def main():
+    registry = Registry()
+    stages = [registry.histogram('makerbot_stage_seconds', market='eth_usdc', stage=name)
+              for name in ('update', 'fetch', 'decide')]
+    tick = registry.histogram('makerbot_stage_seconds', market='eth_usdc', stage='tick')
+    ticks = registry.counter('makerbot_ticks_total', market='eth_usdc')
+    skipped = registry.counter('makerbot_skipped_ticks_total', market='eth_usdc')
+
+    before = time.perf_counter()
+    for _ in range(TICKS):
+        for stage in stages:
+            with stage.time():
+                pass
+        tick.observe(0.001)
+        ticks.inc()
+        skipped.inc(0)
+    overhead = (time.perf_counter() - before) / TICKS
+
+    # The cheapest part of a real tick, updating the series and metrics
+    books = list(orderbook_stream(2000))
+    obs = OrderBookRing(1000)
+    metrics = MarketMetrics(1000)
+    before = time.perf_counter()
+    for book in books:
+        obs = obs.update(book, 1000)
+        metrics.update(obs)
+    update = (time.perf_counter() - before) / len(books)
+
+    print("instrumentation per tick: {:.1f}us".format(overhead * 1e6))
+    print("series and metrics update per tick: {:.1f}us ({:.1%} overhead)".format(update * 1e6, overhead / update))
+    print("with a 50ms round trip to the exchange: {:.3%} overhead".format(overhead / (update + 0.05)))
+    print("export of {} metrics: {:.1f}ms".format(len(registry._metrics),
+                                                 timed(registry.to_prometheus) * 1e3))
+
+
+def timed(func):
+    before = time.perf_counter()
+    func()
+    return time.perf_counter() - before
+
+
+if __name__ == "__main__":
+    main()
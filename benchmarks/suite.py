@@ -0,0 +1,335 @@
+"""Benchmark suite of the bot's hot paths, offline and compared to a stored baseline.
+
+Usage:
+  suite.py [--filter=<text>] [--baseline=<file>] [--tolerance=<ratio>] [--save]
+
+Options:
+  --filter=<text>      Only run cases whose name contains text.
+  --baseline=<file>    Baseline results, benchmarks/baseline.json by default.
+  --tolerance=<ratio>  Allowed slowdown against the baseline [default: 0.3].
+  --save               Store the results as the new baseline.
+
+Runs from any directory. Every case reports the time per call, the
+calls per second and the memory held by its state plus the peak allocated
+by one call. Exits with 1 when a case is slower than its baseline by more
+than the tolerance, baselines are machine specific so save one on the
+machine that runs the comparison.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import itertools
+import tracemalloc
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs from anywhere, the package is imported from the repo root
+sys.path.insert(0, ROOT)
+from types import SimpleNamespace
+from docopt import docopt
+from synthetic import FakeApi, orderbook_stream, delta_stream, make_api_orders, make_series
+from makerbot import core
+from makerbot.backtest import market_info
+from makerbot.book import L2Book
+from makerbot.feed import OrderBookFeed, bootstrap
+from makerbot.fixed import to_fixed
+from makerbot.helpers import Order, OrderBookSeries, get_config
+from makerbot.metrics import MarketMetrics
+from makerbot.analytics import StreamingAnalytics, analyze
+from makerbot.orders import OrderTracker
+from makerbot.scheduler import RequestScheduler
+from makerbot.strategy import FeatureCache
+
+# Each measurement runs for at least this long, the best of REPEAT is kept
+MIN_BATCH = 0.05
+REPEAT = 5
+CASES = []
+STRATEGY_TRADE = core.trade
+
+
+def case(**grid):
+    """Register a case, setup(**params) returns the function to time.
+    Every combination of the grid values is a case of its own.
+    """
+    def register(setup):
+        names = list(grid)
+        for values in itertools.product(*(grid[name] for name in names)):
+            params = dict(zip(names, values))
+            label = ','.join('{}={}'.format(key, value) for key, value in params.items())
+            CASES.append(('{}[{}]'.format(setup.__name__, label) if label else setup.__name__, setup, params))
+        return setup
+    return register
+
+def config(**overrides):
+    settings = dict(get_config(core.type_map, 'eth_usdc', os.path.join(ROOT, 'default.ini'), core.default_map))
+    settings.update(overrides)
+    return settings
+
+def filled_series(max_obs_size, depth, backend='RING'):
+    """A series holding max_obs_size snapshots, as in steady state."""
+    settings = config(obs_backend=backend, obs_depth=depth, max_obs_size=max_obs_size)
+    series = make_series(max_obs_size, depth=depth, float_type=settings['obs_dtype'])
+    if backend == 'APPEND':
+        return series
+    obs = OrderBookSeries.create(settings)
+    for t, snapshot in zip(series.t, series.data):
+        obs._t.append(t)
+        obs._data.append(snapshot)
+    return obs
+
+
+@case(backend=['RING', 'APPEND'], max_obs_size=[1000, 10000, 100000], depth=[10, 25])
+def obs_update(backend, max_obs_size, depth):
+    state = {'obs': filled_series(max_obs_size, depth, backend)}
+    books = itertools.cycle(list(orderbook_stream(500, depth=depth)))
+    def run():
+        state['obs'] = state['obs'].update(next(books), max_obs_size)
+    return run, state
+
+@case(depth=[10, 25], changes=[1, 10])
+def obs_update_delta(depth, changes):
+    """obs_update from a local L2Book, one delta of changes levels per update."""
+    max_obs_size = 10000
+    state = {'obs': filled_series(max_obs_size, depth)}
+    orderbook, deltas = delta_stream(500, depth=depth, changes=changes)
+    book = L2Book()
+    book.load(orderbook)
+    deltas = itertools.cycle(deltas)
+    def run():
+        book.apply(next(deltas)._replace(update_id = book.update_id + 1))
+        state['obs'] = state['obs'].update(book.top(depth), max_obs_size)
+    return run, state
+
+@case(depth=[10, 25])
+def bootstrap_feed(depth):
+    settings = config(obs_depth=depth, max_loading_time=60)
+    books = list(orderbook_stream(settings['min_history_points'], depth=depth))
+    def run():
+        feed = OrderBookFeed()
+        subscription = feed.subscribe()
+        for book in books:
+            feed.publish(book)
+        return asyncio.run(bootstrap(subscription, settings))
+    return run, None
+
+@case(depth=[10, 25])
+def bootstrap_polling(depth):
+    settings = config(obs_depth=depth, market='eth_usdc')
+    scheduler = RequestScheduler(None)
+    def run():
+        return OrderBookSeries.bootstrap(FakeApi(depth=depth), settings, scheduler)
+    return run, None
+
+@case(max_obs_size=[1000, 10000, 100000])
+def get_obs_dataframe(max_obs_size):
+    obs = filled_series(max_obs_size, 25)
+    return lambda: core.get_obs_dataframe(obs), obs
+
+@case(max_obs_size=[1000, 10000, 100000])
+def bollinger_bands(max_obs_size):
+    df = core.get_obs_dataframe(filled_series(max_obs_size, 25))
+    return lambda: core.bollinger_bands(df), df
+
+@case(max_obs_size=[1000, 10000, 100000])
+def metrics_update(max_obs_size):
+    obs = filled_series(max_obs_size, 25)
+    metrics = MarketMetrics.from_series(obs, max_obs_size = max_obs_size)
+    return lambda: metrics.update(obs), metrics
+
+@case(max_obs_size=[1000, 10000, 100000])
+def analytics_batch(max_obs_size):
+    obs = filled_series(max_obs_size, 25)
+    return lambda: analyze(obs), obs
+
+@case(max_obs_size=[1000, 10000, 100000])
+def analytics_update(max_obs_size):
+    obs = filled_series(max_obs_size, 25)
+    analytics = StreamingAnalytics.from_series(obs, max_obs_size = max_obs_size, distances = [0.01, 0.02, 0.05])
+    return lambda: analytics.update(obs), analytics
+
+@case(max_obs_size=[1000, 10000, 100000])
+def is_buying(max_obs_size):
+    obs = filled_series(max_obs_size, 25)
+    return lambda: core.is_buying(obs), obs
+
+@case(max_obs_size=[1000, 10000, 100000])
+def size_order(max_obs_size):
+    core.CONFIG = config()
+    obs = filled_series(max_obs_size, 25)
+    order = Order('149.5', 0, 'BUY')
+    features = FeatureCache()
+    ticks = itertools.count()
+    # A new tick every call, the sizes are computed and not read from the cache
+    def run():
+        return core.size_order(features.update(next(ticks), obs, None), order, to_fixed('0.001'))
+    return run, obs
+
+@case(orders=[100, 1000, 10000])
+def order_from_api(orders):
+    api_orders = make_api_orders(orders)
+    return lambda: [Order.from_api(order) for order in api_orders], api_orders
+
+@case()
+def order_replace():
+    order = Order('149.5', '1.2', 'BUY')
+    return lambda: order.replace_fixed(price = to_fixed('149.6')), None
+
+@case()
+def order_constrain():
+    market = market_info(config())
+    order = Order('149.512345', '1.2345678', 'BUY')
+    return lambda: order.constrain(market, to_fixed('100')), None
+
+@case(orders=[100, 1000, 10000])
+def funds_in_open_orders(orders):
+    api_orders = make_api_orders(orders)
+    return lambda: core.funds_in_open_orders(api_orders), api_orders
+
+@case(orders=[100, 1000, 10000])
+def tracker_funds(orders):
+    tracker = OrderTracker()
+    tracker.reconcile(make_api_orders(orders))
+    return tracker.funds_in_open_orders, tracker
+
+@case(orders=[100, 1000, 10000])
+def ledger_fill(orders):
+    tracker = OrderTracker()
+    tracker.reconcile(make_api_orders(orders))
+    ledger = tracker.ledger
+    order = Order('149.5', '1.2', 'BUY')
+    def fill():
+        ledger.filled(order, 1000)
+        ledger.mark(order.price)
+        return ledger.pnl
+    return fill, tracker
+
+@case(orders=[100, 1000, 10000])
+def tracker_sync(orders):
+    tracker = OrderTracker()
+    api_orders = make_api_orders(orders)
+    tracker.reconcile(api_orders)
+    active = [order for order in api_orders if order.status in ('OPEN', 'PENDING')]
+    return lambda: tracker.sync_active(active), tracker
+
+@case(orders=[0, 100, 1000])
+def loop_tick(orders):
+    """One iteration of the market_maker loop of main(), from a book being
+    published to the decision, against a FakeApi with orders resting.
+    """
+    api = FakeApi(open_orders = orders)
+    core.CONFIG, core.api = config(min_history_points = 10), api
+    core.logger = logging.getLogger('pymaker')
+    core.scheduler = RequestScheduler(None, executor = core.io_pool)
+    market = api.get_market('eth_usdc')
+    getters = core.account_requests(market, None)
+    # Strategy pauses would stall the benchmark, keep the decisions only
+    core.trade = lambda *args: (STRATEGY_TRADE(*args)[0], 0)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    feed = OrderBookFeed()
+    task = loop.create_task(core.market_maker(market, feed, *getters))
+    # Wake up when the loop records the tick to decision latency
+    decided = asyncio.Event()
+    record = feed.latency.record
+    def recorded(update):
+        decided.set()
+        return record(update)
+    feed.latency.record = recorded
+    # Let the loop subscribe before publishing
+    loop.run_until_complete(asyncio.sleep(0))
+
+    def run():
+        decided.clear()
+        feed.publish(api.get_order_book(market.name))
+        loop.run_until_complete(asyncio.wait([task, loop.create_task(decided.wait())],
+                                             return_when=asyncio.FIRST_COMPLETED))
+        if task.done():
+            task.result()
+
+    def close():
+        task.cancel()
+        loop.run_until_complete(asyncio.gather(task, return_exceptions=True))
+        loop.close()
+        core.trade = STRATEGY_TRADE
+
+    for _ in range(core.CONFIG['min_history_points']):
+        feed.publish(api.get_order_book(market.name))
+        loop.run_until_complete(asyncio.sleep(0))
+    run()
+    return run, SimpleNamespace(api=api, close=close)
+
+
+def measure(func) -> float:
+    """Best seconds per call over REPEAT batches of at least MIN_BATCH."""
+    number = 1
+    while True:
+        before = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - before
+        if elapsed >= MIN_BATCH:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(REPEAT - 1):
+        before = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - before) / number)
+    return best
+
+def run_case(setup, params) -> dict:
+    tracemalloc.start()
+    func, state = setup(**params)
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    seconds = measure(func)
+    # Cases with background work clean it up
+    if hasattr(state, 'close'):
+        state.close()
+    return {'us': round(seconds * 1e6, 3), 'per_second': round(1 / seconds, 1),
+            'held_kb': round(held / 1024, 1), 'peak_kb': round(max(peak, 0) / 1024, 1)}
+
+def main():
+    arguments = docopt(__doc__)
+    baseline_path = arguments['--baseline'] or os.path.join(ROOT, 'benchmarks', 'baseline.json')
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+    tolerance = float(arguments['--tolerance'])
+    results, regressions = {}, []
+    print("{:<50} {:>12} {:>12} {:>10} {:>10} {:>8}".format(
+        "case", "us/call", "calls/s", "held kB", "peak kB", "change"))
+    for name, setup, params in CASES:
+        if arguments['--filter'] and arguments['--filter'] not in name:
+            continue
+        result = results[name] = run_case(setup, params)
+        change = ''
+        if name in baseline:
+            ratio = result['us'] / baseline[name]['us'] - 1
+            change = '{:+.0%}'.format(ratio)
+            if ratio > tolerance:
+                regressions.append(name)
+                change += ' !'
+        print("{:<50} {:>12.2f} {:>12.0f} {:>10.0f} {:>10.1f} {:>8}".format(
+            name, result['us'], result['per_second'], result['held_kb'], result['peak_kb'], change))
+    if arguments['--save']:
+        baseline.update(results)
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=1, sort_keys=True)
+            baseline_file.write('\n')
+        print("Saved baseline to {}".format(baseline_path))
+    elif regressions:
+        print("{} cases slower than the baseline by more than {:.0%}:".format(len(regressions), tolerance))
+        print('\n'.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Synthetic market data shaped like the Nash API objects, for offline runs."""
+
+import numpy as np
+from types import SimpleNamespace
+
+
+def make_level(price: float, amount: float):
+    return SimpleNamespace(price=SimpleNamespace(amount="{:.8f}".format(price)),
+                           amount=SimpleNamespace(amount="{:.8f}".format(amount)))
+
+def make_orderbook(mid: float = 150.0, depth: int = 25, update_id: int = 0,
+                   tick: float = 0.01, rng=np.random):
+    """Build an order book with depth levels on each side around mid.
+    Bids are sorted ascending like the API returns them.
+    """
+    asks = [make_level(mid + tick * (idx + 1), rng.uniform(0.1, 10)) for idx in range(depth)]
+    bids = [make_level(mid - tick * (idx + 1), rng.uniform(0.1, 10)) for idx in range(depth)][::-1]
+    return SimpleNamespace(asks=asks, bids=bids, update_id=update_id)
+
+def orderbook_stream(count: int, mid: float = 150.0, depth: int = 25, seed: int = 0):
+    """Yield count order books following a random walk midprice."""
+    rng = np.random.RandomState(seed)
+    for update_id in range(count):
+        mid += rng.normal(0, 0.01)
+        yield make_orderbook(mid, depth, update_id, rng=rng)
+
+def delta_stream(count: int, mid: float = 150.0, depth: int = 25, changes: int = 2,
+                 tick: float = 0.01, seed: int = 0):
+    """An order book and count BookDeltas following it, each changing a few
+    levels: most modify an amount, some add a level past the book or remove one.
+    """
+    from makerbot.book import BookDelta
+    from makerbot.fixed import to_fixed
+    rng = np.random.RandomState(seed)
+    orderbook = make_orderbook(mid, depth, 0, tick, rng)
+    fixed = lambda value: to_fixed("{:.8f}".format(value))
+    deltas = []
+    for update_id in range(1, count + 1):
+        sides = ([], [])
+        for _ in range(changes):
+            side, level = rng.randint(2), rng.randint(depth + 2)
+            price = mid + tick * (level + 1) if side == 0 else mid - tick * (level + 1)
+            amount = 0 if rng.random_sample() < 0.2 else fixed(rng.uniform(0.1, 10))
+            sides[side].append((fixed(price), amount))
+        deltas.append(BookDelta(update_id, tuple(sides[0]), tuple(sides[1])))
+    return orderbook, deltas
+
+def make_api_order(id: int, buy_or_sell: str = 'BUY', price: float = 150.0,
+                   amount: float = 1.0, amount_remaining: float = None, status: str = 'OPEN'):
+    """Order shaped like the list_account_orders entries."""
+    currency = lambda value: SimpleNamespace(amount="{:.8f}".format(value))
+    return SimpleNamespace(id=str(id), buy_or_sell=buy_or_sell, limit_price=currency(price),
+                           amount=currency(amount),
+                           amount_remaining=currency(amount if amount_remaining is None else amount_remaining),
+                           type='LIMIT', cancellation_policy='GOOD_TIL_CANCELLED',
+                           placed_at="2019-12-12T00:00:{:09.6f}Z".format(id % 60), status=status)
+
+def make_api_orders(count: int, seed: int = 0):
+    rng = np.random.RandomState(seed)
+    return [make_api_order(idx, rng.choice(['BUY', 'SELL']), rng.uniform(140, 160), rng.uniform(0.1, 2),
+                           status=rng.choice(['OPEN', 'PENDING', 'FILLED']))
+            for idx in range(count)]
+
+def make_series(count: int, mid: float = 150.0, depth: int = 25, tick: float = 0.01,
+                interval_ms: float = 100, seed: int = 0, float_type=np.float64):
+    """OrderBookSeries of count snapshots following a random walk midprice,
+    built directly as arrays like a recording.
+    """
+    from makerbot.helpers import OrderBookSeries, obs_dtype
+    rng = np.random.RandomState(seed)
+    steps = rng.exponential(interval_ms * 1e6, count).astype(np.int64)
+    t = (np.datetime64('2019-12-12T00:00:00', 'ns') + np.cumsum(steps).astype('timedelta64[ns]'))
+    mids = np.round((mid + np.cumsum(rng.normal(0, tick, count))) / tick) * tick
+    levels = tick * (np.arange(depth) + 1)
+    data = np.empty((count, depth), dtype=obs_dtype(float_type))
+    data['Pask'] = mids[:, None] + levels
+    data['Pbid'] = mids[:, None] - levels
+    data['Qask'] = rng.uniform(0.1, 10, (count, depth))
+    data['Qbid'] = rng.uniform(0.1, 10, (count, depth))
+    return OrderBookSeries(t, data)
+
+def write_recording(root: str, market: str, series, segment_size: int = 100000):
+    """Store a OrderBookSeries in the segment layout of OrderBookRecorder."""
+    import os
+    import json
+    from makerbot.recorder import SEGMENT_NAME
+    path = os.path.join(root, market)
+    os.makedirs(path, exist_ok=True)
+    for idx in range(0, len(series.t), segment_size):
+        t, data = series.t[idx:idx + segment_size], series.data[idx:idx + segment_size]
+        name = os.path.join(path, SEGMENT_NAME.format(int(t[0].astype(np.int64))))
+        with open(name + '.json', 'w') as meta:
+            json.dump({'depth': data.shape[1], 'dtype': data.dtype.descr}, meta)
+        t.astype(np.int64).tofile(name + '.t')
+        data.tofile(name + '.obs')
+
+class FakeApi:
+    """Offline stand-in for NashApi: random walk order books, orders are
+    accepted and listed but never filled, the balance never runs out.
+    open_orders seeds the account with that many resting orders.
+    """
+
+    def __init__(self, market: str = 'eth_usdc', mid: float = 150.0, depth: int = 25,
+                 open_orders: int = 0, balance: float = 1e6, seed: int = 0):
+        self.market = market
+        self.depth = depth
+        self.balance = balance
+        self.orders = {order.id: order for order in make_api_orders(open_orders, seed)}
+        for order in self.orders.values():
+            order.status = 'OPEN'
+        self._books = orderbook_stream(10 ** 12, mid, depth, seed)
+        self._next_id = open_orders
+
+    def login(self, *args):
+        pass
+
+    def get_market(self, name):
+        return SimpleNamespace(name=name, a_unit=name.split('_')[0], b_unit=name.split('_')[1],
+                               min_trade_size='0.001', min_trade_size_b='1',
+                               min_trade_increment='0.00001', min_trade_increment_b='0.01')
+
+    def get_order_book(self, name):
+        return next(self._books)
+
+    def get_account_balance(self, currency):
+        return SimpleNamespace(available=SimpleNamespace(amount="{:.8f}".format(self.balance)))
+
+    def list_account_orders(self, name, status=None, range_start=None):
+        orders = [order for order in self.orders.values() if status is None or order.status in status]
+        return SimpleNamespace(orders=orders)
+
+    def place_limit_order(self, name, amount, buy_or_sell, cancellation_policy, price, allow_taker):
+        self._next_id += 1
+        order = make_api_order(self._next_id, buy_or_sell, float(price), float(amount.amount))
+        self.orders[order.id] = order
+        return order
+
+    def cancel_order(self, order_id, name):
+        if order_id in self.orders:
+            self.orders[order_id].status = 'CANCELLED'
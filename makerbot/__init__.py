@@ -1,8 +1,37 @@
 # -*- coding: utf-8 -*-
 
-"""Top-level package for makerbot."""
+"""Top-level package for makerbot.
+
+The names below are imported from their module on first use, so importing
+e.g. makerbot.helpers or makerbot.fixed doesn't load the trading loop and
+its dependencies.
+"""
+
+import importlib
 
 __author__ = """Nash"""
+__version__ = "0.1.5"
+
+# Public name -> module defining it
+_EXPORTS = {'main': 'core',
+            'Order': 'helpers', 'OrderBookSeries': 'helpers', 'OrderBookRing': 'helpers',
+            'get_config': 'helpers',
+            'MarketMetrics': 'metrics',
+            'OrderBookFeed': 'feed', 'MarketPoller': 'feed',
+            'RequestScheduler': 'scheduler', 'TokenBucket': 'scheduler',
+            'OrderTracker': 'orders', 'Ledger': 'ledger',
+            'SimulatorApi': 'simulator'}
+
+__all__ = ['__version__'] + list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    # Later lookups don't come back here
+    globals()[name] = value
+    return value
 
-from .core import main, __version__
-from .helpers import Order, OrderBookSeries, retry, get_config
\ No newline at end of file
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
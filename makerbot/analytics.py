@@ -0,0 +1,308 @@
+import math
+import numpy as np
+from typing import NamedTuple
+from .helpers import RingBuffer
+
+# Columns computed for every snapshot:
+# I       imbalance of the top levels, weighted by decay ** level
+# Pmicro  microprice of the top prices at that imbalance
+# spread  best ask minus best bid
+# ret     log return of the midprice since the previous snapshot
+# ofi     order flow imbalance at the top of the book, sizes joining the
+#         bid or leaving the ask minus the opposite, see Cont et al. 2014
+# vol     realized volatility per sqrt(second) over the last window returns
+# spread_mean, spread_std  rolling mean and sample deviation of the spread
+ANALYTICS_DTYPE = [('I', 'f8'), ('Pmicro', 'f8'), ('spread', 'f8'), ('ret', 'f8'), ('ofi', 'f8'),
+                   ('vol', 'f8'), ('spread_mean', 'f8'), ('spread_std', 'f8')]
+ANALYTICS_COLUMNS = frozenset(name for name, _ in ANALYTICS_DTYPE)
+# Rebuild the running sums from the window every this many appends, like MarketMetrics
+RESYNC_INTERVAL = 4096
+
+
+def depth_weights(levels: int, decay: float) -> np.ndarray:
+    return decay ** np.arange(levels, dtype=np.float64)
+
+
+def _columns(data: np.ndarray, levels: int):
+    """float64 Pask, Qask, Pbid, Qbid arrays of the top levels of snapshot rows."""
+    return tuple(data[field][..., :levels].astype(np.float64) for field in ('Pask', 'Qask', 'Pbid', 'Qbid'))
+
+
+def depth_imbalance(data: np.ndarray, levels: int = 5, decay: float = 0.5) -> np.ndarray:
+    """Bid share of the sizes of the top levels of snapshot rows, missing
+    levels count as empty. levels 1 is the top of book imbalance.
+    """
+    _, qask, _, qbid = _columns(data, levels)
+    weights = depth_weights(qask.shape[-1], decay)
+    # fmax drops the NaNs of missing levels, sizes are never negative
+    bids = np.fmax(qbid, 0.0) @ weights
+    total = bids + np.fmax(qask, 0.0) @ weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, bids / total, np.nan)
+
+
+def depth_microprice(data: np.ndarray, levels: int = 5, decay: float = 0.5) -> np.ndarray:
+    """Best ask and bid weighted by depth_imbalance, the top of book
+    microprice of get_obs_dataframe with levels 1.
+    """
+    imbalance = depth_imbalance(data, levels, decay)
+    pask, pbid = data['Pask'][..., 0].astype(np.float64), data['Pbid'][..., 0].astype(np.float64)
+    return pask * imbalance + pbid * (1 - imbalance)
+
+
+def order_flow_imbalance(data: np.ndarray) -> np.ndarray:
+    """ofi column of snapshot rows, NaN for the first one."""
+    pask, qask, pbid, qbid = (column[:, 0] for column in _columns(data, 1))
+    ofi = np.full(len(data), np.nan)
+    ofi[1:] = ((pbid[1:] >= pbid[:-1]) * qbid[1:] - (pbid[1:] <= pbid[:-1]) * qbid[:-1]
+               - (pask[1:] <= pask[:-1]) * qask[1:] + (pask[1:] >= pask[:-1]) * qask[:-1])
+    return ofi
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sums of the last window values, NaN while fewer or one is NaN."""
+    nans = np.concatenate([[0], np.cumsum(np.isnan(values))])
+    sums = np.concatenate([[0.0], np.cumsum(np.nan_to_num(values))])
+    rolled = np.full(len(values), np.nan)
+    if len(values) >= window:
+        rolled[window - 1:] = np.where(nans[window:] == nans[:-window], sums[window:] - sums[:-window], np.nan)
+    return rolled
+
+
+def analyze(obs, levels: int = 5, decay: float = 0.5, window: int = 100) -> np.ndarray:
+    """Analytics of every snapshot of an OrderBookSeries in one vectorized
+    pass, an array of ANALYTICS_DTYPE rows. The rolling columns are NaN
+    until window snapshots are in, like pandas.
+    """
+    rows = np.empty(len(obs.t), dtype=ANALYTICS_DTYPE)
+    pask, _, pbid, _ = (column[:, 0] for column in _columns(obs.data, 1))
+    rows['I'] = depth_imbalance(obs.data, levels, decay)
+    rows['Pmicro'] = pask * rows['I'] + pbid * (1 - rows['I'])
+    rows['spread'] = spread = pask - pbid
+    rows['ret'] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rows['ret'][1:] = np.diff(np.log((pask + pbid) / 2.0))
+    rows['ofi'] = order_flow_imbalance(obs.data)
+    # Returns of the window span from the snapshot before it
+    rows['vol'] = np.nan
+    if len(rows) > window:
+        elapsed = (obs.t[window:] - obs.t[:-window]).astype(np.int64) / 1e9
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rows['vol'][window:] = np.sqrt(_rolling_sum(rows['ret'] ** 2, window)[window:] / elapsed)
+    # Relative to an anchor to avoid cancellation
+    finite = spread[~np.isnan(spread)]
+    deviation = spread - (finite[0] if len(finite) else 0.0)
+    mean = _rolling_sum(deviation, window) / window
+    squares = _rolling_sum(deviation * deviation, window)
+    rows['spread_mean'] = mean + (finite[0] if len(finite) else 0.0)
+    with np.errstate(invalid='ignore'):
+        rows['spread_std'] = np.sqrt(np.maximum(squares - window * mean * mean, 0.0) / (window - 1)) if window > 1 else np.nan
+    return rows
+
+
+class SpreadStats(NamedTuple):
+    """Statistics of the spread over snapshots, relative is the mean spread
+    in basis points of the midprice.
+    """
+    mean: float
+    std: float
+    median: float
+    min: float
+    max: float
+    relative: float
+
+
+def spread_stats(data: np.ndarray) -> SpreadStats:
+    """Spread statistics of snapshot rows, one sided books are left out."""
+    pask, _, pbid, _ = (column[:, 0] for column in _columns(data, 1))
+    spread = pask - pbid
+    valid = ~np.isnan(spread)
+    if not valid.any():
+        return SpreadStats(*[np.nan] * 6)
+    spread, mid = spread[valid], (pask[valid] + pbid[valid]) / 2.0
+    std = float(spread.std(ddof=1)) if len(spread) > 1 else np.nan
+    return SpreadStats(float(spread.mean()), std, float(np.median(spread)), float(spread.min()),
+                       float(spread.max()), float((spread / mid).mean() * 1e4))
+
+
+class Intensity(NamedTuple):
+    """Arrival rate of the orders filling a quote at a distance from the
+    midprice, fitted as A * exp(-k * distance) per second.
+    distances and rates are the measured points the fit is made on.
+    """
+    A: float
+    k: float
+    distances: np.ndarray
+    rates: np.ndarray
+
+    def rate(self, distance: float) -> float:
+        """Fills per second expected at distance from the midprice."""
+        return self.A * np.exp(-self.k * distance)
+
+
+def _hits(pask, pbid, mid, distances) -> np.ndarray:
+    """Times a quote at each distance from the previous midprice was crossed,
+    buys by the best ask coming down to it and sells by the best bid up to it.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    buys = pask[1:, None] <= mid[:-1, None] - distances
+    sells = pbid[1:, None] >= mid[:-1, None] + distances
+    return buys.sum(axis=0) + sells.sum(axis=0)
+
+
+def _fit(distances, hits, seconds: float) -> Intensity:
+    distances = np.asarray(distances, dtype=np.float64)
+    # A quote on each side, the rate is per quote
+    rates = hits / 2.0 / seconds if seconds > 0 else np.zeros(len(distances))
+    positive = rates > 0
+    if positive.sum() < 2:
+        return Intensity(np.nan, np.nan, distances, rates)
+    slope, intercept = np.polyfit(distances[positive], np.log(rates[positive]), 1)
+    return Intensity(float(np.exp(intercept)), float(-slope), distances, rates)
+
+
+def arrival_intensity(obs, distances) -> Intensity:
+    """Fit the fill intensity of quotes at distances (in price) from the
+    midprice on the snapshots of an OrderBookSeries. Snapshots only show
+    the book moving through a quote, the rates are lower bounds.
+    """
+    pask, _, pbid, _ = (column[:, 0] for column in _columns(obs.data, 1))
+    seconds = (obs.t[-1] - obs.t[0]).astype(np.int64) / 1e9 if len(obs.t) else 0.0
+    return _fit(distances, _hits(pask, pbid, (pask + pbid) / 2.0, distances), seconds)
+
+
+class StreamingAnalytics:
+    """The analyze() columns updated in O(levels) for every new snapshot,
+    reading the same values as analyze() on the series seen so far.
+    The arrival intensity counts every snapshot since the start.
+    """
+
+    def __init__(self, max_obs_size: int, levels: int = 5, decay: float = 0.5, window: int = 100,
+                 distances = ()):
+        if window > max_obs_size:
+            raise Exception("Analytics window can't be larger than max_obs_size.")
+        self.levels = levels
+        self.decay = decay
+        self.window = window
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self._weights = depth_weights(levels, decay)
+        self._t = RingBuffer(max_obs_size + 1, "datetime64[ns]")
+        self._rows = RingBuffer(max_obs_size, ANALYTICS_DTYPE)
+        self._last = None
+        self._first_t = None
+        self._hits = np.zeros(len(self.distances), dtype=np.int64)
+        # Window sums of the squared returns and of the spread relative to
+        # an anchor to avoid cancellation, each with its count of NaNs
+        self._anchor = None
+        self._sums = [0.0, 0.0, 0.0]
+        self._nans = [0, 0]
+
+    def from_series(obs, max_obs_size: int = None, **settings):
+        """Build analytics for all the snapshots already in a OrderBookSeries."""
+        analytics = StreamingAnalytics(max_obs_size or max(len(obs.t), settings.get('window', 100)), **settings)
+        for t, snapshot in zip(obs.t, obs.data):
+            analytics.append(t, snapshot)
+        return analytics
+
+    def __len__(self):
+        return len(self._rows)
+
+    def update(self, obs):
+        """Add the latest snapshot of the OrderBookSeries."""
+        self.append(obs.t[-1], obs.data[-1])
+        return self
+
+    def _slide(self, ret: float, spread: float, sign: int):
+        sums, nans = self._sums, self._nans
+        if ret != ret:
+            nans[0] += sign
+        else:
+            sums[0] += sign * ret * ret
+        if spread != spread:
+            nans[1] += sign
+        else:
+            if self._anchor is None:
+                self._anchor = spread
+            spread -= self._anchor
+            sums[1] += sign * spread
+            sums[2] += sign * spread * spread
+
+    def append(self, t, snapshot):
+        levels, weights = self.levels, self._weights
+        qask = snapshot['Qask'][:levels].astype(np.float64)
+        qbid = snapshot['Qbid'][:levels].astype(np.float64)
+        # fmax drops the NaNs of missing levels, sizes are never negative
+        bids = float(np.fmax(qbid, 0.0) @ weights[:len(qbid)])
+        total = bids + float(np.fmax(qask, 0.0) @ weights[:len(qask)])
+        imbalance = bids / total if total > 0 else np.nan
+        pask, pbid = float(snapshot['Pask'][0]), float(snapshot['Pbid'][0])
+        top_qask, top_qbid = float(qask[0]), float(qbid[0])
+        spread = pask - pbid
+        mid = (pask + pbid) / 2.0
+        ret = ofi = np.nan
+        if self._last is not None:
+            last_ask, last_qask, last_bid, last_qbid, last_mid = self._last
+            if mid > 0 and last_mid > 0:
+                ret = math.log(mid / last_mid)
+            ofi = ((pbid >= last_bid) * top_qbid - (pbid <= last_bid) * last_qbid
+                   - (pask <= last_ask) * top_qask + (pask >= last_ask) * last_qask)
+            if len(self.distances):
+                self._hits += (pask <= last_mid - self.distances)
+                self._hits += (pbid >= last_mid + self.distances)
+        self._last = pask, top_qask, pbid, top_qbid, mid
+        if self._first_t is None:
+            self._first_t = t
+
+        # Slide the window, the leaving row is still in the buffer
+        rows, window = self._rows.view(), self.window
+        if len(rows) >= window:
+            leaving = rows[-window]
+            self._slide(float(leaving['ret']), float(leaving['spread']), -1)
+        self._slide(ret, spread, 1)
+        full = len(rows) + 1 >= window
+        self._t.append(t)
+        times = self._t.view()
+        vol = mean = std = np.nan
+        if full and not self._nans[0] and len(times) > window:
+            elapsed = (times[-1] - times[-1 - window]).astype(np.int64) / 1e9
+            vol = math.sqrt(max(self._sums[0], 0.0) / elapsed) if elapsed > 0 else np.nan
+        if full and not self._nans[1]:
+            deviation = self._sums[1] / window
+            mean = self._anchor + deviation
+            if window > 1:
+                std = math.sqrt(max(self._sums[2] - window * deviation * deviation, 0.0) / (window - 1))
+        self._rows.append((imbalance, pask * imbalance + pbid * (1 - imbalance), spread, ret, ofi,
+                           vol, mean, std))
+        if not self._rows._count % RESYNC_INTERVAL:
+            self._resync()
+        return self
+
+    def _resync(self):
+        rows = self._rows.view()[-self.window:]
+        rets, spreads = rows['ret'], rows['spread']
+        finite = spreads[~np.isnan(spreads)]
+        self._anchor = float(finite.mean()) if len(finite) else None
+        finite = finite - (self._anchor or 0.0)
+        self._sums = [float(np.nansum(rets * rets)), float(finite.sum()), float((finite * finite).sum())]
+        self._nans = [int(np.isnan(rets).sum()), len(spreads) - len(finite)]
+
+    @property
+    def t(self) -> np.ndarray:
+        return self._t.view()[-len(self._rows):]
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows.view()
+
+    def __getattr__(self, name):
+        # Column views, e.g. analytics.Pmicro or analytics.vol
+        if name in ANALYTICS_COLUMNS:
+            return self._rows.view()[name]
+        raise AttributeError(name)
+
+    def intensity(self) -> Intensity:
+        """Fill intensity fitted on every snapshot so far, see arrival_intensity."""
+        if self._first_t is None:
+            return _fit(self.distances, self._hits, 0.0)
+        seconds = (self._t.view()[-1] - self._first_t).astype(np.int64) / 1e9
+        return _fit(self.distances, self._hits, seconds)
@@ -0,0 +1,386 @@
+import time
+import heapq
+import logging
+import numpy as np
+from decimal import Decimal
+from typing import NamedTuple
+from types import SimpleNamespace
+from contextlib import contextmanager
+from concurrent.futures import Future
+from . import core
+from .helpers import OrderBookSeries
+from .fixed import to_fixed, to_float
+from .orders import OrderTracker
+from .strategy import FeatureCache, load_strategy
+from .scheduler import RequestScheduler
+
+# The number of ticks scanned at once when looking for the next event
+SCAN_CHUNK = 4096
+# Margin kept on float comparisons so rounding can only cause extra decisions
+EPSILON = 1e-9
+
+
+class Fill(NamedTuple):
+    t: np.datetime64
+    id: str
+    buy_or_sell: str
+    price: Decimal
+    amount: Decimal
+
+
+class BacktestResult(NamedTuple):
+    """Outcome of a replay. pnl is the change in quote currency value with the
+    base inventory marked to the last midprice, halted is set when the
+    strategy stopped trading on an exception like the max drop guard.
+    placed counts the orders the simulated exchange accepted.
+    """
+    ticks: int
+    decisions: int
+    fills: list
+    quote: Decimal
+    base: Decimal
+    pnl: Decimal
+    elapsed: float
+    halted: str = None
+    placed: int = 0
+
+    @property
+    def ticks_per_second(self) -> float:
+        return self.ticks / self.elapsed if self.elapsed else float('inf')
+
+
+def market_info(config, name: str = None):
+    """Market object like NashApi.get_market built from the sim_* settings."""
+    name = name or config['market']
+    return SimpleNamespace(name=name,
+                           a_unit=name.split('_')[0],
+                           b_unit=name.split('_')[1],
+                           min_trade_size=config['sim_min_trade_size'],
+                           min_trade_size_b=config['sim_min_trade_size_b'],
+                           min_trade_increment=config['sim_min_trade_increment'],
+                           min_trade_increment_b=config['sim_min_trade_increment_b'])
+
+def first_true(mask_fn, start: int, stop: int) -> int:
+    """First index in [start, stop) where mask_fn(lo, hi) is set, or stop.
+    mask_fn returns a boolean array for the ticks lo:hi.
+    """
+    chunk = SCAN_CHUNK
+    while start < stop:
+        hi = min(start + chunk, stop)
+        hits = np.flatnonzero(mask_fn(start, hi))
+        if len(hits):
+            return start + int(hits[0])
+        start, chunk = hi, chunk * 2
+    return stop
+
+
+class InlineExecutor:
+    """Runs submitted calls right away, keeps replays single threaded and deterministic."""
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as exception:
+            future.set_exception(exception)
+        return future
+
+
+class SimulatedBroker:
+    """Stands in for NashApi during a replay.
+
+    Limit orders rest until the book trades through their price, a buy
+    fills when the best ask drops to its price and a sell when the best bid
+    reaches it. They fill completely at their own price, at the earliest on
+    the tick after they are placed. Orders without the funds to back them
+    are rejected like the exchange would.
+    """
+
+    def __init__(self, quote: Decimal, base: Decimal = Decimal(0)):
+        self.quote = Decimal(quote)
+        self.base = Decimal(base)
+        self.reserved = Decimal(0)
+        self.reserved_base = Decimal(0)
+        self.tick = 0
+        self.orders = {}
+        self.rejected = set()
+        self._next_id = 1
+        # (tick, id) of the scheduled fills and orders not crossing this segment
+        self._fills = []
+        self._unscheduled = set()
+        self._Pask = self._Pbid = np.zeros(0)
+
+    def load(self, Pask: np.ndarray, Pbid: np.ndarray, start: int):
+        """Switch to the top of book of a new segment, ticks from start are new."""
+        self._Pask, self._Pbid = Pask, Pbid
+        self._fills = []
+        pending = self._unscheduled | set(self.orders)
+        self._unscheduled = set()
+        for order_id in pending:
+            if order_id in self.orders:
+                self._schedule(order_id, start)
+
+    def _schedule(self, order_id: str, start: int):
+        side, price, _ = self.orders[order_id]
+        if side == 'BUY':
+            tick = first_true(lambda lo, hi: self._Pask[lo:hi] <= price, start, len(self._Pask))
+        else:
+            tick = first_true(lambda lo, hi: self._Pbid[lo:hi] >= price, start, len(self._Pbid))
+        if tick < len(self._Pask):
+            heapq.heappush(self._fills, (tick, order_id))
+        else:
+            self._unscheduled.add(order_id)
+
+    def next_fill(self) -> int:
+        while self._fills and self._fills[0][1] not in self.orders:
+            heapq.heappop(self._fills)
+        return self._fills[0][0] if self._fills else len(self._Pask)
+
+    def fill_until(self, tick: int) -> list:
+        """Fill the orders crossed up to tick, return their (id, side, price, amount)."""
+        filled = []
+        while self._fills and self._fills[0][0] <= tick:
+            _, order_id = heapq.heappop(self._fills)
+            if order_id not in self.orders:
+                continue
+            side, price, amount = self.orders.pop(order_id)
+            price, amount = Decimal(str(price)), Decimal(amount)
+            if side == 'BUY':
+                self.reserved -= price * amount
+                self.quote -= price * amount
+                self.base += amount
+            else:
+                self.reserved_base -= amount
+                self.base -= amount
+                self.quote += price * amount
+            filled.append((order_id, side, price, amount))
+        return filled
+
+    def available(self) -> Decimal:
+        return self.quote - self.reserved
+
+    @property
+    def placed(self) -> int:
+        return self._next_id - 1 - len(self.rejected)
+
+    def place_limit_order(self, market_name, amount, buy_or_sell, cancellation_policy, price, allow_taker):
+        order_id = str(self._next_id)
+        self._next_id += 1
+        quantity = Decimal(amount.amount)
+        if buy_or_sell == 'BUY':
+            funds = Decimal(price) * quantity
+            if funds > self.available():
+                self.rejected.add(order_id)
+                return SimpleNamespace(id=order_id)
+            self.reserved += funds
+        else:
+            if quantity > self.base - self.reserved_base:
+                self.rejected.add(order_id)
+                return SimpleNamespace(id=order_id)
+            self.reserved_base += quantity
+        self.orders[order_id] = (buy_or_sell, float(price), amount.amount)
+        self._schedule(order_id, self.tick + 1)
+        return SimpleNamespace(id=order_id)
+
+    def cancel_order(self, order_id, market_name):
+        order = self.orders.pop(order_id, None)
+        if order and order[0] == 'BUY':
+            self.reserved -= Decimal(str(order[1])) * Decimal(order[2])
+        elif order:
+            self.reserved_base -= Decimal(order[2])
+
+
+class TopOfBook(NamedTuple):
+    """Metrics columns the strategy reads, sliced up to the decision tick."""
+    Pask: np.ndarray
+    Pbid: np.ndarray
+    Pmicro: np.ndarray
+
+
+@contextmanager
+def strategy_context(config, broker: SimulatedBroker):
+    """Point the module level state of core to the replay."""
+    saved = {name: getattr(core, name, None) for name in ('CONFIG', 'api', 'logger', 'io_pool', 'scheduler', 'journal')}
+    logger = logging.getLogger('pymaker.backtest')
+    logger.setLevel(logging.WARNING)
+    core.CONFIG, core.api, core.logger, core.io_pool = config, broker, logger, InlineExecutor()
+    core.journal = None
+    # Simulated time, no rate limit and no retries
+    core.scheduler = RequestScheduler(None, deadline = 0)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(core, name, value)
+
+
+class Backtest:
+    """Replays recorded order book series through core.trade.
+
+    The clock is the recorded timestamps, pauses returned by trade() skip
+    ticks. Unless exact is set, ticks where the built in strategy can't act
+    are skipped without calling it: nothing changes until an order fills,
+    the market may be buying or the buy order stops being the top bid.
+    Set exact when trade() is customised, it is forced with a strategy or
+    max_loss setting.
+    """
+
+    def __init__(self, market, config, quote: Decimal = Decimal(1000),
+                 base: Decimal = Decimal(0), exact: bool = False):
+        self.market = market
+        self.config = config
+        self.strategy = load_strategy(config['strategy']) if config.get('strategy') else None
+        # The loss moves on every tick, not only when the strategy can act
+        self.exact = exact or self.strategy is not None or bool(config.get('max_loss'))
+        self.features = FeatureCache()
+        self.broker = SimulatedBroker(quote, base)
+        self.orders = OrderTracker()
+        self.fills = []
+        self.ticks = 0
+        self.decisions = 0
+        self._resume = None
+        # Last rows of the previous segment to keep windows continuous
+        self._tail = None
+
+    def _load(self, obs: OrderBookSeries):
+        """Build top of book and strategy masks for a segment plus carried rows."""
+        size = self.config['max_obs_size']
+        tail = self._tail or OrderBookSeries(obs.t[:0], obs.data[:0])
+        self._seg, self._off = obs, len(tail.t)
+        self._tail_data = tail.data
+        column = lambda field, level=0: np.concatenate([tail.data[field][:, level], obs.data[field][:, level]]).astype(np.float64)
+        self.t = np.concatenate([tail.t, obs.t])
+        Pask, Qask, Pbid, Qbid = column('Pask'), column('Qask'), column('Pbid'), column('Qbid')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            imbalance = Qbid / (Qbid + Qask)
+            self.Pmicro = Pask * imbalance + Pbid * (1 - imbalance)
+            # Imbalance of the top 2 levels as in is_buying
+            Qa = (Qask + column('Qask', 1)) / 2 if obs.data.shape[1] > 1 else Qask
+            Qb = (Qbid + column('Qbid', 1)) / 2 if obs.data.shape[1] > 1 else Qbid
+            top2 = Qb / (Qb + Qa)
+        self.Pask, self.Pbid = Pask, Pbid
+
+        # is_buying is a median > 0.5 over 10s, it can only hold when at
+        # least half of the window is above 0.5 and nothing is NaN
+        idx = np.arange(len(self.t))
+        start = np.searchsorted(self.t, self.t - np.timedelta64(10, 's'), side='right')
+        above = np.concatenate([[0], np.cumsum(top2 > 0.5 - EPSILON)])
+        nans = np.concatenate([[0], np.cumsum(np.isnan(top2))])
+        maybe_buying = ((nans[idx + 1] - nans[start]) == 0) & (2 * (above[idx + 1] - above[start]) >= idx - start + 1)
+        # should_place_buy raises below the max drop price, that has to be seen
+        config = self.config
+        min_price = to_float(config['stable_price'] * (100 - config['max_drop_percentage']) // 100)
+        with np.errstate(invalid='ignore'):
+            maybe_buying |= (Pask + Pbid) / 2.0 < min_price + EPSILON
+        self.maybe_buying = maybe_buying
+        self._maybe_idx = np.flatnonzero(maybe_buying)
+
+        self.broker.load(Pask, Pbid, self._off)
+        self._tail = OrderBookSeries(self.t[-size:], np.concatenate([tail.data, obs.data[-size:]])[-size:])
+
+    def _obs_at(self, tick: int) -> OrderBookSeries:
+        """OrderBookSeries of the max_obs_size snapshots up to tick, copying only across segments."""
+        lo = max(0, tick + 1 - self.config['max_obs_size'])
+        t = self.t[lo:tick + 1]
+        if lo >= self._off:
+            return OrderBookSeries(t, self._seg.data[lo - self._off:tick + 1 - self._off])
+        data = np.concatenate([self._tail_data[lo:], self._seg.data[:max(0, tick + 1 - self._off)]])
+        return OrderBookSeries(t, data)
+
+    def _next_maybe_buying(self, tick: int) -> int:
+        pos = np.searchsorted(self._maybe_idx, tick)
+        return int(self._maybe_idx[pos]) if pos < len(self._maybe_idx) else len(self.t)
+
+    def _next_decision(self, tick: int) -> int:
+        """First tick from tick on where trade() may act or pause."""
+        if self.exact:
+            return tick
+        orders = self.orders
+        max_amount = min(core.get_max_order_funds(orders), to_fixed(self.broker.available()))
+        if max_amount < to_fixed(self.market.min_trade_size_b):
+            return tick
+        low_sell, buy = orders.lowest_sell(), orders.last_buy()
+        if low_sell is None or buy is None or buy.amount - buy.amount_remaining > 0:
+            return self._next_maybe_buying(tick)
+        if not core.should_rebuy(low_sell, buy):
+            return len(self.t)
+        # Rebuys happen once the buy is neither the top bid nor within a straddle of the ask
+        price, straddle = to_float(buy.price), to_float(self.config['straddle'])
+        maybe = lambda lo, hi: self.maybe_buying[lo:hi] & ~(
+            (np.abs(self.Pbid[lo:hi] - price) < 1e-7 - EPSILON) |
+            (price > self.Pask[lo:hi] - straddle + EPSILON))
+        return first_true(maybe, tick, len(self.t))
+
+    def _apply_fills(self, tick: int):
+        for order_id, side, price, amount in self.broker.fill_until(tick):
+            self.fills.append(Fill(self.t[tick], order_id, side, price, amount))
+            order = self.orders.get(order_id)
+            if order is not None:
+                self.orders.upsert(order.replace(status = 'FILLED', amount_remaining = 0))
+
+    def _decide(self, tick: int):
+        self.broker.tick = tick
+        top = TopOfBook(self.Pask[:tick + 1], self.Pbid[:tick + 1], self.Pmicro[:tick + 1])
+        features = self.features.update(self.t[tick], self._obs_at(tick), top, self.market)
+        if not np.isnan(self.Pmicro[tick]):
+            self.orders.ledger.mark(features['microprice'])
+        _, pause = (self.strategy or core.trade)(self.market, features, self.orders, to_fixed(self.broker.available()))
+        # The exchange accepts or rejects our orders right away
+        for order in self.orders.by_status('PENDING'):
+            status = 'CANCELLED' if order.id in self.broker.rejected else 'OPEN'
+            self.orders.upsert(order.replace(status = status))
+        self.decisions += 1
+        if pause:
+            self._resume = self.t[tick] + np.timedelta64(int(pause * 1e9), 'ns')
+
+    def _run_segment(self):
+        stop = len(self.t)
+        # Wait for min_history_points snapshots like the bootstrap
+        tick = self._off + max(0, self.config['min_history_points'] - self.ticks)
+        while tick < stop:
+            if self._resume is not None:
+                tick = max(tick, int(np.searchsorted(self.t, self._resume)))
+            # Orders keep filling while the strategy pauses
+            self._apply_fills(tick - 1)
+            tick = min(self._next_decision(tick), self.broker.next_fill())
+            if tick >= stop:
+                break
+            self._apply_fills(tick)
+            self._decide(tick)
+            tick += 1
+        self._apply_fills(stop - 1)
+
+    def run(self, series) -> BacktestResult:
+        """Replay an iterable of OrderBookSeries, e.g. recorder.iter_recording."""
+        before = time.perf_counter()
+        halted = None
+        start_value = None
+        with strategy_context(self.config, self.broker):
+            for obs in series:
+                if not len(obs.t):
+                    continue
+                self._load(obs)
+                if start_value is None:
+                    start_value = self._value(self._off)
+                try:
+                    self._run_segment()
+                except Exception as exception:
+                    halted = str(exception)
+                    self.ticks += len(obs.t)
+                    break
+                self.ticks += len(obs.t)
+        pnl = self._value(len(self.t) - 1) - start_value if start_value is not None else Decimal(0)
+        return BacktestResult(self.ticks, self.decisions, self.fills, self.broker.quote,
+                              self.broker.base, pnl, time.perf_counter() - before, halted,
+                              self.broker.placed)
+
+    def _value(self, tick: int) -> Decimal:
+        mid = (self.Pask[tick] + self.Pbid[tick]) / 2.0
+        mid = Decimal(str(mid)) if np.isfinite(mid) else Decimal(0)
+        return self.broker.quote + self.broker.base * mid
+
+
+def run_backtest(series, market, config, quote: Decimal = Decimal(1000),
+                 base: Decimal = Decimal(0), exact: bool = False) -> BacktestResult:
+    """Replay order book series through the strategy, see Backtest."""
+    return Backtest(market, config, quote, base, exact).run(series)
@@ -0,0 +1,128 @@
+import numpy as np
+from typing import NamedTuple
+from .fixed import SCALE, to_fixed
+from .helpers import obs_dtype
+
+# Levels of a side as an (n, 2) int64 array of fixed point (key, amount)
+# rows sorted by key, best first. The key is the price for asks and the
+# negated price for bids, so both sides search and merge the same way.
+NO_LEVELS = np.zeros((0, 2), dtype=np.int64)
+# Deltas changing more levels of a side are merged in one vectorized pass
+MERGE_MIN = 16
+
+
+class BookDelta(NamedTuple):
+    """Levels of an order book that changed in update_id, the one after the
+    previous delta's. asks and bids are (price, amount) fixed point pairs,
+    a new price adds a level, a known one modifies it and amount 0 removes it.
+    """
+    update_id: int
+    asks: tuple = ()
+    bids: tuple = ()
+
+
+class BookTop(NamedTuple):
+    """Best levels of an L2Book at update_id, published by feeds in place of
+    API order books. asks and bids are (n, 2) fixed point (price, amount)
+    arrays, best first, OrderBookSeries stores them without parsing.
+    """
+    update_id: int
+    asks: np.ndarray
+    bids: np.ndarray
+
+    def to_snapshot(self, depth: int, float_type=np.longdouble) -> np.ndarray:
+        """Snapshot row of the top depth levels, like helpers.book_snapshot."""
+        # The row's fields are consecutive, filled as (depth, 4) floats
+        data = np.full((depth, 4), np.nan, dtype=float_type)
+        asks, bids = self.asks[:depth], self.bids[:depth]
+        # Divided in float64 at least, it rounds like parsing the strings
+        if float_type is np.longdouble:
+            asks, bids = asks.astype(np.longdouble), bids.astype(np.longdouble)
+        data[:len(asks), :2] = asks / SCALE
+        data[:len(bids), 2:] = bids / SCALE
+        return data.view(obs_dtype(float_type)).reshape(depth)
+
+
+def _side(levels, sign: int) -> np.ndarray:
+    """Side array of API levels."""
+    keys = np.array([(sign * to_fixed(level.price.amount), to_fixed(level.amount.amount)) for level in levels],
+                    dtype=np.int64).reshape(-1, 2)
+    return keys[np.argsort(keys[:, 0], kind='stable')]
+
+def _change(levels: np.ndarray, changes, sign: int) -> np.ndarray:
+    """Side array with the (price, amount) changes applied one by one."""
+    for price, amount in changes:
+        key = sign * price
+        idx = levels[:, 0].searchsorted(key)
+        if idx < len(levels) and levels[idx, 0] == key:
+            if amount:
+                levels[idx, 1] = amount
+            else:
+                levels = np.concatenate([levels[:idx], levels[idx + 1:]])
+        elif amount:
+            levels = np.concatenate([levels[:idx], [(key, amount)], levels[idx:]])
+    return levels
+
+def _merge(levels: np.ndarray, changes, sign: int) -> np.ndarray:
+    """Side array with the (price, amount) changes applied at once."""
+    changes = np.array(changes, dtype=np.int64).reshape(-1, 2)
+    # The last change of a price wins
+    keys, last = np.unique(sign * changes[::-1, 0], return_index=True)
+    amounts = changes[::-1, 1][last]
+    idx = np.searchsorted(levels[:, 0], keys)
+    found = idx < len(levels)
+    found[found] = levels[idx[found], 0] == keys[found]
+    levels[idx[found], 1] = amounts[found]
+    added = ~found & (amounts > 0)
+    if added.any():
+        levels = np.insert(levels, idx[added], np.column_stack([keys[added], amounts[added]]), axis=0)
+    if (amounts[found] == 0).any():
+        levels = levels[levels[:, 1] > 0]
+    return levels
+
+
+class L2Book:
+    """Level 2 order book of a market kept up to date from deltas.
+
+    load() takes a full API snapshot, apply() the delta of each following
+    update_id in O(log n) per changed level plus a copy when levels are
+    added or removed. A delta skipping update_ids is a gap, apply() refuses
+    it and the book has to be loaded from a new snapshot.
+    """
+
+    def __init__(self):
+        self.update_id = None
+        self.asks = self.bids = NO_LEVELS
+        self.resyncs = 0
+
+    def load(self, orderbook):
+        """Replace the book with an API order book, bids ascending."""
+        self.asks = _side(orderbook.asks, 1)
+        self.bids = _side(orderbook.bids, -1)
+        if self.update_id is not None:
+            self.resyncs += 1
+        self.update_id = orderbook.update_id
+
+    def apply(self, delta: BookDelta) -> bool:
+        """Apply the delta following the book, deltas it already has are
+        skipped. Returns False on a gap, before the first snapshot too.
+        """
+        if self.update_id is None or delta.update_id > self.update_id + 1:
+            return False
+        if delta.update_id <= self.update_id:
+            return True
+        if len(delta.asks):
+            self.asks = (_merge if len(delta.asks) >= MERGE_MIN else _change)(self.asks, delta.asks, 1)
+        if len(delta.bids):
+            self.bids = (_merge if len(delta.bids) >= MERGE_MIN else _change)(self.bids, delta.bids, -1)
+        self.update_id = delta.update_id
+        return True
+
+    def extend(self, deltas) -> bool:
+        """Apply deltas in order, False when one of them is a gap."""
+        return all(self.apply(delta) for delta in deltas)
+
+    def top(self, depth: int) -> BookTop:
+        """Copy of the depth best levels of each side."""
+        bids = self.bids[:depth] * np.array([-1, 1])
+        return BookTop(self.update_id, self.asks[:depth].copy(), bids)
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import numpy as np
+from typing import NamedTuple
+from .helpers import OrderBookSeries, obs_dtype
+from .feed import OrderBookFeed
+
+logger = logging.getLogger('pymaker')
+
+# One memory mapped file per market in the bus directory, put it on a
+# tmpfs like /dev/shm so it never reaches a disk. HEADER int64s come first:
+# the write sequence, odd while a snapshot is written, and the count of
+# snapshots written. Then rings of 2 * capacity times, update_ids and
+# snapshot rows, each row written twice like RingBuffer so the latest
+# ones are one slice. The layout is in the .json file next to it.
+BUS_NAME = "{}.bus"
+HEADER = 8
+
+
+def bus_path(root: str, market: str) -> str:
+    return os.path.join(root, BUS_NAME.format(market))
+
+def default_bus_dir() -> str:
+    shm = '/dev/shm'
+    root = shm if os.path.isdir(shm) else os.path.join(os.sep, 'tmp')
+    return os.path.join(root, 'makerbot-bus')
+
+
+class _BusFile:
+    """Memory maps of a bus file, see BUS_NAME."""
+
+    def __init__(self, path: str, capacity: int, dtype: np.dtype, depth: int, mode: str):
+        self.capacity = capacity
+        self.depth = depth
+        rows = 2 * capacity
+        if mode == 'w+':
+            # Sized once, every map below shares the file
+            with open(path, 'wb') as out:
+                out.truncate((HEADER + 2 * rows) * 8 + rows * depth * dtype.itemsize)
+            mode = 'r+'
+        self.header = np.memmap(path, np.int64, mode, 0, (HEADER,))
+        offset = HEADER * 8
+        self.t = np.memmap(path, np.int64, mode, offset, (rows,))
+        offset += rows * 8
+        self.ids = np.memmap(path, np.int64, mode, offset, (rows,))
+        offset += rows * 8
+        self.data = np.memmap(path, dtype, mode, offset, (rows, depth))
+
+
+class BusWriter:
+    """Publishes the snapshots of a market to the bus for other processes.
+
+    A writer reopening the file of a previous one with the same layout
+    continues its count, so readers don't notice a restarted publisher.
+    """
+
+    def __init__(self, root: str, market: str, capacity: int, depth: int, float_type=np.longdouble):
+        os.makedirs(root, exist_ok=True)
+        path = bus_path(root, market)
+        layout = {'capacity': capacity, 'depth': depth, 'dtype': obs_dtype(float_type).descr}
+        mode = 'w+'
+        if os.path.exists(path) and os.path.exists(path + '.json'):
+            with open(path + '.json') as meta:
+                if json.load(meta) == json.loads(json.dumps(layout)):
+                    mode = 'r+'
+        if mode == 'w+':
+            # A new file, readers of an old layout keep their maps valid.
+            # They open the file once its layout is there.
+            for stale in (path + '.json', path):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            self._file = _BusFile(path, capacity, obs_dtype(float_type), depth, mode)
+            with open(path + '.json.tmp', 'w') as meta:
+                json.dump(layout, meta)
+            os.replace(path + '.json.tmp', path + '.json')
+        else:
+            self._file = _BusFile(path, capacity, obs_dtype(float_type), depth, mode)
+        # A writer that died mid snapshot left the sequence odd
+        header = self._file.header
+        header[0] += header[0] % 2
+
+    def write(self, t: int, update_id: int, snapshot: np.ndarray):
+        """Publish a snapshot row taken at t ns."""
+        bus, header = self._file, self._file.header
+        count = int(header[1])
+        header[0] += 1
+        for row in (count % bus.capacity, count % bus.capacity + bus.capacity):
+            bus.t[row] = t
+            bus.ids[row] = update_id
+            bus.data[row] = snapshot
+        header[1] = count + 1
+        header[0] += 1
+
+
+class BusReader:
+    """Reads the snapshots a BusWriter publishes, from any process."""
+
+    def __init__(self, root: str, market: str):
+        path = bus_path(root, market)
+        self.path = path
+        # Taken before the layout, a file recreated meanwhile shows as replaced
+        self._inode = os.stat(path).st_ino
+        with open(path + '.json') as meta:
+            layout = json.load(meta)
+        dtype = np.dtype([tuple(field) for field in layout['dtype']])
+        self._file = _BusFile(path, layout['capacity'], dtype, layout['depth'], 'r')
+
+    @property
+    def count(self) -> int:
+        return int(self._file.header[1])
+
+    def replaced(self) -> bool:
+        """Whether a writer of another layout recreated the file since it was opened."""
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def read(self, since: int = 0, limit: int = None):
+        """Snapshots published after the since'th one, at most the last
+        limit or capacity ones: returns the new count, times, update_ids and
+        rows, copied while no snapshot was being written.
+        """
+        bus = self._file
+        while True:
+            seq = int(bus.header[0])
+            if seq % 2:
+                time.sleep(0)
+                continue
+            count = int(bus.header[1])
+            size = min(max(count - since, 0), limit or bus.capacity, bus.capacity)
+            end = (count - 1) % bus.capacity + bus.capacity + 1 if count else 0
+            t, ids, data = bus.t[end - size:end].copy(), bus.ids[end - size:end].copy(), bus.data[end - size:end].copy()
+            if int(bus.header[0]) == seq:
+                return count, t.astype("datetime64[ns]"), ids, data
+
+
+def _fit(data: np.ndarray, depth: int) -> np.ndarray:
+    """Rows of data with depth levels, the missing ones NaN."""
+    if data.shape[-1] >= depth:
+        return data[..., :depth]
+    fitted = np.full(data.shape[:-1] + (depth,), np.nan, dtype=data.dtype)
+    fitted[..., :data.shape[-1]] = data
+    return fitted
+
+
+class BusSnapshot(NamedTuple):
+    """A snapshot read from the bus, published by feeds in place of API
+    order books, OrderBookSeries stores the row without parsing.
+    """
+    update_id: int
+    row: np.ndarray
+
+    def to_snapshot(self, depth: int, float_type=np.longdouble) -> np.ndarray:
+        return _fit(self.row, depth).astype(obs_dtype(float_type))
+
+
+class BusFeed(OrderBookFeed):
+    """Feed of the snapshots of a market on the bus, checked every interval
+    seconds. It waits for the publisher to create the market's file, and
+    reopens it when it got no snapshot for stale_after seconds because a
+    publisher of another layout recreated it.
+    """
+
+    def __init__(self, root: str, market: str, interval: float = 0.01, stale_after: float = 1.0):
+        super().__init__()
+        self.root = root
+        self.market = market
+        self.interval = interval
+        self.stale_after = stale_after
+        self.reader = None
+        self._count = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+        return self
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def _open(self) -> BusReader:
+        if self.reader is None:
+            try:
+                self.reader = BusReader(self.root, self.market)
+            except FileNotFoundError:
+                pass
+        return self.reader
+
+    def history(self, config, max_age: float = None) -> OrderBookSeries:
+        """Series of config's backend, depth and dtype with the snapshots
+        already on the bus, the feed only delivers the ones after them.
+        max_age: seconds, older snapshots of a previous run are left out
+        """
+        obs = OrderBookSeries.create(config)
+        if self._open() is None:
+            return obs
+        self._count, t, _, data = self.reader.read(limit = config['max_obs_size'])
+        if max_age is not None:
+            start = t.searchsorted(np.datetime64(time.time_ns() - int(max_age * 1e9), 'ns'))
+            t, data = t[start:], data[start:]
+        return obs.extend(t, _fit(data, obs.data.shape[1]), config['max_obs_size'])
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            while self._open() is None:
+                await asyncio.sleep(self.interval)
+            reader = self.reader
+            if self._count is None:
+                self._count = reader.count
+            last_update = loop.time()
+            while True:
+                if reader.count != self._count:
+                    self._count, t, ids, data = reader.read(self._count)
+                    for time_ns, update_id, row in zip(t.astype(np.int64).tolist(), ids.tolist(), data):
+                        self.publish(BusSnapshot(update_id, row), time_ns)
+                    last_update = loop.time()
+                elif loop.time() - last_update > self.stale_after:
+                    if reader.replaced():
+                        logger.info("Bus file of {} was recreated, reopening it".format(self.market))
+                        # Every snapshot of the new file is new to us
+                        self.reader, self._count = None, 0
+                        break
+                    last_update = loop.time()
+                await asyncio.sleep(self.interval)
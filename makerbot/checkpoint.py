@@ -0,0 +1,46 @@
+import os
+import time
+import logging
+import numpy as np
+from .helpers import OrderBookSeries
+
+logger = logging.getLogger('pymaker')
+
+# One file per market in the checkpoint directory, an uncompressed numpy
+# archive of the int64 ns timestamps and the raw snapshot rows. It is
+# written aside and renamed so a crash never leaves a partial checkpoint.
+CHECKPOINT_NAME = "{}.npz"
+
+
+def checkpoint_path(root: str, market: str) -> str:
+    return os.path.join(root, CHECKPOINT_NAME.format(market))
+
+def save_checkpoint(root: str, market: str, obs: OrderBookSeries):
+    """Store the snapshots of obs, which must not change while this runs."""
+    os.makedirs(root, exist_ok=True)
+    path = checkpoint_path(root, market)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as out:
+        np.savez(out, t=obs.t.astype(np.int64), data=obs.data)
+    os.replace(tmp, path)
+
+def load_checkpoint(root: str, market: str, config, max_age: float) -> OrderBookSeries:
+    """Series of config's backend, depth and dtype holding the checkpointed
+    snapshots of the last max_age seconds, empty without a usable checkpoint.
+    """
+    obs = OrderBookSeries.create(config)
+    path = checkpoint_path(root, market)
+    if not os.path.exists(path):
+        return obs
+    try:
+        with np.load(path) as archive:
+            t, data = archive['t'].astype("datetime64[ns]"), archive['data']
+    except (OSError, ValueError, KeyError) as exception:
+        logger.warning("Ignoring unreadable checkpoint {}: {}".format(path, exception))
+        return obs
+    if data.ndim != 2 or data.shape[1] != obs.data.shape[1] or data.dtype.names != obs.data.dtype.names:
+        logger.warning("Ignoring checkpoint {}, it was saved with another obs_depth".format(path))
+        return obs
+    since = np.datetime64(time.time_ns() - int(max_age * 1e9), 'ns')
+    start = int(np.searchsorted(t, since))
+    return obs.extend(t[start:], data[start:], config['max_obs_size'])
@@ -4,35 +4,78 @@ makerbot is a crypto market maker bot that is easy understand and customize
 
 Usage:
   makerbot start <market> [--config=<file>]
+  makerbot start-all [--config=<file>]
+  makerbot supervise [--config=<file>] [--workers=<n>]
+  makerbot backtest <market> --data=<dir> [--config=<file>] [--quote=<amount>] [--exact]
+  makerbot sweep <market> --data=<dir> (--grid=<spec>)... [--config=<file>] [--quote=<amount>] [--workers=<n>] [--top=<n>]
   makerbot --version
 
 Options:
-  -h --help        Show this screen.
-  --version        Show version.
-  --config=<file>  Configuration file [default: config.ini].
+  -h --help          Show this screen.
+  --version          Show version.
+  --config=<file>    Configuration file [default: config.ini].
+  --data=<dir>       Directory of order book recordings (see record_dir).
+  --quote=<amount>   Quote currency to start a backtest with [default: 1000].
+  --exact            Run the strategy on every recorded tick.
+  --grid=<spec>      Setting values to sweep, e.g. --grid=straddle=0.5,1,2
+  --workers=<n>      Processes running the sweep or trading [default: 0], 0 uses every core.
+  --top=<n>          Rows of the ranked sweep results to print [default: 20].
 """
 
 
+import os
+import sys
 import time
+import atexit
+import asyncio
 import logging
+import contextvars
 import numpy as np
-import pandas as pd
-from docopt import docopt
 from datetime import datetime
 from functools import reduce
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
 from getpass import getpass
-from nash import NashApi, CurrencyAmount
-from decimal import Decimal, getcontext
-from .helpers import Order, OrderBookSeries, retry, get_config
-
-__version__ = "0.1.5"
-# The maximum precision for amount and prices in Nash is 8, so we set that
-getcontext().prec = 8
-getcontext().rounding = "ROUND_FLOOR"
-
-
-def get_obs_dataframe(obs: OrderBookSeries) -> pd.DataFrame:
-    """ Compute useful metrics from orderbook series."""
+from decimal import Decimal
+from . import __version__
+from .helpers import Order, OrderBookSeries, get_config, get_markets, parse_str_option, parse_float_type
+from .helpers import ContextConfig, MarketLogFilter, market_config, book_snapshot
+from .metrics import MarketMetrics
+from .feed import OrderBookFeed, MarketPoller, bootstrap, HEADROOM
+from .bus import BusFeed, BusWriter, default_bus_dir
+from .fixed import SCALE, to_fixed, from_fixed, fixed_div
+from .scheduler import RequestScheduler
+from .telemetry import REGISTRY, MetricsExporter
+from .orders import OrderTracker
+from .ledger import Ledger
+from .recorder import OrderBookRecorder
+from .checkpoint import save_checkpoint, load_checkpoint
+from .strategy import FeatureCache, feature, load_strategy
+from .journal import Journal
+from .supervisor import Supervisor, shard
+
+# Log format of processes trading several markets
+MARKETS_LOG_FORMAT = '%(asctime)s:%(levelname)s:%(market)s: %(message)s'
+# Log format of the processes of supervise
+SUPERVISED_LOG_FORMAT = '%(asctime)s:%(levelname)s:%(processName)s:%(market)s: %(message)s'
+# Threads running independent network requests of a tick concurrently
+io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='makerbot-io')
+# Rate limit and retries of every exchange request, configured in main
+scheduler = RequestScheduler(executor=io_pool)
+# Journal of orders, fills and decisions, set in run_markets when configured
+journal = None
+# Amount type of the orders sent, loaded with the first one
+CurrencyAmount = None
+
+
+def get_obs_dataframe(obs: OrderBookSeries) -> 'pd.DataFrame':
+    """ Compute useful metrics from orderbook series.
+        Handy for analysis, the trading loop keeps the same columns up to
+        date incrementally in MarketMetrics and never loads pandas.
+    """
+    import pandas as pd
     # midprice
     Pmid = (obs.data['Pask'][:,0] + obs.data['Pbid'][:,0]) / 2.0
     # Imbalance
@@ -46,10 +89,11 @@ def get_obs_dataframe(obs: OrderBookSeries) -> pd.DataFrame:
                          "Pmid": Pmid,
                          "Pmicro": Pmicro}, index=obs.t)
 
-def bollinger_bands(df: pd.DataFrame, window: int = 20, k: int = 2) -> pd.DataFrame:
+def bollinger_bands(df: 'pd.DataFrame', window: int = 20, k: int = 2) -> 'pd.DataFrame':
     """ Compute upper, lower values for data on window beteween k sigma
         This funciton is an example how to one could implement metrics using the
-        OrderBookSeries and pandas.
+        OrderBookSeries and pandas. MarketMetrics.bands() gives the latest
+        values without recomputing the whole frame.
     """
     sma = df.Pmid.rolling(window).mean() # Use midprice as fair value
     kstd = df.Pmid.rolling(window).std() * k # Get standard deviation times constant
@@ -57,32 +101,67 @@ def bollinger_bands(df: pd.DataFrame, window: int = 20, k: int = 2) -> pd.DataFr
     lower = sma - kstd
     return sma, upper, lower
 
-def funds_in_open_orders(orders) -> Decimal:
-    return sum(Decimal(ods.amount_remaining.amount) * Decimal(ods.limit_price.amount) for ods in orders if ods.status == "OPEN")
+def funds_in_open_orders(orders) -> int:
+    return sum(to_fixed(ods.amount_remaining.amount) * to_fixed(ods.limit_price.amount) for ods in orders if ods.status == "OPEN") // SCALE
 
-def get_max_order_funds(orders) -> Decimal:
+def get_max_order_funds(orders: OrderTracker) -> int:
     """ Get maximum of funds to allocate in a order
     """
-    return CONFIG["max_funds_in_flight"] - funds_in_open_orders(orders)
+    return CONFIG["max_funds_in_flight"] - orders.ledger.funds_in_flight
 
 def get_corresponding_sell(market, buy: Order) -> Order:
     """ Build the corresponding sell order for the given buy order."""
     sell_price = buy.price + CONFIG['straddle']
-    sell_order = buy.replace(price = sell_price).replace(buy_or_sell = 'SELL')
+    sell_order = buy.replace_fixed(price = sell_price).replace(buy_or_sell = 'SELL')
     return sell_order.constrain_price(market)
 
-def place_order(market, order) -> Order:
-    """ Place order in NashApi format
+def currency_amount(amount: str, currency: str):
+    """ nash.CurrencyAmount, loaded on first use like the SDK itself. The
+        simulator only reads .amount, without nash it gets a local one.
     """
-    amount = CurrencyAmount(str(order.amount), market.a_unit)
-    placed = retry(lambda: api.place_limit_order(market.name,
-                                                 amount,
-                                                 order.buy_or_sell,
-                                                 order.cancellation_policy,
-                                                 str(order.price),
-                                                 order.allow_taker))
+    global CurrencyAmount
+    if CurrencyAmount is None:
+        try:
+            from nash import CurrencyAmount
+        except ImportError:
+            from .helpers import CurrencyAmount
+    return CurrencyAmount(amount, currency)
+
+def send_order(market, order) -> Order:
+    """ Place order in NashApi format, without tracking it.
+        Returns the order with the id it was placed with.
+    """
+    amount = currency_amount(from_fixed(order.amount), market.a_unit)
+    # Taken before the exchange's own placed_at, bounds the listing confirming a fill
+    placed_at = time.time()
+    placed = scheduler.run(api.place_limit_order, market.name,
+                                                  amount,
+                                                  order.buy_or_sell,
+                                                  order.cancellation_policy,
+                                                  from_fixed(order.price),
+                                                  order.allow_taker)
     logger.info("placed limit order {}".format(placed.id))
-    return order.replace(id = placed.id)
+    REGISTRY.counter('makerbot_orders_placed_total', market = market.name).inc()
+    if journal:
+        journal.write('place', market.name, id = placed.id, side = order.buy_or_sell,
+                      price = order.price, amount = order.amount)
+    return order.replace(id = placed.id, placed_at = placed_at)
+
+def place_order(market, order, orders: OrderTracker = None) -> Order:
+    """ Place order in NashApi format and track it."""
+    order = send_order(market, order)
+    if orders is not None:
+        order = orders.placed(order)
+    return order
+
+def cancel_order(market, order: Order, orders: OrderTracker = None):
+    """ Cancel order and mark it in the tracker."""
+    scheduler.run(api.cancel_order, order.id, market.name)
+    REGISTRY.counter('makerbot_orders_cancelled_total', market = market.name).inc()
+    if journal:
+        journal.write('cancel', market.name, id = order.id)
+    if orders is not None:
+        orders.cancelled(order.id)
 
 def get_orders_by_side(orders: list, side: str) -> list:
     """ Get open and pending orders from side."""
@@ -109,91 +188,103 @@ def get_last_buy_order(orders: list):
         raise Exception("More than one active buy order detected!")
     return sorted(buy_orders, key = lambda o: o.placed_at).pop()
 
-def size_order(obs: OrderBookSeries, order: Order, min_amount_base) -> Order:
+def size_order(features: FeatureCache, order: Order, min_amount_base) -> Order:
     """ This function is called when a order is being placed and it needs to be
         sized for an amount, needs a order with price and direction
     """
     # Respect maximum amount of funds (base currency) in order
-    Q_max = np.longfloat(str(CONFIG['max_funds_in_order'] / order.price))
+    Q_max = fixed_div(CONFIG['max_funds_in_order'], order.price)
     # Size order as the mean size of the two top orders on the last 15s
-    last15s = np.argwhere(obs.t > obs.t[-1] - np.timedelta64(15, 's')).flatten()
-    side = 'Qask' if order.buy_or_sell == 'BUY' else 'Qbid'
-    Q = obs.data[side][last15s]
-    amt = min(Q[:,:2].mean(), Q_max)
+    ask_size, bid_size = features['top_sizes_15s']
+    amt = min(to_fixed(ask_size if order.buy_or_sell == 'BUY' else bid_size), Q_max)
     # Make sure order size is not lower than the min amount of that market
     amt = max(amt, min_amount_base)
-    return order.replace(amount = amt)
+    return order.replace_fixed(amount = amt)
 
-def get_buy_order(market, obs, df: pd.DataFrame) -> Order:
+def get_buy_order(market, features: FeatureCache) -> Order:
     """ This function is called to price a order being placed."""
     # Use microprice as reference
-    min_trade_size = float(market.min_trade_size)
-    price = Decimal(str(df.Pmicro[-1])) - CONFIG["buy_down_interval"]
-    return size_order(obs, Order(price, 0, "BUY"), min_trade_size)
+    min_trade_size = to_fixed(market.min_trade_size)
+    price = features['microprice'] - CONFIG["buy_down_interval"]
+    return size_order(features, Order.from_fixed(price, 0, "BUY"), min_trade_size)
+
+@feature
+def buy_order(features) -> Order:
+    """ The buy order to place on this tick, before constraints."""
+    return get_buy_order(features.market, features)
 
-def is_equal(lhs, rhs) -> bool:
-    """Check if lhs and rhs are equal."""
-    diff = abs(Decimal(str(lhs)) - Decimal(str(rhs)))
-    return diff < 1e-7
+@feature
+def buying(features) -> bool:
+    """ Same as is_buying on the series of the tick."""
+    return features['imbalance_10s'] > 0.5
+
+def is_equal(lhs: int, rhs: int) -> bool:
+    """Check if fixed point lhs and rhs are equal within 1e-7."""
+    return abs(lhs - rhs) < 10
 
 def is_buying(obs: OrderBookSeries) -> bool:
     """Try to determine if market is buying in the last 10 seconds."""
-    last10s = np.argwhere(obs.t > obs.t[-1] - np.timedelta64(10, 's')).flatten()
-    Qa_top = obs.data['Qask'][last10s][:,:2] # Size of low 2 asks in last 10s
-    Qb_top = obs.data['Qbid'][last10s][:,:2] # Size of top 2 bids in last 10s
+    last10s = obs.window(10)
+    Qa_top = last10s.data['Qask'][:,:2] # Size of low 2 asks in last 10s
+    Qb_top = last10s.data['Qbid'][:,:2] # Size of top 2 bids in last 10s
     Qa_avg = np.average(Qa_top, axis = 1)
     Qb_avg = np.average(Qb_top, axis = 1)
     I = Qb_avg / (Qb_avg + Qa_avg) # Finally Compute imbalance!
     return np.median(I) > 0.5
 
-def should_place_buy(obs: OrderBookSeries) -> bool:
+def should_place_buy(features: FeatureCache) -> bool:
     """ Check if should place order."""
     stable_price = CONFIG["stable_price"]
     max_drop_percentage = CONFIG["max_drop_percentage"]
 
-    min_price = (stable_price * (100 - max_drop_percentage)) / 100
-    ob = obs.data[-1] # Current order book view
-    fv = Decimal(str((ob['Pask'][0] + ob['Pbid'][0])/2.0)) # midprice as fair value
+    min_price = (stable_price * (100 - max_drop_percentage)) // 100
+    fv = features['mid'] # midprice as fair value
     if fv < min_price:
-        raise Exception("market price is lower than max drop allowed: {}".format(min_price))
+        raise Exception("market price is lower than max drop allowed: {}".format(from_fixed(min_price)))
     # if market is "buying" our sell has bigger chance to work fast
-    return is_buying(obs)
+    return features['buying']
+
+def check_risk(ledger: Ledger):
+    """ Stop trading when the loss or the inventory exceed their limits."""
+    max_loss, max_inventory = CONFIG['max_loss'], CONFIG['max_inventory']
+    if max_loss and ledger.pnl < -max_loss:
+        raise Exception("loss is higher than max loss allowed: {}".format(from_fixed(-ledger.pnl)))
+    if max_inventory and ledger.inventory > max_inventory:
+        raise Exception("inventory is higher than max inventory allowed: {}".format(from_fixed(ledger.inventory)))
 
-def should_rebuy(sell_orders: dict, buy_order: Order) -> bool:
+def should_rebuy(low_sell: Order, buy_order: Order) -> bool:
     """ Decide if should cancel current buy order and issue a new one."""
-    low_sell = get_lowest_order(sell_orders)
     eff_straddle = low_sell.price - buy_order.price
     return eff_straddle > CONFIG['straddle'] + CONFIG['buy_down_interval']
 
-def is_top_bid(bid_price, top_bid, botton_ask):
+def is_top_bid(bid_price: int, top_bid: int, botton_ask: int):
     is_same = is_equal(bid_price, top_bid)
     if is_same:
         return True
-    is_min_straddle = bid_price >= (Decimal(str(botton_ask)) - CONFIG['straddle'])
+    is_min_straddle = bid_price >= (botton_ask - CONFIG['straddle'])
     return is_min_straddle
 
-def setup_scrum_buy(market, obs, df: pd.DataFrame, buy_order: Order, max_amount: Decimal):
+def setup_scrum_buy(market, features: FeatureCache, orders: OrderTracker, max_amount: int):
     """ Manage the creation and placement of a scrum buy, handle rebuy and
         cancelation if needed due to market going up.
     """
-    buy_1 = get_buy_order(market, obs, df).constrain(market, max_amount)
+    buy_order = orders.last_buy()
+    buy_1 = features['buy_order'].constrain(market, max_amount)
     if not buy_order:
         logger.info('No buy order, checking if should place scrum buy.')
-        place_order(market, buy_1)
+        place_order(market, buy_1, orders)
     else:
         filled = buy_order.amount - buy_order.amount_remaining
         if filled > 0:
             logger.info("Scrum buy filled.")
-            api.cancel_order(buy_order.id, market.name)
-            scrum_sell = get_corresponding_sell(market, buy_1.replace(amount = filled))
-            place_order(market, scrum_sell)
-            place_order(market, buy_1)
+            scrum_sell = get_corresponding_sell(market, buy_1.replace_fixed(amount = filled))
+            replace_buy_and_sell(market, orders, buy_order, buy_1, scrum_sell)
         # Order has not filled at least 5% and is not the top bid anymore
-        elif not is_top_bid(buy_order.price, df.Pbid[-1], df.Pask[-1]):
+        elif not is_top_bid(buy_order.price, features['top_bid'], features['top_ask']):
             logger.info("Scrum not top anymore - rebuy.")
             # Market has not hit the order and it is no longer best ask
-            api.cancel_order(buy_order.id, market.name)
-            place_order(market, buy_1)
+            cancel_order(market, buy_order, orders)
+            place_order(market, buy_1, orders)
     return
 
 # Mapp the words to logging levels for user convenience
@@ -208,116 +299,580 @@ def log_map(levelstr):
 
 # Map config keywords to its parsing functions
 type_map = {'env': str,
-            'max_funds_in_flight': Decimal,
-            'max_funds_in_order': Decimal,
+            'max_funds_in_flight': to_fixed,
+            'max_funds_in_order': to_fixed,
             'max_drop_percentage': int,
             'min_history_points': int,
             'max_loading_time': int,
             'max_obs_size': int,
-            'stable_price': Decimal,
-            'buy_down_interval': Decimal,
-            'straddle': Decimal,
+            'stable_price': to_fixed,
+            'buy_down_interval': to_fixed,
+            'straddle': to_fixed,
             'log_to_file': str,
-            'log_level': log_map}
+            'log_level': log_map,
+            'obs_backend': lambda val: parse_str_option(val, ('APPEND', 'RING')),
+            'obs_depth': int,
+            'obs_dtype': parse_float_type,
+            'poll_interval': float,
+            'reconcile_interval': float,
+            'record_dir': str,
+            'request_rate': float,
+            'min_poll_interval': float,
+            'max_poll_interval': float,
+            'request_burst': float,
+            'retry_deadline': float,
+            'metrics_file': str,
+            'metrics_port': int,
+            'metrics_host': str,
+            'sim_min_trade_size': str,
+            'sim_min_trade_size_b': str,
+            'sim_min_trade_increment': str,
+            'sim_min_trade_increment_b': str,
+            'checkpoint_dir': str,
+            'checkpoint_interval': float,
+            'checkpoint_max_age': float,
+            'sim_data': str,
+            'sim_tick_interval': float,
+            'sim_volatility': float,
+            'sim_level_funds': float,
+            'sim_trade_rate': float,
+            'sim_latency': float,
+            'sim_rate_limit': float,
+            'sim_balances': str,
+            'strategy': str,
+            'journal_file': str,
+            'journal_fsync_interval': float,
+            'book_deltas': str,
+            'bus_dir': str,
+            'max_loss': to_fixed,
+            'max_inventory': to_fixed}
+
+# Settings that older config files may not define
+default_map = {'obs_backend': 'ring',
+               'obs_depth': '25',
+               'obs_dtype': 'longdouble',
+               'poll_interval': '0.1',
+               'reconcile_interval': '60',
+               'record_dir': '',
+               'request_rate': '10',
+               'min_poll_interval': '0.05',
+               'max_poll_interval': '5',
+               'request_burst': '5',
+               'retry_deadline': '10',
+               'metrics_file': '',
+               'metrics_port': '0',
+               'metrics_host': '127.0.0.1',
+               'sim_min_trade_size': '0.001',
+               'sim_min_trade_size_b': '1',
+               'sim_min_trade_increment': '0.00001',
+               'sim_min_trade_increment_b': '0.01',
+               'checkpoint_dir': '',
+               'checkpoint_interval': '60',
+               'checkpoint_max_age': '300',
+               'sim_data': '',
+               'sim_tick_interval': '0.1',
+               'sim_volatility': '0.0005',
+               'sim_level_funds': '1000',
+               'sim_trade_rate': '1',
+               'sim_latency': '0',
+               'sim_rate_limit': '0',
+               'sim_balances': 'usdc:10000 eth:50 neo:500',
+               'strategy': '',
+               'journal_file': '',
+               'journal_fsync_interval': '1',
+               'book_deltas': 'no',
+               'bus_dir': '',
+               'max_loss': '0',
+               'max_inventory': '0'}
+
+def replace_buy_and_sell(market, orders: OrderTracker, old_buy: Order, new_buy: Order, sell: Order) -> Order:
+    """ Cancel old_buy and place new_buy, placing sell at the same time.
+        The sell only depends on the base currency already bought, the
+        new buy must wait for the cancel to release the quote funds.
+        Only the requests overlap, the tracker is updated from this thread.
+    """
+    sending_sell = io_pool.submit(contextvars.copy_context().run, send_order, market, sell)
+    try:
+        cancel_order(market, old_buy, orders)
+        return place_order(market, new_buy, orders)
+    finally:
+        orders.placed(sending_sell.result())
 
-def main():
-    arguments = docopt(__doc__, version=__version__)
-    print("Nash market maker bot, version {}\n".format(__version__))
-    login = input('Nash login email: ')
-    pwd = getpass('Nash login password: ')
-    print("starting ...\n")
-    # Setup logger and config
-    global CONFIG
-    CONFIG = get_config(type_map, arguments['<market>'], arguments['--config'])
-    # Stup logging based on configs
+def trade(market, features: FeatureCache, orders: OrderTracker, available: int):
+    """ Run the strategy on the features of the latest order book view.
+        Returns the current buy order and how many seconds to wait before
+        acting on the market again.
+    """
+    check_risk(orders.ledger)
+    sell_orders = orders.active_sells()
+    buy_order = orders.last_buy()
+    # Get maximum amount for a buy order on this round
+    max_amount = min(get_max_order_funds(orders), available)
+    if max_amount < to_fixed(market.min_trade_size_b):
+        logger.info("Max order size currently lower than market minimum")
+        # If funds are unavailable means we need to wait a sell order to fill
+        return buy_order, 5
+    if not should_place_buy(features):
+        logger.debug("Skipping placement because market is not buying.")
+        return buy_order, 0
+    # If we have a live sell order we are market making:
+    if not len(sell_orders):
+        setup_scrum_buy(market, features, orders, max_amount)
+        # Give some time after placing scrum buy, the idea is to give change for market
+        # volatility to hit it or change price in meaningful way
+        return buy_order, 5
+    # If we don't have a active buy we nee
+    filled = buy_order.amount - buy_order.amount_remaining
+    # If previous buy executed or is executing, place order and move buy
+    if filled > 0:
+        logger.info("Previous buy filled. Placing new pair.")
+        new_buy = features['buy_order'].constrain(market, max_amount)
+        previous_sell = get_corresponding_sell(market, new_buy.replace_fixed(amount = filled))
+        buy_order = replace_buy_and_sell(market, orders, buy_order, new_buy, previous_sell)
+    # If straddle becomes to big set re-buy order
+    elif should_rebuy(orders.lowest_sell(), buy_order):
+        if not is_top_bid(buy_order.price, features['top_bid'], features['top_ask']):
+            logger.info("Straddle too big. Performing rebuy.")
+            cancel_order(market, buy_order, orders)
+            new_buy = features['buy_order'].constrain_price(market)
+            buy_order = place_order(market, new_buy.replace_fixed(amount = buy_order.amount), orders)
+    return buy_order, 0
+
+async def market_maker(market, feed: OrderBookFeed, get_orders, get_all_orders, get_filled_orders,
+                       get_available, recorder: OrderBookRecorder = None):
+    """ Trade on every order book update pushed by the feed.
+        get_orders lists our active orders, get_all_orders every order of the
+        session and is only used to reconcile the tracker now and then.
+        get_filled_orders(since) lists the filled ones placed since then, to
+        confirm the fills of orders that left the active listing.
+        Every snapshot is also saved when a recorder is given.
+    """
+    updates = feed.subscribe()
+    checkpoints = CONFIG['checkpoint_dir']
+    warm = None
+    if isinstance(feed, BusFeed):
+        # The publisher has the history already
+        warm = feed.history(CONFIG, CONFIG['checkpoint_max_age'])
+        if len(warm.t):
+            logger.info("Loaded {} snapshots from the market data bus".format(len(warm.t)))
+    # Start from the last checkpoint when recent enough, only topped up with live data
+    if checkpoints and (warm is None or not len(warm.t)):
+        warm = load_checkpoint(checkpoints, market.name, CONFIG, CONFIG['checkpoint_max_age'])
+        if len(warm.t):
+            logger.info("Loaded {} snapshots from checkpoint".format(len(warm.t)))
+    obs = await bootstrap(updates, CONFIG, warm)
+
+    def checkpoint(series):
+        try:
+            save_checkpoint(checkpoints, market.name, series)
+        except OSError as exception:
+            logger.error("Failed to save checkpoint: {}".format(exception))
+
+    metrics = MarketMetrics.from_series(obs, max_obs_size = CONFIG['max_obs_size'])
+    features = FeatureCache(registry = REGISTRY, market = market.name)
+    strategy = load_strategy(CONFIG['strategy']) if CONFIG['strategy'] else None
+
+    def filled(order, amount):
+        journal.write('fill', market.name, id = order.id, side = order.buy_or_sell,
+                      price = order.price, amount = amount)
+
+    orders = OrderTracker(on_fill = filled if journal else None)
+    buy_order, last_available = None, None
+    last_reconcile = None
+    loop = asyncio.get_event_loop()
+    last_checkpoint, saving = loop.time(), None
+    stage = lambda name: REGISTRY.histogram('makerbot_stage_seconds', market = market.name, stage = name)
+    update_time, fetch_time, decide_time, tick_time = stage('update'), stage('fetch'), stage('decide'), stage('tick')
+    ticks = REGISTRY.counter('makerbot_ticks_total', market = market.name)
+    skipped = REGISTRY.counter('makerbot_skipped_ticks_total', market = market.name)
+    logger.info("Enter market maker loop")
+    try:
+        async for update in updates:
+            reconcile = last_reconcile is None or loop.time() - last_reconcile > CONFIG['reconcile_interval']
+            # Request our orders and balance while the series is updated
+            known = orders.tracked
+            fetching = asyncio.gather(scheduler.call(get_all_orders if reconcile else get_orders),
+                                      scheduler.call(get_available))
+            # Let both reach the io pool, they run while the series is updated
+            await asyncio.sleep(0)
+            # Keep every update in the history but only act on the most recent
+            with update_time.time():
+                pending = updates.drain()
+                for update in [update] + pending:
+                    obs = obs.update(update.orderbook, CONFIG['max_obs_size'], update.time)
+                    metrics.update(obs)
+                    if recorder:
+                        recorder.record(market.name, obs.t[-1], obs.data[-1])
+            skipped.inc(len(pending))
+            logger.debug("Updated orderbook series and metrics.")
+            if checkpoints and loop.time() - last_checkpoint > CONFIG['checkpoint_interval']:
+                # Written from a copy, the series keeps changing meanwhile
+                last_checkpoint = loop.time()
+                saving = io_pool.submit(contextvars.copy_context().run, checkpoint,
+                                        OrderBookSeries(obs.t.copy(), obs.data.copy()))
+            try:
+                with fetch_time.time():
+                    listed, available = await fetching
+            except Exception as exception:
+                # Past the retry deadline, act on a later update instead
+                logger.warning("Skipping update, requests failed: {}".format(exception))
+                skipped.inc()
+                continue
+            if reconcile:
+                orders.reconcile(listed, known)
+                last_reconcile = loop.time()
+            else:
+                closed = orders.sync_active(listed, known)
+                if closed:
+                    since = min(order.placed_at for order in closed)
+                    try:
+                        orders.confirm(await scheduler.call(get_filled_orders, since))
+                    except Exception as exception:
+                        logger.warning("Fills left to the next reconcile, request failed: {}".format(exception))
+            if journal and available != last_available:
+                journal.write('balance', market.name, available = available)
+                last_available = available
+            features.update(update.orderbook.update_id, obs, metrics, market)
+            # With a side of the book empty the last mark stays
+            if not np.isnan(metrics.Pmicro[-1]):
+                orders.ledger.mark(features['microprice'])
+            # Decide off the event loop so the feed keeps receiving updates
+            with decide_time.time():
+                buy_order, pause = await loop.run_in_executor(None, contextvars.copy_context().run,
+                                                              strategy or trade, market, features, orders, available)
+            if journal:
+                journal.write('decision', market.name, update_id = update.orderbook.update_id,
+                              available = available, features = features.values(), pause = pause,
+                              buy_order = buy_order.id if buy_order else None, ledger = orders.ledger.values())
+            latency = feed.latency.record(update)
+            tick_time.observe(latency)
+            ticks.inc()
+            logger.debug("Tick to decision {:.1f}ms".format(latency * 1e3))
+            if pause:
+                await asyncio.sleep(pause)
+    finally:
+        updates.close()
+        logger.info(str(feed.latency))
+        logger.info(str(features))
+        logger.info(str(orders.ledger))
+        if checkpoints:
+            # Both use the same temporary file
+            if saving:
+                saving.result()
+            checkpoint(obs)
+            logger.info("Saved {} snapshots to checkpoint".format(len(obs.t)))
+        logger.info("Canceling bot buy order if any.")
+        try:
+            await scheduler.call(api.cancel_order, buy_order.id, market.name)
+        except:
+            pass
+
+def backtest(arguments):
+    """ Replay recorded order books of a market and print the outcome."""
+    # Imported here, the backtest module drives this one
+    from .backtest import run_backtest, market_info
+    from .recorder import iter_recording
+    config = get_config(type_map, arguments['<market>'], arguments['--config'], default_map)
+    market = market_info(config)
+    series = iter_recording(arguments['--data'], market.name)
+    result = run_backtest(series, market, config, Decimal(arguments['--quote']), exact = arguments['--exact'])
+    print("ticks: {} ({:.0f}/s)".format(result.ticks, result.ticks_per_second))
+    print("decisions: {}, fills: {}".format(result.decisions, len(result.fills)))
+    print("quote: {}, base: {}".format(result.quote, result.base))
+    print("pnl: {}".format(result.pnl))
+    if result.halted:
+        print("halted: {}".format(result.halted))
+
+def sweep(arguments):
+    """ Backtest a grid of settings on a recording and print them ranked."""
+    from .sweep import parse_grid, run_sweep, format_results
+    config = get_config(type_map, arguments['<market>'], arguments['--config'], default_map)
+    grid = parse_grid(arguments['--grid'], type_map)
+    results = run_sweep(arguments['--data'], config, grid, Decimal(arguments['--quote']),
+                        workers = int(arguments['--workers']))
+    print(format_results(results, int(arguments['--top'])))
+
+def setup_logger(config, fmt = '%(asctime)s:%(levelname)s: %(message)s'):
+    """ Setup the pymaker logger from the log settings."""
     global logger
     logger = logging.getLogger('pymaker')
-    logger.setLevel(CONFIG['log_level'])
+    logger.setLevel(config['log_level'])
     # create correct handler
-    if CONFIG['log_to_file'] in ['y', 'Y', 'yes', 'Yes', 'YES']:
+    if config['log_to_file'] in ['y', 'Y', 'yes', 'Yes', 'YES']:
         handler = logging.FileHandler(r'./makerbot.log')
     else:
         handler = logging.StreamHandler()
 
     handler.setLevel(logging.DEBUG)
-    formatter = logging.Formatter('%(asctime)s:%(levelname)s: %(message)s')
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    handler.setFormatter(logging.Formatter(fmt))
+    # Records are queued and written by a listener thread so terminal and
+    # disk stalls don't block the loop, the market is added before queueing
+    records = QueueHandler(Queue())
+    records.addFilter(MarketLogFilter())
+    logger.addHandler(records)
+    listener = QueueListener(records.queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return logger
+
+def account_requests(market, start_time: str):
+    """ Requests for our active orders, every order of the session, the
+        filled ones since an epoch time and the available quote funds of a market.
+    """
+    _, quote = market.name.split('_')
+    # Named functions, request metrics are labelled by name
+    def get_available():
+        return to_fixed(api.get_account_balance(quote).available.amount)
+    def get_orders():
+        return api.list_account_orders(market.name,
+                                       status = ['OPEN', 'PENDING'],
+                                       range_start = start_time).orders
+    def get_all_orders():
+        return api.list_account_orders(market.name,
+                                       status = ['OPEN', 'PENDING', 'FILLED'],
+                                       range_start = start_time).orders
+    def get_filled_orders(since: float):
+        return api.list_account_orders(market.name,
+                                       status = ['FILLED'],
+                                       range_start = datetime.utcfromtimestamp(since).isoformat() + 'Z').orders
+    return get_orders, get_all_orders, get_filled_orders, get_available
+
+def open_api(configs: dict, login: str, pwd: str):
+    """ Exchange API of the env setting, logged in through the scheduler."""
+    settings = next(iter(configs.values()))
+    if settings['env'] == 'simulator':
+        from .simulator import SimulatorApi
+        exchange = SimulatorApi(configs)
+    else:
+        try:
+            from nash import NashApi
+        except ImportError:
+            raise Exception("The nash-api package is needed to trade on {}".format(settings['env']))
+        exchange = NashApi(environment=settings['env'])
+    scheduler.run(exchange.login, login, pwd, None)
+    return exchange
+
+def book_depth() -> int:
+    """ Levels of the market's L2Book kept from order book deltas, 0 when
+        full order books are polled instead.
+    """
+    if CONFIG['book_deltas'] not in ['y', 'Y', 'yes', 'Yes', 'YES']:
+        return 0
+    if not hasattr(api, 'get_order_book_deltas'):
+        raise Exception("The {} API has no order book deltas".format(CONFIG['env']))
+    return CONFIG['obs_depth']
+
+def run_markets(configs: dict, login: str, pwd: str, bus: str = None):
+    """ Trade the markets of configs, a dict of market name to config, in
+        this process. Markets share the API session and the request
+        scheduler, each keeps its own order book series and orders.
+        bus: directory of the market data bus to read the order books from
+        instead of polling them, see publish_markets
+        Returns False when every market stopped on an error.
+    """
+    global api, scheduler, journal
+    # Process wide settings come from the DEFAULT section
+    settings = next(iter(configs.values()))
+    scheduler = RequestScheduler(settings['request_rate'], settings['request_burst'],
+                                 settings['retry_deadline'], io_pool, REGISTRY)
+    exporter = MetricsExporter(REGISTRY, settings['metrics_file'] or None, settings['metrics_port'] or None,
+                               settings['metrics_host'])
+    if settings['journal_file']:
+        journal = Journal(settings['journal_file'], settings['journal_fsync_interval'])
+    # Markets stopped on an error
+    failed = []
     # Loop until Ctrl+C is hit
     try:
-
-        global api
-        api = NashApi(environment=CONFIG['env'])
-        api.login(login, pwd, None)
-
-        market = api.get_market(CONFIG['market'])
-        _, quote = market.name.split('_')
+        api = open_api(configs, login, pwd)
         # We need to add Z since Python is not ISO compliant :(
         start_time = datetime.utcnow().isoformat() + 'Z'
-
-        get_available = lambda: Decimal(api.get_account_balance(quote).available.amount)
-        get_orders = lambda: api.list_account_orders(market.name,
-                                                     status = ['OPEN', 'PENDING', 'FILLED'],
-                                                     range_start = start_time).orders
-        get_orderbook = lambda: api.get_order_book(market.name)
-
-        logger.info("Enter market maker loop")
-        obs = OrderBookSeries.bootstrap(api, CONFIG)
-        last_update_id = -1
-        while True:
-            # Sleep for 100ms to avoid hitting rate limit
-            time.sleep(0.100)
-            orderbook = retry(get_orderbook)
-            # if there has been no changes on the orderbook skip the loop iteration
-            if orderbook.update_id == last_update_id:
-                continue
-            logger.debug("Updating orderbook series and dataframe.")
-            last_update_id = orderbook.update_id
-            obs = obs.update(orderbook, CONFIG['max_obs_size'])
-            df = get_obs_dataframe(obs)
-            orders = retry(get_orders)
-            sell_orders = get_active_sell_orders(orders)
-            buy_order = get_last_buy_order(orders)
-            # Get maximum amount for a buy order on this round
-            max_amount = min(get_max_order_funds(orders), retry(get_available))
-            if max_amount < Decimal(market.min_trade_size_b):
-                logger.info("Max order size currently lower than market minimum")
-                # If funds are unavailable means we need to wait a sell order to fill
-                time.sleep(5)
-                continue
-            if not should_place_buy(obs):
-                logger.debug("Skipping placement because market is not buying.")
-                continue
-            # If we have a live sell order we are market making:
-            if not len(sell_orders):
-                setup_scrum_buy(market, obs, df, buy_order, max_amount)
-                # Give some time after placing scrum buy, the idea is to give change for market
-                # volatility to hit it or change price in meaningful way
-                time.sleep(5)
-            # If we don't have a active buy we nee
-            else:
-                filled = buy_order.amount - buy_order.amount_remaining
-                # If previous buy executed or is executing, place order and move buy
-                if filled > 0:
-                    logger.info("Previous buy filled. Placing new pair.")
-                    api.cancel_order(buy_order.id, market.name)
-                    new_buy = get_buy_order(market, obs, df).constrain(market, max_amount)
-                    previous_sell = get_corresponding_sell(market, new_buy.replace(amount = filled))
-                    place_order(market, previous_sell)
-                    buy_order = place_order(market, new_buy)
-                # If straddle becomes to big set re-buy order
-                elif should_rebuy(sell_orders, buy_order):
-                    if not is_top_bid(buy_order.price, df.Pbid[-1], df.Pask[-1]):
-                        logger.info("Straddle too big. Performing rebuy.")
-                        api.cancel_order(buy_order.id, market.name)
-                        new_buy = get_buy_order(market, obs, df).constrain_price(market)
-                        buy_order = place_order(market, new_buy.replace(amount = buy_order.amount))
+        poller = None if bus else MarketPoller(api, scheduler, settings['min_poll_interval'], settings['max_poll_interval'])
+        recorder = OrderBookRecorder(settings['record_dir']) if settings['record_dir'] else None
+
+        async def run_market(name):
+            # Tasks copy the context, this only applies to the market's own task
+            market_config.set(configs[name])
+            feed = None
+            try:
+                market = await scheduler.call(api.get_market, name)
+                if bus:
+                    feed = BusFeed(bus, market.name).start()
+                else:
+                    feed = poller.add(market.name, CONFIG['poll_interval'], book_depth())
+                await market_maker(market, feed, *account_requests(market, start_time), recorder)
+            except Exception as exception:
+                # One market stopping doesn't stop the others
+                logger.error("Stopped trading: {}".format(exception))
+                failed.append(name)
+            finally:
+                if isinstance(feed, BusFeed):
+                    feed.stop()
+
+        async def run():
+            if poller:
+                poller.start()
+            try:
+                await asyncio.gather(*(run_market(name) for name in configs))
+            finally:
+                if poller:
+                    poller.stop()
+        try:
+            asyncio.run(run())
+        finally:
+            if recorder:
+                recorder.close()
 
     except KeyboardInterrupt:
         logger.warning("Ctrl+C detected, exiting bot.")
     finally:
-        logger.info("Canceling bot buy order if any.")
-        try:
-            api.cancel_order(buy_order.id, market.name)
-        except:
-            pass
+        logger.info("Stage timings:\n" + REGISTRY.summary('makerbot_stage_seconds'))
+        exporter.close()
+        if journal:
+            journal.close()
+    return len(failed) < len(configs)
+
+def publish_markets(configs: dict, login: str, pwd: str, bus: str):
+    """ Poll the order books of the markets of configs and publish every
+        new one to the market data bus in directory bus, see bus.py.
+        Any number of run_markets processes read them from there without
+        sending a single order book request.
+        Returns False when every market stopped on an error.
+    """
+    global api, scheduler
+    settings = next(iter(configs.values()))
+    scheduler = RequestScheduler(settings['request_rate'], settings['request_burst'],
+                                 settings['retry_deadline'], io_pool, REGISTRY)
+    exporter = MetricsExporter(REGISTRY, settings['metrics_file'] or None, settings['metrics_port'] or None,
+                               settings['metrics_host'])
+    failed = []
+    try:
+        api = open_api(configs, login, pwd)
+        poller = MarketPoller(api, scheduler, settings['min_poll_interval'], settings['max_poll_interval'])
+
+        async def publish_market(name):
+            market_config.set(configs[name])
+            try:
+                writer = BusWriter(bus, name, CONFIG['max_obs_size'], CONFIG['obs_depth'], CONFIG['obs_dtype'])
+                async for update in poller.add(name, CONFIG['poll_interval'], book_depth()).subscribe():
+                    snapshot = book_snapshot(update.orderbook, CONFIG['obs_depth'], CONFIG['obs_dtype'])
+                    writer.write(update.time, update.orderbook.update_id, snapshot)
+            except Exception as exception:
+                logger.error("Stopped publishing: {}".format(exception))
+                failed.append(name)
+
+        async def run():
+            poller.start()
+            try:
+                await asyncio.gather(*(publish_market(name) for name in configs))
+            finally:
+                poller.stop()
+        logger.info("Publishing {} markets to {}".format(len(configs), bus))
+        asyncio.run(run())
+
+    except KeyboardInterrupt:
+        logger.warning("Ctrl+C detected, exiting publisher.")
+    finally:
+        exporter.close()
+    return len(failed) < len(configs)
+
+def market_configs(config_file: str, markets: list, overrides: dict = None) -> dict:
+    """ Configs of markets, with the overrides of every setting."""
+    return {name: MappingProxyType(dict(get_config(type_map, name, config_file, default_map), **(overrides or {})))
+            for name in markets}
+
+def run_worker(config_file: str, markets: list, login: str, pwd: str, bus: str, overrides: dict):
+    """ Entry point of the supervised processes trading markets."""
+    global CONFIG
+    configs = market_configs(config_file, markets, overrides)
+    CONFIG = ContextConfig()
+    setup_logger(next(iter(configs.values())), SUPERVISED_LOG_FORMAT)
+    # The supervisor restarts processes exiting with an error status
+    if not run_markets(configs, login, pwd, bus):
+        sys.exit(1)
+
+def run_publisher(config_file: str, markets: list, login: str, pwd: str, bus: str, overrides: dict):
+    """ Entry point of the supervised process publishing the market data."""
+    global CONFIG
+    configs = market_configs(config_file, markets, overrides)
+    CONFIG = ContextConfig()
+    setup_logger(next(iter(configs.values())), SUPERVISED_LOG_FORMAT)
+    if not publish_markets(configs, login, pwd, bus):
+        sys.exit(1)
+
+def process_overrides(settings, index: int, processes: int) -> dict:
+    """ Settings of the index'th of processes supervised processes: they
+        share the request budget and get their own metrics and journal.
+        The publisher, index 0, keeps the burst its order book polls need.
+    """
+    def own(path):
+        root, ext = os.path.splitext(path)
+        return "{}-{}{}".format(root, index, ext) if path else path
+    return {'request_rate': settings['request_rate'] / processes,
+            'request_burst': max(settings['request_burst'] / processes, 1 if index else 1 + HEADROOM),
+            'metrics_file': own(settings['metrics_file']),
+            'metrics_port': settings['metrics_port'] + index if settings['metrics_port'] else 0,
+            'journal_file': own(settings['journal_file']) if index else ''}
+
+def supervise(arguments):
+    """ Trade every market of the config file in worker processes, each
+        with its share of the markets. One more process polls the order
+        books and publishes them to the market data bus the workers read.
+        Crashed processes are restarted.
+    """
+    config_file = arguments['--config']
+    markets = get_markets(config_file)
+    if not markets:
+        raise Exception("No market sections in {}.".format(config_file))
+    settings = get_config(type_map, markets[0], config_file, default_map)
+    setup_logger(settings, SUPERVISED_LOG_FORMAT)
+    shards = shard(markets, min(int(arguments['--workers']) or os.cpu_count() or 1, len(markets)))
+    bus = settings['bus_dir'] or default_bus_dir()
+    login, pwd = ask_login(settings)
+    print("starting ...\n")
+    supervisor = Supervisor()
+    processes = len(shards) + 1
+    supervisor.add('publisher', run_publisher, config_file, markets, login, pwd, bus,
+                   process_overrides(settings, 0, processes))
+    for index, names in enumerate(shards, 1):
+        supervisor.add('worker-{}'.format(index), run_worker, config_file, names, login, pwd, bus,
+                       process_overrides(settings, index, processes))
+    logger.info("Trading {} markets in {} workers, market data bus in {}".format(len(markets), len(shards), bus))
+    supervisor.run()
+
+def ask_login(settings):
+    """ Nash login and password, None for the simulator."""
+    # The simulator has no accounts to log in to
+    if settings['env'] == 'simulator':
+        return None, None
+    return input('Nash login email: '), getpass('Nash login password: ')
+
+def main():
+    from docopt import docopt
+    arguments = docopt(__doc__, version=__version__)
+    print("Nash market maker bot, version {}\n".format(__version__))
+    if arguments['backtest']:
+        return backtest(arguments)
+    if arguments['sweep']:
+        return sweep(arguments)
+    if arguments['supervise']:
+        return supervise(arguments)
+    # Setup logger and config
+    global CONFIG
+    if arguments['start-all']:
+        # start-all trades every market section of the file, CONFIG resolves
+        # to the section of the market whose task is running
+        configs = {name: get_config(type_map, name, arguments['--config'], default_map)
+                   for name in get_markets(arguments['--config'])}
+        if not configs:
+            raise Exception("No market sections in {}.".format(arguments['--config']))
+        CONFIG = ContextConfig()
+        setup_logger(next(iter(configs.values())), MARKETS_LOG_FORMAT)
+    else:
+        CONFIG = get_config(type_map, arguments['<market>'], arguments['--config'], default_map)
+        configs = {CONFIG['market']: CONFIG}
+        setup_logger(CONFIG)
+    settings = next(iter(configs.values()))
+    login, pwd = ask_login(settings)
+    print("starting ...\n")
+    # With a bus_dir, a running supervise polls the order books for us
+    run_markets(configs, login, pwd, settings['bus_dir'] or None)
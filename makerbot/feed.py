@@ -0,0 +1,257 @@
+import time
+import asyncio
+import logging
+from typing import NamedTuple
+from .helpers import OrderBookSeries
+from .book import L2Book
+from .scheduler import RequestScheduler
+
+logger = logging.getLogger('pymaker')
+
+# Tokens MarketPoller leaves in the bucket for order and balance requests
+HEADROOM = 2
+
+
+class BookUpdate(NamedTuple):
+    """An order book as delivered by a feed.
+    time: wall clock arrival in ns, used as the OrderBookSeries timestamp
+    received: time.monotonic() on arrival, to measure reaction latency
+    """
+    orderbook: object
+    time: int
+    received: float
+
+
+class LatencyStats:
+    """Running summary of tick to decision latency in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, update: BookUpdate) -> float:
+        self.last = time.monotonic() - update.received
+        self.count += 1
+        self.total += self.last
+        self.max = max(self.max, self.last)
+        return self.last
+
+    def __str__(self):
+        mean = self.total / self.count if self.count else 0.0
+        return "{} ticks, tick to decision mean {:.1f}ms max {:.1f}ms".format(self.count, mean * 1e3, self.max * 1e3)
+
+
+class Subscription:
+    """Queue of updates for one consumer, iterate with async for."""
+
+    def __init__(self, feed):
+        self._feed = feed
+        self._queue = asyncio.Queue()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> BookUpdate:
+        return await self._queue.get()
+
+    async def get(self) -> BookUpdate:
+        return await self._queue.get()
+
+    def put(self, update: BookUpdate):
+        self._queue.put_nowait(update)
+
+    def drain(self) -> list:
+        """Return the updates already waiting without blocking."""
+        updates = []
+        while not self._queue.empty():
+            updates.append(self._queue.get_nowait())
+        return updates
+
+    def close(self):
+        self._feed.unsubscribe(self)
+
+
+class OrderBookFeed:
+    """Push based order book feed, every new update_id is delivered to all
+    subscriptions as soon as it is published.
+    This is also the in-process stand-in feed, call publish() to push books.
+    """
+
+    def __init__(self):
+        self.last_update_id = None
+        self.latency = LatencyStats()
+        self._subscriptions = []
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscriptions:
+            self._subscriptions.remove(subscription)
+
+    def publish(self, orderbook, arrival_ns: int = None) -> bool:
+        """Deliver the order book if its update_id is new, return if it was."""
+        if orderbook.update_id == self.last_update_id:
+            return False
+        self.last_update_id = orderbook.update_id
+        update = BookUpdate(orderbook, arrival_ns or time.time_ns(), time.monotonic())
+        for subscription in self._subscriptions:
+            subscription.put(update)
+        return True
+
+    async def replay(self, orderbooks, interval: float = 0):
+        """Publish order books one by one, handy to drive the bot locally."""
+        for orderbook in orderbooks:
+            self.publish(orderbook)
+            await asyncio.sleep(interval)
+
+
+class MarketPoller:
+    """Polls the order books of several markets through one scheduler and
+    pushes them to a feed per market.
+
+    Each market starts polling every interval. A poll returning a new
+    update_id halves the interval down to min_interval and one returning
+    the same book doubles it up to max_interval, so busy books are polled
+    fast and idle markets cost few requests out of the shared budget.
+    Polls wait while fewer than headroom tokens would be left in the
+    scheduler's bucket, so order and balance requests never queue behind them.
+    The bucket never holds more than its burst, headroom is lowered to
+    burst - 1 so polls can still run.
+    Markets added with a book_depth keep an L2Book from the API's order
+    book deltas and publish its top book_depth levels, with a new snapshot
+    requested on a gap.
+    """
+
+    def __init__(self, api, scheduler: RequestScheduler, min_interval: float = 0.05,
+                 max_interval: float = 5.0, headroom: float = HEADROOM):
+        self.api = api
+        self.scheduler = scheduler
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        burst = scheduler.bucket.burst
+        if scheduler.bucket.rate is not None and burst < 1:
+            raise Exception("request_burst must be at least 1 to poll order books.")
+        if scheduler.bucket.rate is not None and 1 + headroom > burst:
+            logger.warning("A request burst of {} leaves no headroom of {} tokens for order book polls, "
+                           "lowering it to {}".format(burst, headroom, burst - 1))
+            headroom = burst - 1
+        self.headroom = headroom
+        self.feeds = {}
+        self.books = {}
+        self._depths = {}
+        self._intervals = {}
+        # Loop time each market is due, inf while its poll is running
+        self._due = {}
+        self._polls = set()
+        self._wakeup = None
+        self._task = None
+
+    def add(self, market: str, interval: float = 0.100, book_depth: int = 0) -> OrderBookFeed:
+        """Start polling a market, returns the feed its books are pushed to."""
+        if market not in self.feeds:
+            self.feeds[market] = OrderBookFeed()
+            if book_depth:
+                self.books[market] = L2Book()
+                self._depths[market] = book_depth
+            self._intervals[market] = interval
+            self._due[market] = 0.0
+            self._wake()
+        return self.feeds[market]
+
+    def start(self):
+        self._task = asyncio.ensure_future(self.run())
+        return self
+
+    def stop(self):
+        for task in [self._task] + list(self._polls):
+            if task:
+                task.cancel()
+
+    def _wake(self):
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def poll_book(self, market: str):
+        """Top of the market's L2Book brought up to date."""
+        book = self.books[market]
+        if book.update_id is not None:
+            deltas = await self.scheduler.call(self.api.get_order_book_deltas, market, book.update_id, deadline = 0)
+            if deltas is not None and book.extend(deltas):
+                return book.top(self._depths[market])
+            logger.debug("Gap in the order book deltas of {}, requesting it again".format(market))
+        book.load(await self.scheduler.call(self.api.get_order_book, market, deadline = 0))
+        return book.top(self._depths[market])
+
+    async def poll(self, market: str):
+        # No retries, the next poll is the retry
+        try:
+            if market in self.books:
+                orderbook = await self.poll_book(market)
+            else:
+                orderbook = await self.scheduler.call(self.api.get_order_book, market, deadline = 0)
+        except Exception as exception:
+            logger.debug("Order book poll of {} failed: {}".format(market, exception))
+            changed = False
+        else:
+            changed = self.feeds[market].publish(orderbook)
+        interval = self._intervals[market]
+        if changed:
+            interval = max(interval / 2, self.min_interval)
+        else:
+            interval = min(interval * 2, self.max_interval)
+        self._intervals[market] = interval
+        self._due[market] = asyncio.get_event_loop().time() + interval
+        self._wake()
+
+    def interval(self, market: str) -> float:
+        """Current seconds between polls of a market."""
+        return self._intervals[market]
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            market = min(self._due, key=self._due.get, default=None)
+            wait = self._due[market] - loop.time() if market else float('inf')
+            if wait > 0:
+                # Sleep until a market is due, added or done polling
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait if wait < float('inf') else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait = self.scheduler.bucket.wait_time(1 + self.headroom)
+            if wait > 0:
+                self._due[market] = loop.time() + wait
+                continue
+            # Not due again until its poll is done, other markets go meanwhile
+            self._due[market] = float('inf')
+            task = asyncio.ensure_future(self.poll(market))
+            self._polls.add(task)
+            task.add_done_callback(self._polls.discard)
+            # Let the poll take its token before the headroom is checked again
+            await asyncio.sleep(0)
+
+
+async def bootstrap(subscription: Subscription, config, obs = None):
+    """Initiate a OrderBookSeries with updates from a feed subscription,
+    same as OrderBookSeries.bootstrap without polling.
+    obs: series to top up, e.g. a checkpoint, it gets at least one live update
+    """
+    obs = OrderBookSeries.create(config) if obs is None else obs
+    deadline = time.monotonic() + config["max_loading_time"]
+    live = 0
+    while len(obs.t) < config["min_history_points"] or not live:
+        try:
+            update = await asyncio.wait_for(subscription.get(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            break
+        obs = obs.update(update.orderbook, config['max_obs_size'], update.time)
+        live += 1
+    return obs
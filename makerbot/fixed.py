@@ -0,0 +1,56 @@
+import numpy as np
+from decimal import Context, Decimal
+
+# Prices and amounts are integers counting 1e-8 units, the finest
+# precision of Nash, so they are exact and compare as plain ints. They
+# are converted to the API strings only when sent.
+DIGITS = 8
+SCALE = 10 ** DIGITS
+_CONTEXT = Context(prec=50)
+
+
+def to_fixed(value) -> int:
+    """Fixed point value of a string, Decimal, int, float or numpy scalar.
+    Digits past the 8th are dropped, floats are rounded to the nearest unit.
+    """
+    if type(value) is str:
+        whole, _, fraction = value.partition('.')
+        # The API sends every digit, that is a single int() call
+        if len(fraction) == DIGITS:
+            return int(whole + fraction)
+        if 'e' not in value and 'E' not in value:
+            return int(whole + (fraction + '00000000')[:DIGITS]) if whole or fraction else 0
+    if type(value) is int:
+        return value * SCALE
+    if isinstance(value, float):
+        return int(round(value * SCALE))
+    if isinstance(value, np.floating):
+        # Scaled as a longdouble, float32 would lose units and longdouble digits
+        return int(np.rint(np.longdouble(value) * SCALE))
+    if isinstance(value, np.integer):
+        value = int(value)
+    return int(_CONTEXT.scaleb(Decimal(value), DIGITS))
+
+def from_fixed(value: int) -> str:
+    """API string of a fixed point value, without trailing zeros."""
+    whole, fraction = divmod(abs(value), SCALE)
+    text = '{}{}.{:08d}'.format('-' if value < 0 else '', whole, fraction)
+    return text.rstrip('0').rstrip('.')
+
+def to_decimal(value: int) -> Decimal:
+    return _CONTEXT.scaleb(Decimal(value), -DIGITS)
+
+def to_float(value: int) -> float:
+    return value / SCALE
+
+def fixed_mul(lhs: int, rhs: int) -> int:
+    """Product of two fixed point values, rounded down."""
+    return lhs * rhs // SCALE
+
+def fixed_div(lhs: int, rhs: int) -> int:
+    """Quotient of two fixed point values, rounded down."""
+    return lhs * SCALE // rhs
+
+def round_down(value: int, step: int) -> int:
+    """Largest multiple of step not above value, e.g. a price on the market's tick."""
+    return value - value % step
@@ -1,17 +1,21 @@
-import copy
 import time
+import logging
 import configparser
 import numpy as np
 from typing import NamedTuple
-from decimal import Decimal
-from datetime import datetime
+from functools import lru_cache
+from datetime import datetime, timezone
 from types import MappingProxyType
+from collections.abc import Mapping
+from contextvars import ContextVar
+from .fixed import to_fixed, round_down
 
 
-def get_config(type_map, market: str, configfile="config.ini"):
+def get_config(type_map, market: str, configfile="config.ini", defaults=None):
     """Creates a immutable proxy for a configuration a dict from config file
+    defaults: optional dict of string values used when a setting is missing
     """
-    parser = configparser.ConfigParser()
+    parser = configparser.ConfigParser(defaults)
     parser.read(configfile)
 
     config_mut = parser.defaults()
@@ -28,20 +32,54 @@ def get_config(type_map, market: str, configfile="config.ini"):
 
     return MappingProxyType(config_mut)
 
-def retry(func, max_tries = 16, timeout = 0.1):
-    """Helper to retry functions and preserve exceptions, handy for network calls."""
-    acm = 0
-    while True:
-        try:
-            return func()
-        except Exception as exception:        
-            if acm > max_tries:
-                raise exception
-            time.sleep(timeout * (2 ** acm))
-            acm += 1
-
-def parse_positive_decimal(value, label):
-    val = Decimal(str(value))
+def get_markets(configfile="config.ini") -> list:
+    """Names of the market sections in a config file."""
+    parser = configparser.ConfigParser()
+    parser.read(configfile)
+    return parser.sections()
+
+# Config of the market traded by the current task or thread, see ContextConfig
+market_config = ContextVar('market_config')
+
+class ContextConfig(Mapping):
+    """Config resolving to the market_config of the current context, lets
+    several markets share a module level CONFIG in one process.
+    Threads don't inherit the context, run work in them with copy_context().run.
+    """
+
+    def __getitem__(self, key):
+        return market_config.get()[key]
+
+    def __iter__(self):
+        return iter(market_config.get())
+
+    def __len__(self):
+        return len(market_config.get())
+
+class MarketLogFilter(logging.Filter):
+    """Adds the market of the current context to log records as %(market)s."""
+
+    def filter(self, record):
+        config = market_config.get(None)
+        record.market = config['market'] if config else '-'
+        return True
+
+def parse_time(value) -> float:
+    """Epoch seconds of an ISO 8601 time from the API, UTC unless the string
+    says otherwise. Numbers are taken as epoch seconds already, None stays None.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value if value is None else float(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def parse_positive_fixed(value, label, fixed = False):
+    """Fixed point value of value. ints are whole units, unless fixed is set
+    and they are taken as fixed point already.
+    """
+    val = value if fixed and type(value) is int else to_fixed(value)
     if val < 0:
         raise Exception("{} must be positive.".format(label))
     return val
@@ -52,8 +90,20 @@ def parse_str_option(string, options):
         raise Exception("Option must be one of {}".format(option, options))
     return option
 
+class CurrencyAmount(NamedTuple):
+    """Amount in the format of nash.CurrencyAmount, for the simulator when nash is not installed."""
+    amount: str
+    currency: str
+
 class Order:
-    """Immutable wrapper for Orders from the API that can save you from mistakes."""
+    """Immutable wrapper for Orders from the API that can save you from mistakes.
+    price, amount and amount_remaining are fixed point ints, see fixed.py.
+    The constructor and replace read them as values, e.g. Order('150.5', 1, 'BUY'),
+    from_fixed and replace_fixed take fixed point ints.
+    """
+
+    __slots__ = ('price', 'amount', 'buy_or_sell', 'amount_remaining', 'id', 'type',
+                 'cancellation_policy', 'allow_taker', 'placed_at', 'status')
 
     def __parse_buy_or_sell__(buy_or_sell):
         return parse_str_option(buy_or_sell, ('BUY', 'SELL'))
@@ -71,33 +121,37 @@ class Order:
         policies = ('FILL_OR_KILL', 'GOOD_TIL_CANCELLED', 'GOOD_TIL_TIME', 'IMMEDIATE_OR_CANCEL')
         return parse_str_option(cancellation_policy, policies)
 
-    parse_map = {'price': lambda val: parse_positive_decimal(val, 'price'),
-                 'amount': lambda val: parse_positive_decimal(val, 'amount'),
+    parse_map = {'price': lambda val: parse_positive_fixed(val, 'price'),
+                 'amount': lambda val: parse_positive_fixed(val, 'amount'),
                  'buy_or_sell': __parse_buy_or_sell__,
-                 'amount_remaining': lambda val: parse_positive_decimal(val, 'amount_remaining'),
+                 'amount_remaining': lambda val: parse_positive_fixed(val, 'amount_remaining'),
                  'id': __parse_id__,
                  'type': __parse_type__,
                  'cancellation_policy': __parse_policy__,
                  'allow_taker': bool,
-                 'placed_at': lambda val: val,
+                 'placed_at': parse_time,
                  'status': __parse_status__}
+    fixed_parse_map = {**parse_map,
+                       'price': lambda val: parse_positive_fixed(val, 'price', True),
+                       'amount': lambda val: parse_positive_fixed(val, 'amount', True),
+                       'amount_remaining': lambda val: parse_positive_fixed(val, 'amount_remaining', True)}
 
     def __init__(self,
-                 price: Decimal,
-                 amount: Decimal,
+                 price: int,
+                 amount: int,
                  buy_or_sell: str,
-                 amount_remaining: Decimal = -1,
+                 amount_remaining: int = -1,
                  id: str = '-1',
                  type: str = 'LIMIT',
                  cancellation_policy: str = 'GOOD_TIL_CANCELLED',
                  allow_taker: bool = True,
-                 placed_at: datetime = None,
+                 placed_at: float = None,
                  status: str = 'PENDING'):
 
-        amount_remaining = Decimal(amount_remaining if amount_remaining != -1 else amount)
+        amount_remaining = amount_remaining if amount_remaining != -1 else amount
 
         object.__setattr__(self, 'price', self.parse_map['price'](price))
-        object.__setattr__(self, 'amount', self.parse_map['price'](amount))
+        object.__setattr__(self, 'amount', self.parse_map['amount'](amount))
         object.__setattr__(self, 'buy_or_sell', self.parse_map['buy_or_sell'](buy_or_sell))
         object.__setattr__(self, 'amount_remaining', self.parse_map['amount_remaining'](amount_remaining))
         object.__setattr__(self, 'id', self.parse_map['id'](id))
@@ -113,25 +167,65 @@ class Order:
     def __delattr__(self, *args):
         raise TypeError
 
+    def __reduce__(self):
+        return (Order.trusted, tuple(getattr(self, key) for key in self.__slots__))
+
+    def trusted(price: int, amount: int, buy_or_sell: str, amount_remaining: int,
+                id: str, type: str, cancellation_policy: str, allow_taker: bool,
+                placed_at: float, status: str):
+        """Build an Order from values that are already valid, skipping parsing."""
+        order = object.__new__(Order)
+        setattr_ = object.__setattr__
+        setattr_(order, 'price', price)
+        setattr_(order, 'amount', amount)
+        setattr_(order, 'buy_or_sell', buy_or_sell)
+        setattr_(order, 'amount_remaining', amount_remaining)
+        setattr_(order, 'id', id)
+        setattr_(order, 'type', type)
+        setattr_(order, 'cancellation_policy', cancellation_policy)
+        setattr_(order, 'allow_taker', allow_taker)
+        setattr_(order, 'placed_at', placed_at)
+        setattr_(order, 'status', status)
+        return order
+
+    def from_fixed(price: int, amount: int, buy_or_sell: str, amount_remaining: int = -1, **kwargs):
+        """Build an Order like the constructor, from fixed point price and amounts."""
+        amount_remaining = amount_remaining if amount_remaining != -1 else amount
+        return Order(0, 0, buy_or_sell, **kwargs).replace_fixed(price = price, amount = amount,
+                                                                amount_remaining = amount_remaining)
+
     def replace(self, **kwargs):
-        new_order = copy.deepcopy(self)
-        for key in kwargs:
-            object.__setattr__(new_order, key, self.parse_map[key](kwargs[key]))
+        """Shallow copy with the given fields changed, only those are parsed.
+        Prices and amounts are read as values, like the constructor does.
+        """
+        return self._replace(self.parse_map, kwargs)
+
+    def replace_fixed(self, **kwargs):
+        """Same as replace, with prices and amounts given as fixed point ints."""
+        return self._replace(self.fixed_parse_map, kwargs)
+
+    def _replace(self, parse_map: dict, kwargs: dict):
+        new_order = object.__new__(Order)
+        for key in self.__slots__:
+            if key in kwargs:
+                object.__setattr__(new_order, key, parse_map[key](kwargs[key]))
+            else:
+                object.__setattr__(new_order, key, getattr(self, key))
         return new_order
 
     def constrain_price(self, market):
         """ Constrain order price to market settings
         """
-        prc = self.price.quantize(Decimal(market.min_trade_increment_b), rounding='ROUND_DOWN')
-        return self.replace(price = prc)
+        prc = round_down(self.price, to_fixed(market.min_trade_increment_b))
+        return self.replace_fixed(price = prc)
 
-    def constrain_amount(self, market, max_amount: Decimal):
+    def constrain_amount(self, market, max_amount: int):
         """ Constrain order amount to user and market settings
         """
-        amt = min(self.amount, max_amount).quantize(Decimal(market.min_trade_increment), rounding='ROUND_DOWN')
-        return self.replace(amount = amt)
+        amt = round_down(min(self.amount, max_amount), to_fixed(market.min_trade_increment))
+        return self.replace_fixed(amount = amt)
 
-    def constrain(self, market, max_amount: Decimal):
+    def constrain(self, market, max_amount: int):
         """ Takes an order and constrain it to market and user settings
             order: is the order to be formated
             mkt: is the market object from API call
@@ -140,16 +234,102 @@ class Order:
         return self.constrain_price(market).constrain_amount(market, max_amount)
 
     def from_api(order):
-        """Format the API object to a more usefull format with Decimal."""
-        return Order(price = Decimal(order.limit_price.amount),
-                     amount = Decimal(order.amount.amount),
-                     buy_or_sell = order.buy_or_sell,
-                     amount_remaining = Decimal(order.amount_remaining.amount),
-                     id = order.id,
-                     type = order.type,
-                     cancellation_policy = order.cancellation_policy,
-                     placed_at = order.placed_at,
-                     status = order.status)
+        """Format the API object to a more usefull format with fixed point.
+        The API already validates its orders so they are not parsed again.
+        """
+        return Order.trusted(to_fixed(order.limit_price.amount),
+                             to_fixed(order.amount.amount),
+                             order.buy_or_sell,
+                             to_fixed(order.amount_remaining.amount),
+                             str(order.id),
+                             order.type,
+                             order.cancellation_policy,
+                             True,
+                             parse_time(order.placed_at),
+                             order.status)
+
+# Order book snapshot layout, one row per level. Bids are reversed so both
+# tops are the logical next in a deck
+OBS_FIELDS = ('Pask', 'Qask', 'Pbid', 'Qbid')
+OBS_DTYPE = [(field, '<f16') for field in OBS_FIELDS]
+OBS_DEPTH = 25
+# Float types that can be used to store snapshots
+FLOAT_TYPES = {'float32': np.float32, 'float64': np.float64, 'longdouble': np.longdouble}
+
+@lru_cache(maxsize=None)
+def obs_dtype(float_type=np.longdouble) -> np.dtype:
+    """Snapshot row dtype storing every field as float_type."""
+    return np.dtype([(field, float_type) for field in OBS_FIELDS])
+
+def parse_float_type(name: str):
+    option = name.strip().lower()
+    if option not in FLOAT_TYPES:
+        raise Exception("Float type must be one of {}".format(tuple(FLOAT_TYPES)))
+    return FLOAT_TYPES[option]
+
+def book_snapshot(orderbook, depth: int = OBS_DEPTH, float_type=np.longdouble) -> np.ndarray:
+    """Parse the top depth levels of an API order book into a snapshot row.
+    All price and amount strings are converted by numpy in a single call.
+    """
+    # Tops of books kept from deltas are already parsed, see book.py
+    if hasattr(orderbook, 'to_snapshot'):
+        return orderbook.to_snapshot(depth, float_type)
+    data = np.full(depth, np.nan, dtype=obs_dtype(float_type))
+    asks = orderbook.asks[:depth]
+    bids = orderbook.bids[:-depth - 1:-1]
+
+    levels = np.array([(lvl.price.amount, lvl.amount.amount) for lvl in [*asks, *bids]],
+                      dtype=float_type).reshape(-1, 2)
+    data['Pask'][:len(asks)] = levels[:len(asks), 0]
+    data['Qask'][:len(asks)] = levels[:len(asks), 1]
+    data['Pbid'][:len(bids)] = levels[len(asks):, 0]
+    data['Qbid'][:len(bids)] = levels[len(asks):, 1]
+    return data
+
+def window_start(t: np.ndarray, seconds: float) -> int:
+    """Index of the first time in t newer than seconds before the last one.
+    t must be sorted, which holds for every order book series.
+    """
+    since = t[-1] - np.timedelta64(int(seconds * 1e9), 'ns')
+    return int(np.searchsorted(t, since, side='right'))
+
+class RingBuffer:
+    """Fixed capacity buffer with O(1) append and a chronologically ordered view.
+
+    Every row is written twice, at i and i + capacity, so the most recent
+    rows are always one contiguous slice of the storage and view() never copies.
+    """
+
+    def __init__(self, capacity: int, dtype, shape: tuple = ()):
+        if capacity < 1:
+            raise Exception("RingBuffer capacity must be at least 1.")
+        self.capacity = capacity
+        self._buf = np.empty((2 * capacity,) + tuple(shape), dtype=dtype)
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, value):
+        idx = self._count % self.capacity
+        self._buf[idx] = value
+        self._buf[idx + self.capacity] = value
+        self._count += 1
+
+    def extend(self, values: np.ndarray):
+        """Append rows at once, only the last capacity ones are kept."""
+        values = values[len(values) - self.capacity:] if len(values) > self.capacity else values
+        idx = (self._count + np.arange(len(values))) % self.capacity
+        self._buf[idx] = values
+        self._buf[idx + self.capacity] = values
+        self._count += len(values)
+
+    def view(self) -> np.ndarray:
+        """Return the stored rows, oldest first, as a view on the buffer."""
+        if not self._count:
+            return self._buf[:0]
+        end = (self._count - 1) % self.capacity + self.capacity + 1
+        return self._buf[end - len(self):end]
 
 class OrderBookSeries(NamedTuple):
     """A fixed size data ordered 3d numpy array and a 1d time array
@@ -157,52 +337,119 @@ class OrderBookSeries(NamedTuple):
     data = (ask prices, askamount, bids, bids_amount)
     """
     t: np.ndarray = np.zeros((0), dtype="datetime64[ns]")
-    data: np.ndarray = np.zeros((0, 25), dtype=[('Pask', '<f16'), ('Qask', '<f16'), ('Pbid', '<f16'), ('Qbid', '<f16')])
+    data: np.ndarray = np.zeros((0, OBS_DEPTH), dtype=OBS_DTYPE)
 
-    def update(self, orderbook, max_obs_size):
+    def update(self, orderbook, max_obs_size, t: int = None):
         """Return updated OrderBookSeries.
         It adds most recent state and remove oldest from OrderBookSeries if
         size conditions are exceeded keeping memory constraints in check
+        t: snapshot time in ns, defaults to now
         """
-        # Reverse bids because we want to both tops be the logical next in a deck
-        depth = 25
-        data = np.full(depth, np.nan, dtype=[('Pask', '<f16'), ('Qask', '<f16'), ('Pbid', '<f16'), ('Qbid', '<f16')])
-
-        if len(orderbook.asks) + len(orderbook.bids):
-            for idx, ask in enumerate(orderbook.asks):
-                if idx == depth: break
-                data['Pask'][idx] = np.longfloat(ask.price.amount)
-                data['Qask'][idx] = np.longfloat(ask.amount.amount)
-
-            for idx, bid in enumerate(orderbook.bids[::-1]):
-                if idx == depth: break
-                data['Pbid'][idx] = np.longfloat(bid.price.amount)
-                data['Qbid'][idx] = np.longfloat(bid.amount.amount)
+        depth = self.data.shape[1]
+        data = book_snapshot(orderbook, depth, self.data.dtype[0].type)
 
         # Build orderbook series data
-        new_obs = OrderBookSeries(np.append(self.t, np.datetime64(time.time_ns(), "ns")),
+        new_obs = OrderBookSeries(np.append(self.t, np.datetime64(t or time.time_ns(), "ns")),
                                   np.append(self.data, data).reshape(self.data.shape[0] + 1, depth))
         # Drop old data if at size limit
         if new_obs.t.shape[0] <= max_obs_size:
             return new_obs
         return OrderBookSeries(new_obs.t[1:], new_obs.data[1:])
 
-    def bootstrap(api, config):
-        """Initiate a OrderBookSeries with data from market."""
+    def extend(self, t: np.ndarray, data: np.ndarray, max_obs_size: int):
+        """Return OrderBookSeries with the snapshots of t and data appended."""
+        return OrderBookSeries(np.concatenate([self.t, t])[-max_obs_size:],
+                               np.concatenate([self.data, data.astype(self.data.dtype)])[-max_obs_size:])
+
+    def window(self, seconds: float):
+        """OrderBookSeries of the snapshots in the last seconds, as views."""
+        start = window_start(self.t, seconds)
+        return OrderBookSeries(self.t[start:], self.data[start:])
+
+    def empty(depth: int = OBS_DEPTH, float_type=np.longdouble):
+        """Empty OrderBookSeries storing depth levels as float_type."""
+        return OrderBookSeries(np.zeros((0), dtype="datetime64[ns]"),
+                               np.zeros((0, depth), dtype=obs_dtype(float_type)))
+
+    def create(config):
+        """Empty order book series with the backend, depth and dtype from config."""
+        depth = config.get('obs_depth', OBS_DEPTH)
+        float_type = config.get('obs_dtype', np.longdouble)
+        if config.get('obs_backend', 'APPEND') == 'RING':
+            return OrderBookRing(config['max_obs_size'], depth, float_type)
+        return OrderBookSeries.empty(depth, float_type)
+
+    def bootstrap(api, config, scheduler = None):
+        """Initiate a OrderBookSeries with data from market.
+        Requests are paced by the scheduler when given, by a 100ms delay otherwise.
+        """
         # Populate the initial entries so that temporal derivatives are
         # meaningful and we can compute temporal statistics
-        obs = OrderBookSeries()
+        obs = OrderBookSeries.create(config)
         update_id = -1
         before = time.time()
         while (len(obs.t) < config["min_history_points"]) and (time.time() - before < config["max_loading_time"]):
             # Guard against network issues
             try:
-                orderbook = api.get_order_book(config["market"])
+                if scheduler:
+                    orderbook = scheduler.run(api.get_order_book, config["market"], deadline = 0)
+                else:
+                    orderbook = api.get_order_book(config["market"])
             except:
                 continue
             if orderbook.update_id != update_id:
                 obs = obs.update(orderbook, config['max_obs_size'])
                 update_id = orderbook.update_id
             # Avoid rate limit, give 100ms delay
-            time.sleep(0.100)
-        return obs
\ No newline at end of file
+            if not scheduler:
+                time.sleep(0.100)
+        return obs
+
+class OrderBookRing:
+    """Circular buffer backend with the same interface as OrderBookSeries.
+    Memory is allocated once for max_obs_size snapshots and update() is O(1),
+    t and data are chronologically ordered views on the buffer.
+    """
+
+    def __init__(self, max_obs_size: int, depth: int = OBS_DEPTH, float_type=np.longdouble):
+        self.depth = depth
+        self.float_type = float_type
+        self._t = RingBuffer(max_obs_size, "datetime64[ns]")
+        self._data = RingBuffer(max_obs_size, obs_dtype(float_type), (depth,))
+        # Window start indexes for the current tick, by window length
+        self._windows = {}
+
+    @property
+    def t(self) -> np.ndarray:
+        return self._t.view()
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data.view()
+
+    def update(self, orderbook, max_obs_size=None, t: int = None):
+        """Add the most recent state in place, overwriting the oldest when full.
+        max_obs_size is ignored, capacity is fixed on creation.
+        t: snapshot time in ns, defaults to now
+        """
+        self._data.append(book_snapshot(orderbook, self.depth, self.float_type))
+        self._t.append(np.datetime64(t or time.time_ns(), "ns"))
+        self._windows.clear()
+        return self
+
+    def extend(self, t: np.ndarray, data: np.ndarray, max_obs_size=None):
+        """Append the snapshots of t and data in place."""
+        self._data.extend(data.astype(obs_dtype(self.float_type)))
+        self._t.extend(t)
+        self._windows.clear()
+        return self
+
+    def window(self, seconds: float) -> OrderBookSeries:
+        """OrderBookSeries of the snapshots in the last seconds, as views.
+        The bounds are searched once per tick and shared by every caller.
+        """
+        t = self.t
+        if seconds not in self._windows:
+            self._windows[seconds] = window_start(t, seconds)
+        start = self._windows[seconds]
+        return OrderBookSeries(t[start:], self.data[start:])
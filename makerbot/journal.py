@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from .helpers import Order
+
+logger = logging.getLogger('pymaker')
+
+# One JSON object per line, each with the ns timestamp "ts", the entry
+# "kind" and the market. Prices and amounts are fixed point ints, see fixed.py.
+KINDS = ('place', 'cancel', 'fill', 'balance', 'decision')
+
+
+def _encode(value):
+    """JSON form of the values json doesn't know, orders and numpy scalars."""
+    if isinstance(value, Order):
+        return {name: getattr(value, name) for name in Order.__slots__}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError("Can't journal {!r}".format(value))
+
+def _ends_line(path: str) -> bool:
+    with open(path, 'rb') as existing:
+        existing.seek(-1, os.SEEK_END)
+        return existing.read(1) == b'\n'
+
+
+class Journal:
+    """Append only journal of what the bot did, in JSON lines.
+
+    write() only queues the entry, a background thread encodes and appends
+    it and fsyncs at most every fsync_interval seconds, so many entries
+    share one sync and the disk never blocks the trading loop. When the
+    queue is full entries are dropped and counted.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = 1.0, max_queue: int = 100000):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._file = open(path, 'a')
+        if self._file.tell() and not _ends_line(path):
+            # The last entry was cut by a crash, the next one starts its own line
+            self._file.write('\n')
+        self._thread = threading.Thread(target=self._run, name='makerbot-journal', daemon=True)
+        self._thread.start()
+
+    def write(self, kind: str, market: str, **fields):
+        try:
+            self._queue.put_nowait((time.time_ns(), kind, market, fields))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        out, synced, dirty = self._file, time.monotonic(), False
+        while True:
+            try:
+                item = self._queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                item = False
+            if item:
+                ts, kind, market, fields = item
+                out.write(json.dumps(dict(fields, ts=ts, kind=kind, market=market),
+                                     default=_encode, separators=(',', ':')) + '\n')
+                dirty = True
+            if dirty and (item is None or time.monotonic() - synced >= self.fsync_interval):
+                self._sync()
+                synced, dirty = time.monotonic(), False
+            if item is None:
+                break
+
+    def _sync(self):
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError as exception:
+            logger.error("Failed to write journal {}: {}".format(self.path, exception))
+
+    def close(self):
+        """Write and sync what is queued."""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+        if self.dropped:
+            logger.warning("Dropped {} journal entries".format(self.dropped))
+
+
+def read_journal(path: str, kinds=None, market: str = None):
+    """Entries of a journal as dicts, only of the given kinds and market if set.
+    A line cut by a crash at the end of the file is skipped.
+    """
+    with open(path) as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if (kinds is None or entry['kind'] in kinds) and (market is None or entry['market'] == market):
+                yield entry
+
+def journal_frame(path: str, kind: str, market: str = None):
+    """pandas DataFrame of the entries of one kind, indexed by time.
+    e.g. the fills to compute a PnL from: journal_frame(path, 'fill').
+    """
+    import pandas as pd
+    frame = pd.DataFrame(list(read_journal(path, (kind,), market)))
+    if not len(frame):
+        return frame
+    return frame.set_index(pd.to_datetime(frame.pop('ts'), unit='ns'))
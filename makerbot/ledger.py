@@ -0,0 +1,106 @@
+from .fixed import SCALE, from_fixed
+
+
+class Ledger:
+    """Inventory, funds in flight and PnL of a market, updated in O(1) on
+    every order event so the loop and the risk checks never sum the orders.
+
+    An OrderTracker reports orders opening, closing and filling. Amounts
+    and prices are fixed point, see fixed.py, quote values are kept as
+    exact products scaled by SCALE twice and read rounded down. Inventory
+    is the base bought minus sold since the ledger started, at its average
+    cost. Sells beyond it open a short position the same way.
+    """
+
+    def __init__(self):
+        self.inventory = 0
+        # Base left to fill on open buys and sells
+        self.buying = 0
+        self.selling = 0
+        self.fills = 0
+        self.mark_price = None
+        self._cost = 0
+        self._funds = 0
+        self._realized = 0
+
+    def opened(self, order):
+        """An order started resting on the book."""
+        self._funds += order.amount_remaining * order.price
+        if order.buy_or_sell == 'BUY':
+            self.buying += order.amount_remaining
+        else:
+            self.selling += order.amount_remaining
+
+    def closed(self, order):
+        """An opened order left the book or is about to change."""
+        self._funds -= order.amount_remaining * order.price
+        if order.buy_or_sell == 'BUY':
+            self.buying -= order.amount_remaining
+        else:
+            self.selling -= order.amount_remaining
+
+    def filled(self, order, amount: int):
+        """amount more of an order filled at its price."""
+        change = amount if order.buy_or_sell == 'BUY' else -amount
+        position = self.inventory
+        if position and (position > 0) != (change > 0):
+            # Close at the average cost first, the rest opens the other way
+            sign = 1 if position > 0 else -1
+            closing = min(amount, abs(position))
+            cost = self._cost * closing // abs(position)
+            self._realized += sign * closing * order.price - cost
+            self._cost -= cost
+            change += sign * closing
+            position -= sign * closing
+        self._cost += change * order.price
+        self.inventory = position + change
+        self.fills += 1
+
+    def mark(self, price: int):
+        """Value the inventory at price from now on, e.g. the microprice."""
+        self.mark_price = price
+
+    @property
+    def funds_in_flight(self) -> int:
+        """Quote value of the open orders."""
+        return self._funds // SCALE
+
+    @property
+    def exposure(self) -> int:
+        """Base held once every open buy filled."""
+        return self.inventory + self.buying
+
+    @property
+    def average_cost(self) -> int:
+        """Average price paid for the inventory, 0 without one."""
+        return self._cost // self.inventory if self.inventory else 0
+
+    @property
+    def realized(self) -> int:
+        """Quote gained closing positions."""
+        return self._realized // SCALE
+
+    def _unrealized(self) -> int:
+        if self.mark_price is None:
+            return 0
+        return self.inventory * self.mark_price - self._cost
+
+    @property
+    def unrealized(self) -> int:
+        """Quote the inventory would gain at the mark price."""
+        return self._unrealized() // SCALE
+
+    @property
+    def pnl(self) -> int:
+        """Realized and unrealized quote."""
+        return (self._realized + self._unrealized()) // SCALE
+
+    def values(self) -> dict:
+        """The figures as a dict, e.g. to journal them."""
+        return {'inventory': self.inventory, 'exposure': self.exposure, 'average_cost': self.average_cost,
+                'funds_in_flight': self.funds_in_flight, 'realized': self.realized,
+                'unrealized': self.unrealized, 'pnl': self.pnl}
+
+    def __str__(self):
+        return "inventory {} at {}, realized {}, unrealized {}".format(
+            from_fixed(self.inventory), from_fixed(self.average_cost), from_fixed(self.realized), from_fixed(self.unrealized))
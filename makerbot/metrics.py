@@ -0,0 +1,129 @@
+import numpy as np
+from .helpers import RingBuffer
+
+# Columns kept for every snapshot, the same as get_obs_dataframe plus the
+# rolling statistics of the midprice
+METRICS_DTYPE = [('Pask', 'f8'), ('Qask', 'f8'), ('Pbid', 'f8'), ('Qbid', 'f8'),
+                 ('I', 'f8'), ('Pmid', 'f8'), ('Pmicro', 'f8'), ('sma', 'f8'), ('std', 'f8')]
+# Rebuild the running sums from the window every this many appends so
+# floating point drift can't accumulate over long sessions
+RESYNC_INTERVAL = 4096
+METRICS_COLUMNS = frozenset(name for name, _ in METRICS_DTYPE)
+
+
+class MarketMetrics:
+    """Top of book metrics updated in O(1) for every new snapshot.
+
+    Columns are exposed as chronologically ordered numpy views, so
+    metrics.Pmicro[-1] reads the same value as get_obs_dataframe(obs).Pmicro[-1]
+    without building a DataFrame. sma and std are the rolling mean and
+    sample standard deviation of Pmid over the last window snapshots.
+    """
+
+    def __init__(self, max_obs_size: int, window: int = 20, k: int = 2):
+        if window > max_obs_size:
+            raise Exception("Metrics window can't be larger than max_obs_size.")
+        self.window = window
+        self.k = k
+        self._t = RingBuffer(max_obs_size, "datetime64[ns]")
+        self._rows = RingBuffer(max_obs_size, METRICS_DTYPE)
+        # Sums are kept relative to an anchor price to avoid cancellation
+        self._anchor = None
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._nans = 0
+
+    def from_series(obs, window: int = 20, k: int = 2, max_obs_size: int = None):
+        """Build metrics for all the snapshots already in a OrderBookSeries."""
+        metrics = MarketMetrics(max_obs_size or max(len(obs.t), window), window, k)
+        for t, snapshot in zip(obs.t, obs.data):
+            metrics.append(t, snapshot)
+        return metrics
+
+    def __len__(self):
+        return len(self._rows)
+
+    def update(self, obs):
+        """Add the latest snapshot of the OrderBookSeries."""
+        self.append(obs.t[-1], obs.data[-1])
+        return self
+
+    def append(self, t, snapshot):
+        pask, qask = float(snapshot['Pask'][0]), float(snapshot['Qask'][0])
+        pbid, qbid = float(snapshot['Pbid'][0]), float(snapshot['Qbid'][0])
+        pmid = (pask + pbid) / 2.0
+        imbalance = qbid / (qbid + qask) if qbid + qask else np.nan
+        pmicro = (pask * imbalance) + (pbid * (1 - imbalance))
+
+        # Slide the window, the leaving value is still in the buffer
+        pmids = self._rows.view()['Pmid']
+        if len(pmids) >= self.window:
+            self._remove(pmids[-self.window])
+        self._add(pmid)
+        sma, std = self._stats(min(len(pmids) + 1, self.window))
+        self._rows.append((pask, qask, pbid, qbid, imbalance, pmid, pmicro, sma, std))
+        self._t.append(t)
+        if not self._rows._count % RESYNC_INTERVAL:
+            self._resync()
+        return self
+
+    def _add(self, value):
+        if np.isnan(value):
+            self._nans += 1
+            return
+        if self._anchor is None:
+            self._anchor = value
+        value -= self._anchor
+        self._sum += value
+        self._sumsq += value * value
+
+    def _remove(self, value):
+        if np.isnan(value):
+            self._nans -= 1
+            return
+        value -= self._anchor
+        self._sum -= value
+        self._sumsq -= value * value
+
+    def _resync(self):
+        pmids = self._rows.view()['Pmid'][-self.window:]
+        finite = pmids[~np.isnan(pmids)]
+        self._nans = len(pmids) - len(finite)
+        self._anchor = float(finite.mean()) if len(finite) else None
+        finite = finite - (self._anchor or 0.0)
+        self._sum = float(finite.sum())
+        self._sumsq = float((finite * finite).sum())
+
+    def _stats(self, size):
+        """Rolling mean and standard deviation, NaN like pandas until the window is full."""
+        if size < self.window or self._nans:
+            return np.nan, np.nan
+        mean = self._sum / self.window
+        if self.window < 2:
+            return self._anchor + mean, np.nan
+        var = (self._sumsq - self.window * mean * mean) / (self.window - 1)
+        return self._anchor + mean, np.sqrt(max(var, 0.0))
+
+    @property
+    def t(self) -> np.ndarray:
+        return self._t.view()
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self._rows.view()
+
+    def __getattr__(self, name):
+        # Column views, e.g. metrics.Pmicro or metrics.sma
+        if name in METRICS_COLUMNS:
+            return self._rows.view()[name]
+        raise AttributeError(name)
+
+    def bands(self):
+        """Latest Bollinger bands (sma, upper, lower) on midprice, see bollinger_bands."""
+        last = self._rows.view()[-1]
+        kstd = last['std'] * self.k
+        return last['sma'], last['sma'] + kstd, last['sma'] - kstd
+
+    def last(self, count: int):
+        """Return views on the time and rows of the last count snapshots."""
+        return self._t.view()[-count:], self._rows.view()[-count:]
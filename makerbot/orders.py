@@ -0,0 +1,174 @@
+from bisect import bisect_left, insort
+from .helpers import Order
+from .ledger import Ledger
+
+ACTIVE = ('OPEN', 'PENDING')
+
+
+class OrderTracker:
+    """Our own orders kept in process and indexed by side and status.
+
+    It is updated from place and cancel results and from the API listings,
+    so the loop doesn't need to list and parse every order of the session
+    on each tick. Lookups used by the strategy are O(1) or O(log n).
+    on_fill(order, amount) is called when an update shows amount more of
+    an order filled, at the order's price. The ledger follows every open
+    order and fill.
+    """
+
+    def __init__(self, on_fill = None, ledger: Ledger = None):
+        self.on_fill = on_fill
+        self.ledger = Ledger() if ledger is None else ledger
+        self._orders = {}
+        # (side, status) -> {id: Order}
+        self._index = {}
+        # Insertion order, the last buy is the most recent one
+        self._seq = {}
+        self._last_buy = None
+        # Active sells as sorted (price, seq, id) tuples
+        self._sells = []
+        # Cancelled because a listing missed them, they may have filled
+        self._unconfirmed = set()
+        # Orders tracked so far, pruned ones included
+        self.tracked = 0
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __contains__(self, order_id):
+        return order_id in self._orders
+
+    def get(self, order_id) -> Order:
+        return self._orders.get(order_id)
+
+    def _remove(self, order: Order):
+        del self._index[(order.buy_or_sell, order.status)][order.id]
+        if order.buy_or_sell == 'SELL' and order.status in ACTIVE:
+            sells = self._sells
+            del sells[bisect_left(sells, (order.price, self._seq[order.id], order.id))]
+        if order.status == 'OPEN':
+            self.ledger.closed(order)
+
+    def _insert(self, order: Order):
+        self._index.setdefault((order.buy_or_sell, order.status), {})[order.id] = order
+        if order.buy_or_sell == 'SELL' and order.status in ACTIVE:
+            insort(self._sells, (order.price, self._seq[order.id], order.id))
+        if order.status == 'OPEN':
+            self.ledger.opened(order)
+
+    def upsert(self, order: Order) -> Order:
+        """Add or update an order, keyed by its id."""
+        previous = self._orders.get(order.id)
+        if previous:
+            self._remove(previous)
+        else:
+            self._seq[order.id] = self.tracked
+            self.tracked += 1
+            if order.buy_or_sell == 'BUY':
+                self._last_buy = order.id
+        self._orders[order.id] = order
+        self._insert(order)
+        if previous and order.amount_remaining < previous.amount_remaining:
+            self.ledger.filled(order, previous.amount_remaining - order.amount_remaining)
+            if self.on_fill:
+                self.on_fill(order, previous.amount_remaining - order.amount_remaining)
+        return order
+
+    def placed(self, order: Order) -> Order:
+        """Track an order we just placed, nothing of it is filled yet."""
+        return self.upsert(order.replace_fixed(status = 'PENDING', amount_remaining = order.amount))
+
+    def cancelled(self, order_id) -> Order:
+        """Mark an order we cancelled."""
+        order = self._orders.get(order_id)
+        if order and order.status in ACTIVE:
+            return self.upsert(order.replace(status = 'CANCELLED'))
+        return order
+
+    def sync_active(self, api_orders, known: int = None) -> list:
+        """Update from the API listing of OPEN and PENDING orders.
+        known is self.tracked when the listing was requested, orders tracked
+        later may be missing from it. Active orders known before that are not
+        listed anymore filled or were cancelled, expired or rejected by the
+        exchange, even the ones no listing showed yet. They are closed as
+        cancelled without booking a fill and returned, confirm them with a
+        FILLED listing. The ones we cancelled were already marked.
+        """
+        known = self.tracked if known is None else known
+        listed = set()
+        for api_order in api_orders:
+            order = Order.from_api(api_order)
+            listed.add(order.id)
+            self._update_from_api(order)
+        closed = []
+        for order in self.by_status(*ACTIVE):
+            if self._seq[order.id] < known and order.id not in listed:
+                self._unconfirmed.add(order.id)
+                closed.append(self.upsert(order.replace(status = 'CANCELLED')))
+        return closed
+
+    def confirm(self, api_orders):
+        """Update from an API listing of FILLED orders, e.g. placed since the
+        oldest order sync_active closed. Those not in it stay cancelled until
+        the next reconcile.
+        """
+        for order in sorted((Order.from_api(api_order) for api_order in api_orders), key = lambda o: o.placed_at):
+            self._update_from_api(order)
+
+    def reconcile(self, api_orders, known: int = None):
+        """Align with a full API listing of the session's OPEN, PENDING and
+        FILLED orders, known as for sync_active. Orders closed without a
+        confirmed fill are corrected, active orders known before the listing
+        and missing from it were cancelled by the exchange. Closed orders no
+        later listing can change are then pruned, except the last buy.
+        """
+        known = self.tracked if known is None else known
+        orders = [Order.from_api(api_order) for api_order in api_orders]
+        listed = set(order.id for order in orders)
+        for order in sorted(orders, key = lambda o: o.placed_at):
+            self._update_from_api(order)
+        for order in self.by_status(*ACTIVE):
+            if self._seq[order.id] < known and order.id not in listed:
+                self.upsert(order.replace(status = 'CANCELLED'))
+        self._unconfirmed.clear()
+        for order in self.by_status('FILLED', 'CANCELLED'):
+            # Our cancels still listed as active would be revived once pruned
+            if order.id != self._last_buy and (order.status == 'FILLED' or order.id not in listed):
+                self._prune(order)
+
+    def _prune(self, order: Order):
+        del self._index[(order.buy_or_sell, order.status)][order.id]
+        del self._orders[order.id]
+        del self._seq[order.id]
+
+    def _update_from_api(self, order: Order):
+        previous = self._orders.get(order.id)
+        # Closed orders we don't track anymore were pruned
+        if not previous and order.status not in ACTIVE:
+            return
+        # Listings can lag behind our own cancels, don't revive those
+        if (previous and previous.status == 'CANCELLED' and order.status in ACTIVE
+                and order.id not in self._unconfirmed):
+            return
+        self._unconfirmed.discard(order.id)
+        self.upsert(order)
+
+    def by_status(self, *statuses, side: str = None) -> list:
+        sides = (side,) if side else ('BUY', 'SELL')
+        return [order for side in sides for status in statuses
+                for order in self._index.get((side, status), {}).values()]
+
+    def active_sells(self) -> list:
+        return [self._orders[order_id] for _, _, order_id in self._sells]
+
+    def lowest_sell(self) -> Order:
+        """Active sell order with lowest price."""
+        return self._orders[self._sells[0][2]] if self._sells else None
+
+    def last_buy(self) -> Order:
+        """The current active or last filled buy order."""
+        return self._orders.get(self._last_buy)
+
+    def funds_in_open_orders(self) -> int:
+        """Quote value of the open orders, fixed point rounded down."""
+        return self.ledger.funds_in_flight
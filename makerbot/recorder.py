@@ -0,0 +1,158 @@
+import os
+import json
+import queue
+import logging
+import threading
+import numpy as np
+from .helpers import OrderBookSeries
+
+logger = logging.getLogger('pymaker')
+
+# A recording is a directory per market split in segments, each segment is
+#   <first time in ns>.t     int64 ns timestamps, one per snapshot
+#   <first time in ns>.obs   raw snapshot rows, laid out like OrderBookSeries.data
+#   <first time in ns>.json  depth and dtype of the rows
+# Files are append only so a segment can be read while it is being written.
+SEGMENT_NAME = "{:020d}"
+
+
+class _SegmentWriter:
+    """Appends snapshots of one market, starting a new segment when full."""
+
+    def __init__(self, path: str, segment_size: int):
+        self.path = path
+        self.segment_size = segment_size
+        self.rows = 0
+        self._t = self._obs = None
+        os.makedirs(path, exist_ok=True)
+
+    def _open(self, t: int, dtype: np.dtype, depth: int):
+        self.close()
+        name = os.path.join(self.path, SEGMENT_NAME.format(t))
+        with open(name + '.json', 'w') as meta:
+            json.dump({'depth': depth, 'dtype': dtype.descr}, meta)
+        self._t = open(name + '.t', 'ab')
+        self._obs = open(name + '.obs', 'ab')
+        self.rows = 0
+
+    def write(self, t: int, row: bytes, dtype: np.dtype, depth: int):
+        if self._t is None or self.rows >= self.segment_size:
+            self._open(t, dtype, depth)
+        # Data goes first so a timestamp always has its snapshot on disk
+        self._obs.write(row)
+        self._t.write(np.int64(t).tobytes())
+        self.rows += 1
+
+    def flush(self):
+        if self._t is not None:
+            self._obs.flush()
+            self._t.flush()
+
+    def close(self):
+        if self._t is not None:
+            self._obs.close()
+            self._t.close()
+            self._t = self._obs = None
+
+
+class OrderBookRecorder:
+    """Records every snapshot of the order book series of several markets.
+
+    record() only copies the snapshot into a queue, a background thread
+    writes and flushes the segments so disk latency never reaches the
+    trading loop. When the queue is full snapshots are dropped and counted.
+    """
+
+    def __init__(self, root: str, segment_size: int = 100000,
+                 flush_interval: float = 1.0, max_queue: int = 100000):
+        self.root = root
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+        self._writers = {}
+        self._thread = threading.Thread(target=self._run, name='makerbot-recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, market: str, t, snapshot: np.ndarray):
+        """Queue a snapshot (one row of OrderBookSeries.data) taken at t."""
+        t = int(np.datetime64(t, 'ns').astype(np.int64))
+        try:
+            self._queue.put_nowait((market, t, snapshot.tobytes(), snapshot.dtype, snapshot.shape[0]))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._flush()
+                continue
+            if item is None:
+                break
+            market, t, row, dtype, depth = item
+            if market not in self._writers:
+                self._writers[market] = _SegmentWriter(os.path.join(self.root, market), self.segment_size)
+            try:
+                self._writers[market].write(t, row, dtype, depth)
+            except OSError as exception:
+                logger.error("Failed to record {} order book: {}".format(market, exception))
+            if self._queue.empty():
+                self._flush()
+        self._flush()
+        for writer in self._writers.values():
+            writer.close()
+
+    def _flush(self):
+        for writer in self._writers.values():
+            writer.flush()
+
+    def close(self):
+        """Write everything still queued and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def list_segments(root: str, market: str) -> list:
+    """Segment paths of a market recording, oldest first."""
+    path = os.path.join(root, market)
+    if not os.path.isdir(path):
+        return []
+    names = sorted(name[:-5] for name in os.listdir(path) if name.endswith('.json'))
+    return [os.path.join(path, name) for name in names]
+
+def load_segment(segment: str) -> OrderBookSeries:
+    """OrderBookSeries backed by read only memory maps of a segment."""
+    with open(segment + '.json') as meta_file:
+        meta = json.load(meta_file)
+    dtype = np.dtype([tuple(field) for field in meta['dtype']])
+    depth = meta['depth']
+    # Rows still being written are left out
+    rows = min(os.path.getsize(segment + '.t') // 8,
+               os.path.getsize(segment + '.obs') // (dtype.itemsize * depth))
+    if not rows:
+        return OrderBookSeries(np.zeros(0, dtype="datetime64[ns]"), np.zeros((0, depth), dtype=dtype))
+    t = np.memmap(segment + '.t', dtype="datetime64[ns]", mode='r', shape=(rows,))
+    data = np.memmap(segment + '.obs', dtype=dtype, mode='r', shape=(rows, depth))
+    return OrderBookSeries(t, data)
+
+def iter_recording(root: str, market: str, start=None, end=None):
+    """Yield the recorded OrderBookSeries of a market segment by segment,
+    limited to start <= t < end. Nothing is read until it is accessed.
+    """
+    start = np.datetime64(start, 'ns') if start is not None else None
+    end = np.datetime64(end, 'ns') if end is not None else None
+    segments = list_segments(root, market)
+    for idx, segment in enumerate(segments):
+        # Segments are named by their first timestamp, skip those out of range
+        if end is not None and np.datetime64(int(os.path.basename(segment)), 'ns') >= end:
+            break
+        if start is not None and idx + 1 < len(segments):
+            if np.datetime64(int(os.path.basename(segments[idx + 1])), 'ns') <= start:
+                continue
+        obs = load_segment(segment)
+        first = np.searchsorted(obs.t, start) if start is not None else 0
+        last = np.searchsorted(obs.t, end) if end is not None else len(obs.t)
+        if last > first:
+            yield OrderBookSeries(obs.t[first:last], obs.data[first:last])
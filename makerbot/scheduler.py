@@ -0,0 +1,132 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger('pymaker')
+
+# First retry waits up to this many seconds, doubling on every attempt
+RETRY_BASE = 0.1
+RETRY_CAP = 5.0
+
+
+class TokenBucket:
+    """Thread safe token bucket refilled at rate tokens per second up to burst.
+
+    reserve() takes a token right away and returns how long to wait until
+    it is actually available, so callers wait their own way: time.sleep in
+    a thread or asyncio.sleep in the event loop. Reservations are served in
+    order and the long run rate never exceeds rate. A rate of None never waits.
+    """
+
+    def __init__(self, rate: float = None, burst: float = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until the bucket holds tokens, without taking any."""
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+
+def backoff(attempt: int) -> float:
+    """Seconds before a retry, exponential with full jitter."""
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+class RequestScheduler:
+    """Every request to the exchange goes through here.
+
+    Calls take a token of a bucket matching the exchange rate limit, shared
+    by all the markets of the process. Failed calls are retried with
+    jittered exponential backoff until deadline seconds after the first
+    attempt, then the last exception is raised. call() is for the event
+    loop and never blocks it, run() is the same for worker threads.
+    Request durations and retries go to registry when one is given.
+    """
+
+    def __init__(self, rate: float = 10.0, burst: float = 5, deadline: float = 10.0, executor = None,
+                 registry = None):
+        self.bucket = TokenBucket(rate, burst)
+        self.deadline = deadline
+        self.executor = executor
+        self.registry = registry
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _timed(self, func):
+        """func timed into the request histogram of its name."""
+        if self.registry is None:
+            return func
+        histogram = self.registry.histogram('makerbot_request_seconds', call = getattr(func, '__name__', 'call'))
+        def timed(*args):
+            before = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                histogram.observe(time.perf_counter() - before)
+        return timed
+
+    def _retry_in(self, attempt: int, stop: float, exception: Exception) -> float:
+        """Seconds to wait before retrying, raise if the deadline is too close."""
+        self.failures += 1
+        delay = backoff(attempt)
+        if time.monotonic() + delay >= stop:
+            raise exception
+        self.retries += 1
+        if self.registry is not None:
+            self.registry.counter('makerbot_retries_total').inc()
+        logger.debug("Request failed, retrying in {:.2f}s: {}".format(delay, exception))
+        return delay
+
+    async def call(self, func, *args, deadline: float = None):
+        loop = asyncio.get_event_loop()
+        stop = time.monotonic() + (self.deadline if deadline is None else deadline)
+        func = self._timed(func)
+        attempt = 0
+        while True:
+            delay = self.bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            self.requests += 1
+            try:
+                return await loop.run_in_executor(self.executor, func, *args)
+            except Exception as exception:
+                await asyncio.sleep(self._retry_in(attempt, stop, exception))
+            attempt += 1
+
+    def run(self, func, *args, deadline: float = None):
+        stop = time.monotonic() + (self.deadline if deadline is None else deadline)
+        func = self._timed(func)
+        attempt = 0
+        while True:
+            delay = self.bucket.reserve()
+            if delay:
+                time.sleep(delay)
+            self.requests += 1
+            try:
+                return func(*args)
+            except Exception as exception:
+                time.sleep(self._retry_in(attempt, stop, exception))
+            attempt += 1
@@ -0,0 +1,419 @@
+import time
+import threading
+import numpy as np
+from collections import deque
+from contextlib import contextmanager
+from decimal import Decimal, Context, localcontext, ROUND_DOWN
+from datetime import datetime
+from types import SimpleNamespace
+from .backtest import market_info
+from .recorder import iter_recording
+from .scheduler import TokenBucket
+from .fixed import to_fixed, to_float
+from .book import BookDelta
+
+# Exchange side arithmetic, independent of the bot's decimal context
+EXCHANGE_CONTEXT = Context(prec=28)
+# Background amounts are rounded down to this
+AMOUNT_STEP = Decimal('0.00000001')
+# Ticks replayed at most after an idle gap, the rest are skipped
+MAX_CATCH_UP = 100
+# Order book deltas kept per market for get_order_book_deltas
+MAX_DELTAS = 1000
+
+
+def _amount(value) -> SimpleNamespace:
+    return SimpleNamespace(amount=str(value))
+
+def _level(price: float, amount: float) -> SimpleNamespace:
+    return SimpleNamespace(price=SimpleNamespace(amount='{:.8f}'.format(price)),
+                           amount=SimpleNamespace(amount='{:.8f}'.format(amount)))
+
+def _decimal(value: float) -> Decimal:
+    return Decimal(value).quantize(AMOUNT_STEP, ROUND_DOWN)
+
+def parse_balances(value: str) -> dict:
+    """Starting balances from a setting like 'usdc:10000 eth:10'."""
+    balances = {}
+    for item in value.split():
+        currency, _, amount = item.partition(':')
+        balances[currency.lower()] = Decimal(amount)
+    return balances
+
+
+class Balances:
+    """Available and reserved funds per currency, shared by all markets."""
+
+    def __init__(self, amounts: dict):
+        self.available = {currency: Decimal(amount) for currency, amount in amounts.items()}
+        self.reserved = {currency: Decimal(0) for currency in amounts}
+
+    def reserve(self, currency: str, amount: Decimal):
+        if self.available.get(currency, Decimal(0)) < amount:
+            raise Exception("Insufficient funds: {} {} needed, {} available".format(
+                amount, currency, self.available.get(currency, Decimal(0))))
+        self.available[currency] -= amount
+        self.reserved[currency] += amount
+
+    def release(self, currency: str, amount: Decimal):
+        self.reserved[currency] -= amount
+        self.available[currency] += amount
+
+    def spend(self, currency: str, amount: Decimal):
+        self.reserved[currency] -= amount
+
+    def receive(self, currency: str, amount: Decimal):
+        self.available[currency] = self.available.get(currency, Decimal(0)) + amount
+        self.reserved.setdefault(currency, Decimal(0))
+
+
+class SimOrder:
+    """One of our limit orders on the simulated exchange.
+    ahead: background amount queued at its price before it was placed
+    """
+
+    def __init__(self, id: str, buy_or_sell: str, price: Decimal, amount: Decimal,
+                 cancellation_policy: str, ahead: float = 0.0):
+        self.id = id
+        self.buy_or_sell = buy_or_sell
+        self.price = price
+        self.amount = amount
+        self.remaining = amount
+        self.cancellation_policy = cancellation_policy
+        self.placed_at = datetime.utcnow().isoformat() + 'Z'
+        self.status = 'OPEN'
+        self.ahead = ahead
+
+    def to_api(self) -> SimpleNamespace:
+        """Shaped like the list_account_orders entries."""
+        return SimpleNamespace(id=self.id, buy_or_sell=self.buy_or_sell, limit_price=_amount(self.price),
+                               amount=_amount(self.amount), amount_remaining=_amount(self.remaining),
+                               type='LIMIT', cancellation_policy=self.cancellation_policy,
+                               placed_at=self.placed_at, status=self.status)
+
+
+class SimMarket:
+    """Limit order book and matching engine of one market.
+
+    The rest of the market is background liquidity: obs_depth levels per
+    side regenerated every tick around a random walk midprice, or replayed
+    from a recording of sim_data. Each tick the background also sends
+    market orders, a Poisson number with mean sim_trade_rate, that walk
+    the book from the best price. Our orders rest in the same book with
+    price-time priority, a market order reaching our price first takes the
+    background amount queued ahead of us, then our orders in the order
+    they were placed. Orders the background book moves through fill at
+    their price, orders crossing the book when placed take liquidity.
+    """
+
+    def __init__(self, config, balances: Balances, rng):
+        self.name = config['market']
+        self.base, self.quote = self.name.split('_')
+        self.info = market_info(config)
+        self.tick = float(config['sim_min_trade_increment_b'])
+        self.depth = config['obs_depth']
+        self.volatility = config['sim_volatility']
+        self.level_funds = config['sim_level_funds']
+        self.trade_rate = config['sim_trade_rate']
+        self.tick_interval = config['sim_tick_interval']
+        self.balances = balances
+        self.rng = rng
+        self.mid = to_float(config['stable_price'])
+        self.update_id = 0
+        self.last_tick = time.monotonic()
+        self.orders = {}
+        # Our open orders per side, in time order
+        self.resting = {'BUY': [], 'SELL': []}
+        # Kept once deltas are first requested
+        self.deltas = None
+        self._shown = self._published = None
+        self._replay = self._replay_recording(config['sim_data']) if config['sim_data'] else None
+        self._next_book()
+
+    def _replay_recording(self, root: str):
+        """Recorded snapshots of the market, from the start again at the end."""
+        while True:
+            empty = True
+            for obs in iter_recording(root, self.name):
+                for snapshot in obs.data:
+                    empty = False
+                    yield snapshot
+            if empty:
+                raise Exception("No recording of {} in {}".format(self.name, root))
+
+    def _next_book(self):
+        """Background levels of a new tick, asks ascending and bids descending."""
+        if self._replay is not None:
+            snapshot = next(self._replay)
+            asks = np.isfinite(snapshot['Pask']) & (snapshot['Qask'] > 0)
+            bids = np.isfinite(snapshot['Pbid']) & (snapshot['Qbid'] > 0)
+            self.asks = [list(level) for level in zip(snapshot['Pask'][asks].tolist(), snapshot['Qask'][asks].tolist())]
+            self.bids = [list(level) for level in zip(snapshot['Pbid'][bids].tolist(), snapshot['Qbid'][bids].tolist())]
+            if self.asks and self.bids:
+                self.mid = (self.asks[0][0] + self.bids[0][0]) / 2
+        else:
+            self.mid *= np.exp(self.rng.normal(0, self.volatility))
+            best_ask = np.floor(self.mid / self.tick + 1) * self.tick
+            best_bid = np.ceil(self.mid / self.tick - 1) * self.tick
+            offsets = np.arange(self.depth) * self.tick
+            sizes = (self.rng.uniform(0.2, 1.8, (2, self.depth)) * (self.level_funds / self.mid)).tolist()
+            self.asks = [list(level) for level in zip(np.round(best_ask + offsets, 10).tolist(), sizes[0])]
+            self.bids = [list(level) for level in zip(np.round(best_bid - offsets, 10).tolist(), sizes[1])]
+        self.update_id += 1
+
+    def advance(self, step: bool = False):
+        """Run the ticks due since the last one. With a sim_tick_interval of 0
+        the market only moves on step, once per order book request.
+        """
+        if self.tick_interval:
+            ticks = int((time.monotonic() - self.last_tick) / self.tick_interval)
+            self.last_tick += ticks * self.tick_interval
+            if ticks > MAX_CATCH_UP:
+                ticks, self.last_tick = MAX_CATCH_UP, time.monotonic()
+        else:
+            ticks = int(step)
+        for _ in range(ticks):
+            self._next_book()
+            self._cross()
+            for _ in range(self.rng.poisson(self.trade_rate)):
+                side = 'BUY' if self.rng.random_sample() < 0.5 else 'SELL'
+                self._market_order(side, self.rng.exponential(self.level_funds / self.mid))
+            if self.deltas is not None:
+                self._publish()
+
+    def _cross(self):
+        """Fill our orders the background book moved through."""
+        if self.asks:
+            for order in [order for order in self.resting['BUY'] if order.price >= self.asks[0][0]]:
+                self._fill(order, order.remaining)
+        if self.bids:
+            for order in [order for order in self.resting['SELL'] if order.price <= self.bids[0][0]]:
+                self._fill(order, order.remaining)
+
+    def _market_order(self, side: str, amount: float):
+        """A background market order, a BUY lifts the asks and our sells."""
+        levels = self.asks if side == 'BUY' else self.bids
+        ours = self.resting['SELL' if side == 'BUY' else 'BUY']
+        # Best first, our orders come after the background amount ahead of them
+        sign = 1 if side == 'BUY' else -1
+        queue = sorted([(sign * level[0], 0, idx, level) for idx, level in enumerate(levels)] +
+                       [(sign * float(order.price), 1, idx, order) for idx, order in enumerate(ours)],
+                       key=lambda item: item[:3])
+        for _, mine, _, entry in queue:
+            if amount <= 0:
+                break
+            if not mine:
+                taken = min(amount, entry[1])
+                entry[1] -= taken
+                amount -= taken
+                continue
+            taken = min(amount, entry.ahead)
+            entry.ahead -= taken
+            amount -= taken
+            if amount > 0:
+                filled = min(_decimal(amount), entry.remaining)
+                self._fill(entry, filled)
+                amount -= float(filled)
+        levels[:] = [level for level in levels if level[1] > 0]
+
+    def _fill(self, order: SimOrder, amount: Decimal, price: Decimal = None):
+        """Fill amount of order at price, its limit price by default."""
+        if amount <= 0:
+            return
+        price = order.price if price is None else price
+        if order.buy_or_sell == 'BUY':
+            self.balances.spend(self.quote, amount * price)
+            self.balances.release(self.quote, amount * (order.price - price))
+            self.balances.receive(self.base, amount)
+        else:
+            self.balances.spend(self.base, amount)
+            self.balances.receive(self.quote, amount * price)
+        order.remaining -= amount
+        if not order.remaining:
+            order.status = 'FILLED'
+            self.resting[order.buy_or_sell].remove(order)
+
+    def place(self, order: SimOrder, allow_taker: bool):
+        """Match order against the background and rest what is left."""
+        if order.buy_or_sell == 'BUY':
+            self.balances.reserve(self.quote, order.amount * order.price)
+            levels, crosses = self.asks, lambda price: price <= order.price
+        else:
+            self.balances.reserve(self.base, order.amount)
+            levels, crosses = self.bids, lambda price: price >= order.price
+        self.orders[order.id] = order
+        self.resting[order.buy_or_sell].append(order)
+        if levels and crosses(levels[0][0]):
+            if not allow_taker:
+                self.cancel(order)
+                return order
+            for level in levels:
+                if not order.remaining or not crosses(level[0]):
+                    break
+                taken = min(_decimal(level[1]), order.remaining)
+                level[1] -= float(taken)
+                self._fill(order, taken, Decimal(repr(level[0])))
+            levels[:] = [level for level in levels if level[1] > 0]
+        else:
+            same_side = self.bids if order.buy_or_sell == 'BUY' else self.asks
+            order.ahead = sum(level[1] for level in same_side if level[0] == float(order.price))
+        return order
+
+    def cancel(self, order: SimOrder):
+        if order.status != 'OPEN':
+            return
+        self.resting[order.buy_or_sell].remove(order)
+        order.status = 'CANCELLED'
+        if order.buy_or_sell == 'BUY':
+            self.balances.release(self.quote, order.remaining * order.price)
+        else:
+            self.balances.release(self.base, order.remaining)
+
+    def orderbook(self) -> SimpleNamespace:
+        """Background and our orders, levels shaped like NashApi's with
+        the bids ascending like the API returns them.
+        """
+        sides = []
+        for levels, mine in ((self.asks, self.resting['SELL']), (self.bids, self.resting['BUY'])):
+            merged = {price: amount for price, amount in levels}
+            for order in mine:
+                price = float(order.price)
+                merged[price] = merged.get(price, 0.0) + float(order.remaining)
+            sides.append([_level(price, merged[price]) for price in sorted(merged)])
+        return SimpleNamespace(asks=sides[0][:self.depth], bids=sides[1][-self.depth:], update_id=self.update_id)
+
+    def _visible(self) -> tuple:
+        """Fixed point {price: amount} of the asks and of the bids orderbook() shows."""
+        book = self.orderbook()
+        return tuple({to_fixed(level.price.amount): to_fixed(level.amount.amount) for level in levels}
+                     for levels in (book.asks, book.bids))
+
+    def _publish(self):
+        """Keep the changes since the last call as the delta of update_id.
+        Changes from our orders between ticks get an update_id of their own.
+        """
+        shown = self._visible()
+        changes = [[(price, amount) for price, amount in new.items() if old.get(price) != amount] +
+                   [(price, 0) for price in old if price not in new]
+                   for new, old in zip(shown, self._shown)]
+        self._shown = shown
+        if self.update_id == self._published:
+            if not changes[0] and not changes[1]:
+                return
+            self.update_id += 1
+        self.deltas.append(BookDelta(self.update_id, tuple(changes[0]), tuple(changes[1])))
+        self._published = self.update_id
+
+    def deltas_since(self, update_id: int) -> list:
+        """Deltas following update_id, None when they aren't kept anymore
+        and the order book has to be requested again.
+        """
+        if self.deltas is None:
+            self.deltas = deque(maxlen=MAX_DELTAS)
+            self._shown, self._published = self._visible(), self.update_id
+        else:
+            self._publish()
+        if update_id == self.update_id:
+            return []
+        if update_id < self._published - len(self.deltas) or update_id > self.update_id:
+            return None
+        return [delta for delta in self.deltas if delta.update_id > update_id]
+
+
+class SimulatorApi:
+    """In process exchange with the NashApi methods the bot uses.
+
+    Markets are the sections of configs, see SimMarket for the fills.
+    Every call takes sim_latency seconds and fails like the exchange when
+    more than sim_rate_limit calls per second are sent, 0 disables the
+    limit. Accounts start with the sim_balances funds.
+    """
+
+    def __init__(self, configs: dict, seed: int = None):
+        settings = next(iter(configs.values()))
+        rng = np.random.RandomState(seed)
+        self.balances = Balances(parse_balances(settings['sim_balances']))
+        self.markets = {name: SimMarket(config, self.balances, rng) for name, config in configs.items()}
+        self.latency = settings['sim_latency']
+        self.bucket = TokenBucket(settings['sim_rate_limit'] or None, max(1, settings['sim_rate_limit']))
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _exchange(self):
+        # Calls wait for the network outside the lock, so they overlap like on the exchange
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock, localcontext(EXCHANGE_CONTEXT):
+            yield
+
+    def _request(self, name: str = None, step: bool = False) -> SimMarket:
+        """Rate limit of one call, then the market moved to now."""
+        if self.bucket.wait_time() > 0:
+            raise Exception("Rate limit exceeded")
+        self.bucket.reserve()
+        if name is None:
+            return None
+        if name not in self.markets:
+            raise Exception("Unknown market {}".format(name))
+        market = self.markets[name]
+        market.advance(step)
+        return market
+
+    def login(self, *args):
+        with self._exchange():
+            self._request()
+
+    def get_market(self, name: str):
+        with self._exchange():
+            return self._request(name).info
+
+    def get_order_book(self, name: str):
+        with self._exchange():
+            market = self._request(name, step=True)
+            if market.deltas is not None:
+                # Same update_id as the deltas of the book
+                market._publish()
+            return market.orderbook()
+
+    def get_order_book_deltas(self, name: str, since_update_id: int):
+        """Deltas of the order book after since_update_id, None when a new
+        snapshot is needed. NashApi has no such request.
+        """
+        with self._exchange():
+            return self._request(name, step=True).deltas_since(since_update_id)
+
+    def get_account_balance(self, currency: str):
+        with self._exchange():
+            self._request()
+            currency = currency.lower()
+            available = self.balances.available.get(currency, Decimal(0))
+            reserved = self.balances.reserved.get(currency, Decimal(0))
+            return SimpleNamespace(currency=currency, available=_amount(available),
+                                   in_orders=_amount(reserved), total=_amount(available + reserved))
+
+    def list_account_orders(self, name: str, status: list = None, range_start: str = None, **kwargs):
+        with self._exchange():
+            market = self._request(name)
+            orders = [order.to_api() for order in market.orders.values()
+                      if (status is None or order.status in status)
+                      and (range_start is None or order.placed_at >= range_start)]
+            return SimpleNamespace(orders=orders)
+
+    def place_limit_order(self, name: str, amount, buy_or_sell: str, cancellation_policy: str,
+                          price, allow_taker: bool = True):
+        with self._exchange():
+            market = self._request(name)
+            amount, price = Decimal(str(amount.amount)), Decimal(str(price))
+            if amount <= 0 or price <= 0:
+                raise Exception("Invalid order: {} at {}".format(amount, price))
+            self._next_id += 1
+            order = SimOrder(str(self._next_id), buy_or_sell, price, amount, cancellation_policy)
+            return market.place(order, allow_taker).to_api()
+
+    def cancel_order(self, order_id: str, name: str):
+        with self._exchange():
+            market = self._request(name)
+            if order_id not in market.orders:
+                raise Exception("Unknown order {}".format(order_id))
+            market.cancel(market.orders[order_id])
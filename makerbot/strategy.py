@@ -0,0 +1,131 @@
+import importlib
+import numpy as np
+from .fixed import to_fixed
+from .analytics import depth_imbalance, depth_microprice
+from .telemetry import Counter
+
+# Feature functions by name, see feature()
+FEATURES = {}
+# Levels the depth features weigh, each half the one above
+DEPTH_LEVELS = 5
+
+
+def feature(func):
+    """Register func(features) as the feature of its name.
+    It reads features.obs, features.metrics, features.market and other
+    features as features['name'], and runs at most once per tick.
+    """
+    FEATURES[func.__name__] = func
+    return func
+
+def load_strategy(path: str):
+    """Strategy function from a 'package.module.function' path.
+
+    A strategy is called on every tick as strategy(market, features, orders,
+    available) and returns the current buy order and the seconds to pause,
+    like core.trade. Features it declares with @feature are computed in the
+    same cache as the built in ones.
+    """
+    module, _, name = path.rpartition('.')
+    try:
+        return getattr(importlib.import_module(module), name)
+    except (ImportError, AttributeError, ValueError) as exception:
+        raise Exception("Can't load strategy {}: {}".format(path, exception))
+
+
+class FeatureCache:
+    """Features of the current tick, computed lazily and at most once per key.
+
+    The loop calls update() with the order book update_id of every tick
+    (the tick timestamp in backtests), strategies read features['name']. Hits
+    and misses are counted in the registry when one is given.
+    """
+
+    def __init__(self, features: dict = FEATURES, registry = None, **labels):
+        self.features = features
+        self.key = None
+        self.obs = self.metrics = self.market = None
+        self._values = {}
+        self._hits = registry.counter('makerbot_feature_hits_total', **labels) if registry else Counter()
+        self._misses = registry.counter('makerbot_feature_misses_total', **labels) if registry else Counter()
+
+    def update(self, key, obs, metrics, market = None):
+        if key != self.key:
+            self._values.clear()
+        self.key, self.obs, self.metrics, self.market = key, obs, metrics, market
+        return self
+
+    def values(self) -> dict:
+        """Features computed on the current tick so far."""
+        return dict(self._values)
+
+    def __getitem__(self, name: str):
+        values = self._values
+        if name in values:
+            self._hits.inc()
+            return values[name]
+        self._misses.inc()
+        values[name] = value = self.features[name](self)
+        return value
+
+    @property
+    def hits(self) -> int:
+        return self._hits.value
+
+    @property
+    def misses(self) -> int:
+        return self._misses.value
+
+    @property
+    def hit_rate(self) -> float:
+        reads = self.hits + self.misses
+        return self.hits / reads if reads else 0.0
+
+    def __str__(self):
+        return "{} feature reads, {:.0%} from the cache".format(self.hits + self.misses, self.hit_rate)
+
+
+# Top of book features, fixed point prices and float sizes
+
+@feature
+def top_ask(features) -> int:
+    return to_fixed(float(features.metrics.Pask[-1]))
+
+@feature
+def top_bid(features) -> int:
+    return to_fixed(float(features.metrics.Pbid[-1]))
+
+@feature
+def mid(features) -> int:
+    """Midprice of the latest snapshot."""
+    return (features['top_ask'] + features['top_bid']) // 2
+
+@feature
+def microprice(features) -> int:
+    return to_fixed(float(features.metrics.Pmicro[-1]))
+
+@feature
+def imbalance_10s(features) -> float:
+    """Median imbalance of the top 2 levels over the last 10s."""
+    last10s = features.obs.window(10)
+    Qa = last10s.data['Qask'][:,:2].mean(axis = 1)
+    Qb = last10s.data['Qbid'][:,:2].mean(axis = 1)
+    return float(np.median(Qb / (Qb + Qa)))
+
+@feature
+def top_sizes_15s(features) -> tuple:
+    """Mean size of the top 2 asks and of the top 2 bids over the last 15s."""
+    last15s = features.obs.window(15)
+    return float(last15s.data['Qask'][:,:2].mean()), float(last15s.data['Qbid'][:,:2].mean())
+
+# Multi level features of the latest snapshot, see analytics.py
+
+@feature
+def imbalance_depth(features) -> float:
+    """Bid share of the sizes of the top DEPTH_LEVELS levels."""
+    return float(depth_imbalance(features.obs.data[-1:], DEPTH_LEVELS)[0])
+
+@feature
+def microprice_depth(features) -> int:
+    """Microprice at the imbalance of the top DEPTH_LEVELS levels."""
+    return to_fixed(float(depth_microprice(features.obs.data[-1:], DEPTH_LEVELS)[0]))
@@ -0,0 +1,101 @@
+import time
+import signal
+import logging
+import multiprocessing
+
+logger = logging.getLogger('pymaker')
+
+# Seconds a crashed process waits before its restart, doubled on every
+# crash up to MAX_BACKOFF and reset once it ran for STABLE_UPTIME
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+STABLE_UPTIME = 60.0
+
+
+def shard(markets: list, workers: int) -> list:
+    """Split markets round robin in at most workers non empty lists."""
+    return [shard for shard in (markets[i::workers] for i in range(workers)) if shard]
+
+
+class _Child:
+    """A supervised process and its restart state."""
+
+    def __init__(self, name: str, target, args: tuple):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.process = None
+        self.started = 0.0
+        self.backoff = MIN_BACKOFF
+        self.due = 0.0
+
+
+class Supervisor:
+    """Runs processes and restarts the ones that crash.
+
+    A process exiting with status 0 is done, any other status restarts it
+    after a backoff. Processes are spawned so none inherits the parent's
+    threads, event loop or API session.
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.restarts = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._children = []
+
+    def add(self, name: str, target, *args):
+        """Supervise target(*args), it must be picklable like a module function."""
+        self._children.append(_Child(name, target, args))
+
+    def _start(self, child: _Child):
+        child.process = self._context.Process(target=child.target, args=child.args, name=child.name)
+        child.process.start()
+        child.started = time.monotonic()
+        logger.info("Started {} as pid {}".format(child.name, child.process.pid))
+
+    def _check(self, child: _Child) -> bool:
+        """Restart child if it crashed, returns if it is still supervised."""
+        now = time.monotonic()
+        if child.process is None:
+            if now >= child.due:
+                self._start(child)
+            return True
+        if child.process.is_alive():
+            return True
+        code = child.process.exitcode
+        if code == 0:
+            logger.info("{} is done".format(child.name))
+            return False
+        if now - child.started >= STABLE_UPTIME:
+            child.backoff = MIN_BACKOFF
+        logger.error("{} exited with status {}, restarting in {:.0f}s".format(child.name, code, child.backoff))
+        child.process = None
+        child.due = now + child.backoff
+        child.backoff = min(child.backoff * 2, MAX_BACKOFF)
+        self.restarts += 1
+        return True
+
+    def run(self):
+        """Supervise until every process is done or Ctrl+C is hit."""
+        children = list(self._children)
+        try:
+            while children:
+                children = [child for child in children if self._check(child)]
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            # The children got the Ctrl+C too, give them time to clean up
+            logger.warning("Ctrl+C detected, stopping processes.")
+            # Another Ctrl+C would leave them behind
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.stop()
+
+    def stop(self, timeout: float = 10.0):
+        """Wait for the processes to exit, terminating the ones that don't."""
+        deadline = time.monotonic() + timeout
+        for child in self._children:
+            if child.process is not None:
+                child.process.join(max(deadline - time.monotonic(), 0))
+                if child.process.is_alive():
+                    child.process.terminate()
+                    child.process.join()
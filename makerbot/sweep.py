@@ -0,0 +1,107 @@
+import os
+import itertools
+from decimal import Decimal
+from typing import NamedTuple
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .backtest import run_backtest, market_info
+from .recorder import iter_recording
+from .fixed import from_fixed
+
+# Settings a sweep grid can vary, the ones the strategy reads while trading
+SWEEP_SETTINGS = ('straddle', 'buy_down_interval', 'max_funds_in_order',
+                  'max_funds_in_flight', 'max_drop_percentage', 'stable_price')
+# Of those, the ones parsed to fixed point
+FIXED_SETTINGS = ('straddle', 'buy_down_interval', 'max_funds_in_order', 'max_funds_in_flight', 'stable_price')
+
+
+class SweepResult(NamedTuple):
+    """Backtest outcome of one grid point.
+    fill_rate: filled over accepted orders
+    inventory: peak value of the base bought, in quote at the fill prices
+    """
+    params: dict
+    pnl: Decimal
+    fills: int
+    placed: int
+    fill_rate: float
+    inventory: Decimal
+    base: Decimal
+    halted: str = None
+
+
+def parse_grid(specs, type_map) -> dict:
+    """Grid from specs like 'straddle=0.5,1,2', values parsed with type_map."""
+    grid = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        name = name.strip()
+        if name not in SWEEP_SETTINGS:
+            raise Exception("Can't sweep {}, use one of {}.".format(name, ', '.join(SWEEP_SETTINGS)))
+        if not values:
+            raise Exception("No values to sweep for {}.".format(name))
+        grid[name] = [type_map[name](value.strip()) for value in values.split(',')]
+    return grid
+
+def grid_points(grid: dict) -> list:
+    """Every combination of the grid values as a list of dicts."""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def inventory_exposure(fills) -> Decimal:
+    """Peak value of the base held above the starting amount, at the fill prices."""
+    held, peak = Decimal(0), Decimal(0)
+    for fill in fills:
+        held += fill.amount if fill.buy_or_sell == 'BUY' else -fill.amount
+        peak = max(peak, held * fill.price)
+    return peak
+
+
+# Job shared by the points evaluated in a worker process, set once by _init_worker
+_job = None
+
+def _init_worker(root, config, quote, base, start, end):
+    global _job
+    _job = (root, config, quote, base, start, end)
+
+def evaluate(params: dict) -> SweepResult:
+    """Backtest one grid point in a worker. The recording is opened there as
+    read only memory maps, every process shares the same page cache.
+    """
+    root, config, quote, base, start, end = _job
+    config = MappingProxyType({**config, **params})
+    series = iter_recording(root, config['market'], start, end)
+    result = run_backtest(series, market_info(config), config, quote, base)
+    fills = len(result.fills)
+    return SweepResult(params, result.pnl, fills, result.placed,
+                       fills / result.placed if result.placed else 0.0,
+                       inventory_exposure(result.fills), result.base, result.halted)
+
+def run_sweep(root: str, config, grid: dict, quote: Decimal = Decimal(1000),
+              base: Decimal = Decimal(0), workers: int = None, start=None, end=None) -> list:
+    """Backtest every grid point over a recording on a process pool, return
+    the results ranked by PnL, lower inventory first on ties.
+    Only the config and the grid points are sent to the workers.
+    """
+    points = grid_points(grid)
+    workers = min(workers or os.cpu_count() or 1, len(points))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(root, dict(config), quote, base, start, end)) as pool:
+        futures = [pool.submit(evaluate, params) for params in points]
+        results = [future.result() for future in as_completed(futures)]
+    return sorted(results, key=lambda result: (-result.pnl, result.inventory))
+
+def format_results(results: list, top: int = None) -> str:
+    """Ranked results as a plain text table."""
+    results = results[:top] if top else results
+    names = list(results[0].params) if results else []
+    header = ['#'] + names + ['pnl', 'fills', 'placed', 'fill rate', 'inventory', 'base']
+    value = lambda name, param: from_fixed(param) if name in FIXED_SETTINGS else str(param)
+    rows = [[str(rank)] + [value(name, result.params[name]) for name in names] +
+            ['{:.4f}'.format(result.pnl), str(result.fills), str(result.placed),
+             '{:.1%}'.format(result.fill_rate), '{:.4f}'.format(result.inventory),
+             '{:.6f}'.format(result.base + 0) + (' halted' if result.halted else '')]
+            for rank, result in enumerate(results, 1)]
+    widths = [max(len(row[idx]) for row in [header] + rows) for idx in range(len(header))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths))
+                     for row in [header] + rows)
@@ -0,0 +1,236 @@
+import os
+import math
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('pymaker')
+
+# Histogram buckets grow by 2**(1/4), about 19%, from 10us to a bit over 100s
+BUCKET_MIN = 1e-5
+BUCKETS_PER_DOUBLING = 4
+BUCKET_COUNT = 96
+BUCKET_BOUNDS = [BUCKET_MIN * 2 ** (idx / BUCKETS_PER_DOUBLING) for idx in range(BUCKET_COUNT)]
+# Buckets written to the Prometheus output, one per doubling keeps it short
+EXPORTED_BUCKETS = range(0, BUCKET_COUNT, BUCKETS_PER_DOUBLING)
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in labels) + '}'
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Log bucketed histogram of durations in seconds.
+
+    observe() is a log and a few additions, quantiles are read from the
+    buckets and are within one bucket width (about 19%) of the exact value.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (BUCKET_COUNT + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        if seconds <= BUCKET_MIN:
+            idx = 0
+        else:
+            idx = min(BUCKET_COUNT, math.ceil(math.log2(seconds / BUCKET_MIN) * BUCKETS_PER_DOUBLING))
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def time(self):
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """q quantile interpolated within its bucket."""
+        rank = q * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKET_BOUNDS[idx - 1] if idx else 0.0
+                upper = min(BUCKET_BOUNDS[idx], self.max) if idx < BUCKET_COUNT else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+
+    def __str__(self):
+        return "n={} p50={:.1f}ms p99={:.1f}ms max={:.1f}ms".format(
+            self.count, self.quantile(0.5) * 1e3, self.quantile(0.99) * 1e3, self.max * 1e3)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """Named counters and histograms with labels.
+
+    Look metrics up once and keep the handle in hot paths, lookups build a
+    key from the labels.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, labels: dict):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, cls())
+        return metric
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def counter(self, name: str, **labels) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def histogram(self, name: str, **labels) -> Histogram:
+        return self._get(Histogram, name, labels)
+
+    def summary(self, name: str) -> str:
+        """One line per labelled histogram of name, for logs."""
+        return '\n'.join('{}{} {}'.format(name, _labels(labels), metric)
+                         for (key, labels), metric in sorted(self._metrics.items(), key=lambda item: item[0])
+                         if key == name and isinstance(metric, Histogram))
+
+    def to_prometheus(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        described = set()
+        for (name, labels), metric in sorted(self._metrics.items(), key=lambda item: item[0]):
+            kind = 'histogram' if isinstance(metric, Histogram) else 'counter'
+            if name not in described:
+                described.add(name)
+                if name in self._help:
+                    lines.append('# HELP {} {}'.format(name, self._help[name]))
+                lines.append('# TYPE {} {}'.format(name, kind))
+            if kind == 'counter':
+                lines.append('{}{} {}'.format(name, _labels(labels), metric.value))
+                continue
+            with metric._lock:
+                counts, count, total = list(metric.counts), metric.count, metric.sum
+            cumulative = 0
+            for idx, bucket in enumerate(counts[:BUCKET_COUNT]):
+                cumulative += bucket
+                if idx in EXPORTED_BUCKETS:
+                    le = labels + (('le', '{:.6g}'.format(BUCKET_BOUNDS[idx])),)
+                    lines.append('{}_bucket{} {}'.format(name, _labels(le), cumulative))
+            lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', '+Inf'),)), count))
+            lines.append('{}_sum{} {}'.format(name, _labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, _labels(labels), count))
+        # Max isn't part of a Prometheus histogram, it's a gauge of its own
+        for (name, labels), metric in sorted(self._metrics.items(), key=lambda item: item[0]):
+            if isinstance(metric, Histogram):
+                if name + '_max' not in described:
+                    described.add(name + '_max')
+                    lines.append('# TYPE {}_max gauge'.format(name))
+                lines.append('{}_max{} {}'.format(name, _labels(labels), metric.max))
+        return '\n'.join(lines) + '\n'
+
+
+# Metrics of the process, see MetricsExporter
+REGISTRY = Registry()
+REGISTRY.describe('makerbot_stage_seconds', 'Time spent in each stage of a market maker tick.')
+REGISTRY.describe('makerbot_request_seconds', 'Duration of exchange requests, one per attempt.')
+REGISTRY.describe('makerbot_ticks_total', 'Order book updates acted on.')
+REGISTRY.describe('makerbot_skipped_ticks_total', 'Order book updates superseded by a newer one or skipped on errors.')
+REGISTRY.describe('makerbot_retries_total', 'Exchange requests retried after a failure.')
+REGISTRY.describe('makerbot_orders_placed_total', 'Orders placed.')
+REGISTRY.describe('makerbot_orders_cancelled_total', 'Orders cancelled.')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        body = self.registry.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class MetricsExporter:
+    """Publishes a registry from background threads, to a file rewritten
+    every interval seconds (for the node exporter textfile collector) and/or
+    an HTTP endpoint on port. The endpoint only listens on host, the
+    loopback interface by default.
+    """
+
+    def __init__(self, registry: Registry = REGISTRY, path: str = None, port: int = None,
+                 host: str = '127.0.0.1', interval: float = 5.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._server = None
+        self._writer = None
+        if port:
+            handler = type('Handler', (_Handler,), {'registry': registry})
+            self._server = ThreadingHTTPServer((host, port), handler)
+            threading.Thread(target=self._server.serve_forever, name='makerbot-metrics-http', daemon=True).start()
+        if path:
+            self._writer = threading.Thread(target=self._run, name='makerbot-metrics-file', daemon=True)
+            self._writer.start()
+
+    def write(self):
+        # Replace the file at once so readers never see a partial one
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as out:
+            out.write(self.registry.to_prometheus())
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as exception:
+                logger.error("Failed to write metrics: {}".format(exception))
+
+    def close(self):
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+        if self.path:
+            # The last periodic write shares the temporary file
+            self._writer.join()
+            self.write()
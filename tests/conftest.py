@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The synthetic market data of the benchmarks serves the tests too
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from makerbot import core
+from makerbot.helpers import get_config
+
+
+@pytest.fixture
+def market_config():
+    """Config of a market of default.ini with some settings overridden."""
+    def make(market='eth_usdc', **overrides):
+        config = get_config(core.type_map, market, os.path.join(ROOT, 'default.ini'), core.default_map)
+        return dict(config, **overrides)
+    return make
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from makerbot import analytics as analytics_module
+from makerbot.analytics import (StreamingAnalytics, analyze, arrival_intensity, depth_imbalance,
+                                depth_microprice, spread_stats)
+from makerbot.helpers import OrderBookSeries
+from makerbot.metrics import MarketMetrics
+from synthetic import make_series
+
+COLUMNS = ('I', 'Pmicro', 'spread', 'ret', 'ofi', 'vol', 'spread_mean', 'spread_std')
+
+
+def assert_matches_analyze(analytics: StreamingAnalytics, obs: OrderBookSeries, **settings):
+    expected = analyze(obs, **settings)[-len(analytics):]
+    np.testing.assert_array_equal(analytics.t, obs.t[-len(analytics):])
+    for column in COLUMNS:
+        np.testing.assert_allclose(getattr(analytics, column), expected[column], rtol=1e-9, atol=1e-12,
+                                   err_msg=column)
+
+
+def uneven_series(count: int, seed: int) -> OrderBookSeries:
+    """Series with wider spreads, missing levels and an empty side now and then."""
+    obs = make_series(count, seed=seed)
+    rng = np.random.RandomState(seed)
+    obs.data['Pask'] += rng.randint(0, 5, (count, 1)) * 0.01
+    for field in ('Pask', 'Qask'):
+        obs.data[field][rng.rand(count) < 0.1, 3:] = np.nan
+        obs.data[field][rng.rand(count) < 0.01, :] = np.nan
+    return obs
+
+
+@pytest.mark.parametrize('settings', [{}, {'levels': 1}, {'levels': 10, 'decay': 0.8, 'window': 20}])
+def test_streaming_matches_analyze(settings):
+    obs = uneven_series(1500, seed=1)
+    assert_matches_analyze(StreamingAnalytics.from_series(obs, **settings), obs, **settings)
+
+
+def test_updates_keep_the_last_snapshots():
+    obs = uneven_series(2000, seed=2)
+    analytics = StreamingAnalytics(300, window=50)
+    for size in range(1, len(obs.t) + 1):
+        analytics.update(OrderBookSeries(obs.t[:size], obs.data[:size]))
+    assert len(analytics) == 300
+    assert_matches_analyze(analytics, obs, window=50)
+
+
+def test_resync_keeps_the_spread_statistics(monkeypatch):
+    monkeypatch.setattr(analytics_module, 'RESYNC_INTERVAL', 64)
+    obs = uneven_series(1000, seed=3)
+    obs.data['Pask'] += 60000.0
+    obs.data['Pbid'] += 60000.0
+    assert_matches_analyze(StreamingAnalytics.from_series(obs, window=30), obs, window=30)
+
+
+def test_float32_snapshots():
+    obs = make_series(500, seed=4, float_type=np.float32)
+    assert_matches_analyze(StreamingAnalytics.from_series(obs), obs)
+
+
+def test_intensity_matches_arrival_intensity():
+    obs = make_series(3000, seed=5)
+    distances = [0.0, 0.01, 0.02, 0.03]
+    streaming = StreamingAnalytics.from_series(obs, max_obs_size=200, distances=distances).intensity()
+    batch = arrival_intensity(obs, distances)
+    np.testing.assert_array_equal(streaming.rates, batch.rates)
+    assert streaming.A == pytest.approx(batch.A) and streaming.k == pytest.approx(batch.k)
+    assert batch.rate(0.0) > batch.rate(0.03)
+
+
+def test_top_level_matches_the_metrics():
+    # Missing levels count as empty here, the metrics have no imbalance without a side
+    obs = make_series(300, seed=6)
+    metrics = MarketMetrics.from_series(obs)
+    np.testing.assert_allclose(depth_imbalance(obs.data, 1), metrics.I, rtol=1e-12)
+    np.testing.assert_allclose(depth_microprice(obs.data, 1), metrics.Pmicro, rtol=1e-12)
+
+
+def test_spread_stats():
+    obs = uneven_series(500, seed=7)
+    stats = spread_stats(obs.data)
+    spreads = (obs.data['Pask'][:, 0] - obs.data['Pbid'][:, 0]).astype(np.float64)
+    assert stats.mean == pytest.approx(np.nanmean(spreads))
+    assert stats.min == pytest.approx(np.nanmin(spreads)) and stats.max == pytest.approx(np.nanmax(spreads))
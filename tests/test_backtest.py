@@ -0,0 +1,23 @@
+import os
+import pytest
+from synthetic import make_series, write_recording
+from makerbot.core import type_map, default_map
+from makerbot.helpers import get_config
+from makerbot.recorder import iter_recording
+from makerbot.backtest import run_backtest, market_info
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('seed', [3, 5, 7])
+def test_fast_replay_matches_exact(tmp_path, seed):
+    config = get_config(type_map, 'eth_usdc', os.path.join(ROOT, 'default.ini'), default_map)
+    # Several segments, windows and resting orders carry across them
+    write_recording(str(tmp_path), 'eth_usdc', make_series(10000, seed=seed), segment_size=3000)
+    series = lambda: iter_recording(str(tmp_path), 'eth_usdc')
+    fast = run_backtest(series(), market_info(config), config)
+    exact = run_backtest(series(), market_info(config), config, exact=True)
+    assert fast.fills and fast.fills == exact.fills
+    assert (fast.quote, fast.base, fast.pnl, fast.halted) == (exact.quote, exact.base, exact.pnl, exact.halted)
+    assert fast.ticks == exact.ticks == 10000
+    assert fast.decisions < exact.decisions
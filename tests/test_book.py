@@ -0,0 +1,142 @@
+import asyncio
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from makerbot import book, simulator
+from makerbot.book import L2Book, BookDelta
+from makerbot.feed import MarketPoller
+from makerbot.scheduler import RequestScheduler
+from makerbot.simulator import SimulatorApi
+from synthetic import delta_stream
+
+MARKET = 'eth_usdc'
+
+
+def assert_same_book(actual: L2Book, expected: L2Book):
+    assert actual.update_id == expected.update_id
+    np.testing.assert_array_equal(actual.asks, expected.asks)
+    np.testing.assert_array_equal(actual.bids, expected.bids)
+
+
+def exchange_book(api: SimulatorApi) -> L2Book:
+    """The full order book the simulator shows now, without moving it."""
+    expected = L2Book()
+    expected.load(api.markets[MARKET].orderbook())
+    return expected
+
+
+def make_api(market_config) -> SimulatorApi:
+    config = market_config(MARKET, sim_tick_interval=0, sim_trade_rate=2)
+    api = SimulatorApi({MARKET: config}, seed=7)
+    # Deltas are kept from the first request on, like a poller's first resync
+    assert api.get_order_book_deltas(MARKET, 0) is None
+    return api
+
+
+def test_deltas_follow_the_simulator(market_config):
+    api = make_api(market_config)
+    local = L2Book()
+    local.load(api.get_order_book(MARKET))
+    rng = np.random.RandomState(0)
+    for step in range(2000):
+        if step % 50 == 0:
+            # Our own orders change the book between ticks
+            side = 'BUY' if rng.random_sample() < 0.5 else 'SELL'
+            mid = api.markets[MARKET].mid
+            price = round(mid - 0.05 if side == 'BUY' else mid + 0.05, 2)
+            api.place_limit_order(MARKET, SimpleNamespace(amount='0.5'), side, 'GOOD_TIL_CANCELLED', price, False)
+        deltas = api.get_order_book_deltas(MARKET, local.update_id)
+        assert deltas is not None
+        assert local.extend(deltas)
+        assert_same_book(local, exchange_book(api))
+    assert local.resyncs == 0
+
+
+def test_resync_after_missed_deltas(market_config, monkeypatch):
+    monkeypatch.setattr(simulator, 'MAX_DELTAS', 5)
+    api = make_api(market_config)
+    local = L2Book()
+    local.load(api.get_order_book(MARKET))
+    rng = np.random.RandomState(1)
+    resyncs = 0
+    for _ in range(300):
+        # Ticks we don't see, past the kept deltas now and then
+        for _ in range(rng.randint(8)):
+            api.markets[MARKET].advance(step=True)
+        deltas = api.get_order_book_deltas(MARKET, local.update_id)
+        if deltas is None:
+            local.load(api.get_order_book(MARKET))
+            resyncs += 1
+        else:
+            assert local.extend(deltas)
+        assert_same_book(local, exchange_book(api))
+    assert resyncs and local.resyncs == resyncs
+
+
+def test_poller_resyncs_its_book(market_config, monkeypatch):
+    monkeypatch.setattr(simulator, 'MAX_DELTAS', 5)
+    api = make_api(market_config)
+    poller = MarketPoller(api, RequestScheduler(rate=None))
+    subscription = poller.add(MARKET, book_depth=10).subscribe()
+
+    async def run():
+        rng = np.random.RandomState(2)
+        for _ in range(100):
+            for _ in range(rng.randint(8)):
+                api.markets[MARKET].advance(step=True)
+            await poller.poll(MARKET)
+            assert_same_book(poller.books[MARKET], exchange_book(api))
+            update = subscription.drain()[-1]
+            assert len(update.orderbook.asks) == len(update.orderbook.bids) == 10
+
+    asyncio.run(run())
+    assert poller.books[MARKET].resyncs > 0
+
+
+def test_gap_is_refused():
+    orderbook, deltas = delta_stream(10, seed=3)
+    local = L2Book()
+    assert not local.apply(deltas[0])
+    local.load(orderbook)
+    asks, bids = local.asks.copy(), local.bids.copy()
+    assert not local.apply(deltas[1])
+    assert local.update_id == 0
+    np.testing.assert_array_equal(local.asks, asks)
+    np.testing.assert_array_equal(local.bids, bids)
+    assert not local.extend(deltas[:1] + deltas[2:])
+    assert local.update_id == 1
+
+
+def test_known_deltas_are_skipped():
+    orderbook, deltas = delta_stream(20, seed=4)
+    local, once = L2Book(), L2Book()
+    local.load(orderbook)
+    once.load(orderbook)
+    assert local.extend(deltas[:10]) and local.extend(deltas[5:])
+    assert once.extend(deltas)
+    assert_same_book(local, once)
+
+
+def test_levels_are_added_modified_and_removed():
+    local = L2Book()
+    local.load(SimpleNamespace(asks=[], bids=[], update_id=0))
+    assert local.apply(BookDelta(1, asks=((101, 5), (103, 7), (102, 6)), bids=((99, 4), (97, 2))))
+    assert local.apply(BookDelta(2, asks=((102, 0), (103, 8)), bids=((98, 1), (97, 0))))
+    top = local.top(10)
+    np.testing.assert_array_equal(top.asks, [[101, 5], [103, 8]])
+    np.testing.assert_array_equal(top.bids, [[99, 4], [98, 1]])
+    assert top.update_id == 2
+
+
+@pytest.mark.parametrize('changes', [1, 4, 40])
+def test_merge_matches_changes_one_by_one(changes, monkeypatch):
+    orderbook, deltas = delta_stream(500, changes=changes, seed=5)
+    merged = L2Book()
+    merged.load(orderbook)
+    assert merged.extend(deltas)
+    # The same deltas without the vectorized merge
+    monkeypatch.setattr(book, 'MERGE_MIN', 10 ** 9)
+    one_by_one = L2Book()
+    one_by_one.load(orderbook)
+    assert one_by_one.extend(deltas)
+    assert_same_book(merged, one_by_one)
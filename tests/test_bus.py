@@ -0,0 +1,96 @@
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing
+import numpy as np
+from makerbot.bus import BusFeed, BusReader, BusWriter
+from makerbot.helpers import obs_dtype
+
+MARKET = 'eth_usdc'
+
+
+def snapshot(value: int, depth: int = 25) -> np.ndarray:
+    """A row with every field of every level set to value."""
+    row = np.zeros(depth, dtype=obs_dtype(np.float64))
+    for field in row.dtype.names:
+        row[field] = value
+    return row
+
+
+def publish(root: str, count: int, depth: int = 25):
+    """Writes count snapshots, the i'th holds i everywhere."""
+    writer = BusWriter(root, MARKET, capacity=64, depth=depth, float_type=np.float64)
+    for idx in range(count):
+        writer.write(idx, idx, snapshot(idx, depth))
+
+
+def assert_consistent(count, t, ids, data):
+    np.testing.assert_array_equal(ids, np.arange(count - len(ids), count))
+    np.testing.assert_array_equal(t.astype(np.int64), ids)
+    for field in data.dtype.names:
+        np.testing.assert_array_equal(data[field], np.repeat(ids[:, None], data.shape[1], axis=1))
+
+
+def test_reads_wrap_around_the_ring(tmp_path):
+    publish(str(tmp_path), 150)
+    reader = BusReader(str(tmp_path), MARKET)
+    count, t, ids, data = reader.read()
+    assert count == 150 and len(ids) == 64
+    assert_consistent(count, t, ids, data)
+    assert_consistent(*reader.read(140))
+    assert len(reader.read(150)[2]) == 0
+    assert len(reader.read(limit=5)[2]) == 5
+
+
+def test_reads_are_never_torn(tmp_path):
+    root = str(tmp_path)
+    # The file and its layout, the spawned writer reopens it
+    publish(root, 0)
+    writer = multiprocessing.get_context('spawn').Process(target=publish, args=(root, 20000))
+    writer.start()
+    reader, reads = BusReader(root, MARKET), 0
+    while writer.is_alive() or not reads:
+        result = reader.read(limit=8)
+        if len(result[2]):
+            assert_consistent(*result)
+            reads += 1
+    writer.join()
+    assert writer.exitcode == 0 and reads > 10
+    assert reader.count == 20000
+
+
+def test_reads_wait_while_a_snapshot_is_written(tmp_path):
+    publish(str(tmp_path), 3)
+    writer = BusWriter(str(tmp_path), MARKET, capacity=64, depth=25, float_type=np.float64)
+    reader = BusReader(str(tmp_path), MARKET)
+    writer._file.header[0] += 1
+    results = []
+    thread = threading.Thread(target=lambda: results.append(reader.read()))
+    thread.start()
+    time.sleep(0.1)
+    assert not results
+    writer._file.header[0] += 1
+    thread.join(1)
+    assert results and results[0][0] == 3
+
+
+def test_feed_reopens_a_recreated_bus(tmp_path, caplog):
+    root = str(tmp_path)
+    publish(root, 3)
+    feed = BusFeed(root, MARKET, interval=0.001, stale_after=0.02)
+    updates = feed.subscribe()
+
+    async def run():
+        feed.start()
+        await asyncio.sleep(0.01)
+        # A publisher of another depth replaces the file
+        publish(root, 2, depth=10)
+        update = await asyncio.wait_for(updates.get(), 1)
+        feed.stop()
+        return update
+
+    with caplog.at_level(logging.INFO, 'pymaker'):
+        update = asyncio.run(run())
+    assert update.orderbook.update_id == 0 and len(update.orderbook.row) == 10
+    assert "reopening" in caplog.text
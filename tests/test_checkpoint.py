@@ -0,0 +1,42 @@
+import time
+import numpy as np
+from synthetic import orderbook_stream
+from makerbot.checkpoint import checkpoint_path, load_checkpoint, save_checkpoint
+from makerbot.helpers import OrderBookRing
+
+CONFIG = {'obs_backend': 'RING', 'max_obs_size': 50, 'obs_depth': 10, 'obs_dtype': np.float64}
+
+
+def make_ring(count: int, depth: int = 10) -> OrderBookRing:
+    """Snapshots one second apart, the last one now."""
+    ring = OrderBookRing(count, depth, np.float64)
+    now = time.time_ns()
+    for idx, book in enumerate(orderbook_stream(count, depth=depth)):
+        ring.update(book, t=now - 10**9 * (count - 1 - idx))
+    return ring
+
+
+def test_checkpoint_round_trips(tmp_path):
+    ring = make_ring(30)
+    save_checkpoint(str(tmp_path), 'eth_usdc', ring)
+    obs = load_checkpoint(str(tmp_path), 'eth_usdc', CONFIG, max_age=3600)
+    assert isinstance(obs, OrderBookRing)
+    np.testing.assert_array_equal(obs.t, ring.t)
+    np.testing.assert_array_equal(obs.data, ring.data)
+    assert not (tmp_path / 'eth_usdc.npz.tmp').exists()
+
+
+def test_only_recent_snapshots_are_loaded(tmp_path):
+    ring = make_ring(30)
+    save_checkpoint(str(tmp_path), 'eth_usdc', ring)
+    obs = load_checkpoint(str(tmp_path), 'eth_usdc', CONFIG, max_age=9.5)
+    np.testing.assert_array_equal(obs.data, ring.data[-10:])
+
+
+def test_unusable_checkpoints_start_empty(tmp_path):
+    assert len(load_checkpoint(str(tmp_path), 'eth_usdc', CONFIG, max_age=3600).t) == 0
+    save_checkpoint(str(tmp_path), 'eth_usdc', make_ring(5, depth=25))
+    assert len(load_checkpoint(str(tmp_path), 'eth_usdc', CONFIG, max_age=3600).t) == 0
+    with open(checkpoint_path(str(tmp_path), 'neo_usdc'), 'wb') as out:
+        out.write(b'not an archive')
+    assert len(load_checkpoint(str(tmp_path), 'neo_usdc', CONFIG, max_age=3600).t) == 0
@@ -0,0 +1,50 @@
+import logging
+import threading
+from itertools import count
+from types import SimpleNamespace
+from makerbot import core
+from makerbot.helpers import Order
+from makerbot.orders import OrderTracker
+
+
+class ThreadApi:
+    """Records the thread of every request."""
+
+    def __init__(self):
+        self.ids = count(1)
+        self.threads = []
+
+    def place_limit_order(self, *args):
+        self.threads.append(threading.current_thread())
+        return SimpleNamespace(id=str(next(self.ids)))
+
+    def cancel_order(self, *args):
+        self.threads.append(threading.current_thread())
+
+
+class ThreadTracker(OrderTracker):
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def upsert(self, order):
+        self.threads.append(threading.current_thread())
+        return super().upsert(order)
+
+
+def test_replace_buy_and_sell_tracks_from_the_calling_thread(monkeypatch):
+    api = ThreadApi()
+    monkeypatch.setattr(core, 'api', api, raising=False)
+    monkeypatch.setattr(core, 'logger', logging.getLogger('pymaker'), raising=False)
+    market = SimpleNamespace(name='eth_usdc', a_unit='eth')
+    orders = ThreadTracker()
+    old_buy = core.place_order(market, Order('150', '1', 'BUY'), orders)
+    sell = Order('151', '1', 'SELL')
+    new_buy = core.replace_buy_and_sell(market, orders, old_buy, Order('149', '1', 'BUY'), sell)
+    assert orders.last_buy() is new_buy
+    assert [order.id for order in orders.active_sells()] == ['2']
+    assert orders.get(old_buy.id).status == 'CANCELLED'
+    # The sell was sent from the io pool, every update ran here
+    assert any(thread is not threading.current_thread() for thread in api.threads)
+    assert all(thread is threading.current_thread() for thread in orders.threads)
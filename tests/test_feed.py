@@ -0,0 +1,45 @@
+import asyncio
+from synthetic import make_orderbook, orderbook_stream
+from makerbot.feed import OrderBookFeed, bootstrap
+
+
+def config(**overrides):
+    return dict({'min_history_points': 5, 'max_loading_time': 1, 'max_obs_size': 100,
+                 'obs_backend': 'RING'}, **overrides)
+
+
+def test_publish_delivers_new_update_ids_to_every_subscription():
+    feed = OrderBookFeed()
+    first, second = feed.subscribe(), feed.subscribe()
+    assert feed.publish(make_orderbook(update_id=1))
+    assert not feed.publish(make_orderbook(update_id=1))
+    assert feed.publish(make_orderbook(update_id=2))
+    for subscription in (first, second):
+        assert [update.orderbook.update_id for update in subscription.drain()] == [1, 2]
+        assert subscription.drain() == []
+
+def test_closed_subscriptions_get_nothing():
+    feed = OrderBookFeed()
+    subscription = feed.subscribe()
+    subscription.close()
+    feed.publish(make_orderbook(update_id=1))
+    assert subscription.drain() == []
+
+def test_bootstrap_takes_min_history_points():
+    async def run():
+        feed = OrderBookFeed()
+        subscription = feed.subscribe()
+        await feed.replay(orderbook_stream(8))
+        obs = await bootstrap(subscription, config())
+        return obs, subscription.drain()
+    obs, left = asyncio.run(run())
+    assert len(obs.t) == 5
+    assert [update.orderbook.update_id for update in left] == [5, 6, 7]
+
+def test_bootstrap_stops_at_max_loading_time():
+    async def run():
+        feed = OrderBookFeed()
+        subscription = feed.subscribe()
+        await feed.replay(orderbook_stream(2))
+        return await bootstrap(subscription, config(max_loading_time=0.1))
+    assert len(asyncio.run(run()).t) == 2
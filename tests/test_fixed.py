@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from decimal import Decimal
+from makerbot.fixed import SCALE, to_fixed, from_fixed, to_decimal, fixed_div, fixed_mul, round_down
+from makerbot.helpers import Order
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('150.12345678', 15012345678),
+    ('150.5', 15050000000),
+    ('150', 15000000000),
+    ('.5', 50000000),
+    ('5.', 500000000),
+    ('0', 0),
+    ('', 0),
+    ('-1.25', -125000000),
+    # Digits past the 8th are dropped
+    ('0.123456789', 12345678),
+    ('1e-8', 1),
+    ('1.5E+2', 15000000000),
+    (Decimal('2.000000019'), 200000001),
+    (3, 300000000),
+    (0.1, 10000000),
+    # Floats are rounded to the nearest unit
+    (0.1 + 0.2, 30000000),
+    (150.123456786, 15012345679),
+])
+def test_to_fixed(value, expected):
+    assert to_fixed(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (np.float64(1.23456789), 123456789),
+    (np.float32(0.1), 10000000),
+    (np.float32(150.5), 15050000000),
+    (np.longdouble('150.12345678'), 15012345678),
+    (np.longdouble('-0.00000002'), -2),
+    (np.float16(0.5), 50000000),
+    (np.int64(3), 300000000),
+    (np.int32(-2), -200000000),
+])
+def test_to_fixed_numpy_scalars(value, expected):
+    assert to_fixed(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (15012345678, '150.12345678'),
+    (15000000000, '150'),
+    (50000000, '0.5'),
+    (1, '0.00000001'),
+    (0, '0'),
+    (-125000000, '-1.25'),
+    (-1, '-0.00000001'),
+])
+def test_from_fixed(value, expected):
+    assert from_fixed(value) == expected
+    assert to_fixed(from_fixed(value)) == value
+
+
+def test_arithmetic_rounds_down():
+    assert fixed_mul(to_fixed('1.5'), to_fixed('0.33333333')) == to_fixed('0.49999999')
+    assert fixed_div(to_fixed('1'), to_fixed('3')) == to_fixed('0.33333333')
+    assert round_down(to_fixed('150.127'), to_fixed('0.01')) == to_fixed('150.12')
+    assert to_decimal(to_fixed('150.12345678')) == Decimal('150.12345678')
+    assert SCALE == 10 ** 8
+
+
+def test_order_reads_values_and_takes_fixed_point_explicitly():
+    # The constructor and replace read every price and amount as a value, ints included
+    assert Order(150, 1, 'BUY').price == to_fixed('150')
+    assert Order('150.5', 0.25, 'BUY').amount == to_fixed('0.25')
+    order = Order('150', '1', 'BUY')
+    assert order.replace(price=151).price == to_fixed('151')
+    assert order.replace(price='150.5', amount=2).amount == to_fixed('2')
+    # Fixed point ints only go through from_fixed and replace_fixed
+    fixed = Order.from_fixed(15000000000, 100000000, 'BUY', id='7')
+    assert (fixed.price, fixed.amount, fixed.amount_remaining, fixed.id) == (to_fixed('150'), to_fixed('1'), to_fixed('1'), '7')
+    assert fixed.replace_fixed(price=15050000000).price == to_fixed('150.5')
+    assert Order.from_fixed(15000000000, 100000000, 'BUY', 0).amount_remaining == 0
+    with pytest.raises(Exception):
+        Order('-1', 1, 'BUY')
+    with pytest.raises(Exception):
+        order.replace_fixed(amount=-1)
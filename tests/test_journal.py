@@ -0,0 +1,48 @@
+import numpy as np
+from makerbot.fixed import to_fixed
+from makerbot.helpers import Order
+from makerbot.journal import Journal, read_journal
+from makerbot.orders import OrderTracker
+
+
+def test_entries_read_back_in_order(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path, fsync_interval=0.01)
+    order = Order('150.5', '2', 'BUY', id='7', placed_at=1576108800.0)
+    journal.write('place', 'eth_usdc', id='7', side='BUY', price=order.price, amount=order.amount)
+    journal.write('decision', 'eth_usdc', update_id=np.int64(3), order=order)
+    journal.write('balance', 'neo_usdc', available=to_fixed('100'))
+    journal.close()
+    entries = list(read_journal(path))
+    assert [(entry['kind'], entry['market']) for entry in entries] == [
+        ('place', 'eth_usdc'), ('decision', 'eth_usdc'), ('balance', 'neo_usdc')]
+    assert entries[0]['price'] == to_fixed('150.5') and entries[0]['amount'] == to_fixed('2')
+    assert entries[1]['update_id'] == 3
+    assert entries[1]['order']['id'] == '7' and entries[1]['order']['placed_at'] == 1576108800.0
+    assert entries[0]['ts'] <= entries[1]['ts'] <= entries[2]['ts']
+    assert [entry['kind'] for entry in read_journal(path, ('balance',))] == ['balance']
+    assert [entry['kind'] for entry in read_journal(path, market='eth_usdc')] == ['place', 'decision']
+
+
+def test_lines_cut_by_a_crash_are_skipped(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    journal.write('cancel', 'eth_usdc', id='7')
+    journal.close()
+    with open(path, 'a') as out:
+        out.write('{"kind":"fill","mar')
+    assert [entry['kind'] for entry in read_journal(path)] == ['cancel']
+    # Entries appended after the cut line are kept
+    journal = Journal(path)
+    journal.write('cancel', 'eth_usdc', id='8')
+    journal.close()
+    assert [entry['id'] for entry in read_journal(path)] == ['7', '8']
+
+
+def test_tracker_reports_fills():
+    fills = []
+    tracker = OrderTracker(on_fill=lambda order, amount: fills.append((order.id, amount)))
+    order = tracker.placed(Order('150', '1', 'BUY', id='1'))
+    tracker.upsert(order.replace(status='OPEN', amount_remaining='0.25'))
+    tracker.upsert(order.replace(status='FILLED', amount_remaining=0))
+    assert fills == [('1', to_fixed('0.75')), ('1', to_fixed('0.25'))]
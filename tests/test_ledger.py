@@ -0,0 +1,77 @@
+from makerbot.fixed import to_fixed
+from makerbot.helpers import Order
+from makerbot.ledger import Ledger
+
+
+def order(side, price, amount):
+    return Order(price, amount, side, id='1')
+
+
+def test_round_trip_realizes_the_spread():
+    ledger = Ledger()
+    ledger.filled(order('BUY', '100', '2'), to_fixed('2'))
+    assert ledger.inventory == to_fixed('2')
+    assert ledger.average_cost == to_fixed('100')
+    ledger.filled(order('SELL', '101.5', '2'), to_fixed('2'))
+    assert ledger.inventory == 0
+    assert ledger.average_cost == 0
+    assert ledger.realized == to_fixed('3')
+    assert ledger.fills == 2
+
+
+def test_average_cost_of_several_buys():
+    ledger = Ledger()
+    ledger.filled(order('BUY', '100', '1'), to_fixed('1'))
+    ledger.filled(order('BUY', '103', '2'), to_fixed('2'))
+    assert ledger.average_cost == to_fixed('102')
+    ledger.filled(order('SELL', '104', '1.5'), to_fixed('1.5'))
+    assert ledger.realized == to_fixed('3')
+    assert ledger.inventory == to_fixed('1.5')
+    assert ledger.average_cost == to_fixed('102')
+
+
+def test_selling_through_zero_opens_a_short():
+    ledger = Ledger()
+    ledger.filled(order('BUY', '100', '2'), to_fixed('2'))
+    ledger.filled(order('SELL', '110', '3'), to_fixed('3'))
+    assert ledger.realized == to_fixed('20')
+    assert ledger.inventory == -to_fixed('1')
+    assert ledger.average_cost == to_fixed('110')
+    # Buying back the short below its price gains too
+    ledger.filled(order('BUY', '105', '1'), to_fixed('1'))
+    assert ledger.realized == to_fixed('25')
+    assert ledger.inventory == 0
+
+
+def test_unrealized_follows_the_mark():
+    ledger = Ledger()
+    ledger.filled(order('BUY', '100', '2'), to_fixed('2'))
+    assert ledger.unrealized == 0
+    ledger.mark(to_fixed('99.5'))
+    assert ledger.unrealized == -to_fixed('1')
+    ledger.filled(order('SELL', '101', '1'), to_fixed('1'))
+    assert ledger.realized == to_fixed('1')
+    assert ledger.unrealized == -to_fixed('0.5')
+    assert ledger.pnl == to_fixed('0.5')
+
+
+def test_open_orders_funds_and_exposure():
+    ledger = Ledger()
+    buy, sell = order('BUY', '150.5', '0.1'), order('SELL', '151', '0.2')
+    ledger.opened(buy)
+    ledger.opened(sell)
+    assert ledger.funds_in_flight == to_fixed('45.25')
+    assert ledger.exposure == to_fixed('0.1')
+    ledger.closed(buy)
+    ledger.closed(sell)
+    assert ledger.funds_in_flight == 0
+    assert ledger.buying == ledger.selling == 0
+
+
+def test_values_are_rounded_down():
+    ledger = Ledger()
+    ledger.filled(order('BUY', '0.00000003', '0.5'), to_fixed('0.5'))
+    ledger.mark(to_fixed('0.00000004'))
+    # 0.5 * 1e-8 is below the smallest unit
+    assert ledger.unrealized == 0
+    assert ledger.values()['inventory'] == to_fixed('0.5')
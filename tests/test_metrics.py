@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from makerbot import metrics as metrics_module
+from makerbot.core import get_obs_dataframe, bollinger_bands
+from makerbot.helpers import OrderBookRing, OrderBookSeries
+from makerbot.metrics import MarketMetrics
+from synthetic import make_orderbook
+
+pd = pytest.importorskip('pandas')
+
+COLUMNS = ('Pask', 'Qask', 'Pbid', 'Qbid', 'I', 'Pmid', 'Pmicro')
+
+
+def make_series(count: int, mid: float = 150.0, tick: float = 0.01, seed: int = 0) -> OrderBookSeries:
+    rng = np.random.RandomState(seed)
+    obs = OrderBookRing(count)
+    for update_id in range(count):
+        mid += rng.normal(0, tick)
+        obs.update(make_orderbook(mid, update_id=update_id, tick=tick, rng=rng))
+    return OrderBookSeries(obs.t, obs.data)
+
+def assert_matches_frame(metrics: MarketMetrics, obs: OrderBookSeries, window: int = 20, k: int = 2):
+    df = get_obs_dataframe(obs)
+    sma, upper, lower = bollinger_bands(df, window, k)
+    count = len(metrics)
+    np.testing.assert_array_equal(metrics.t, obs.t[-count:])
+    for column in COLUMNS:
+        np.testing.assert_allclose(getattr(metrics, column), df[column].values[-count:], rtol=1e-12)
+    np.testing.assert_allclose(metrics.sma, sma.values[-count:], rtol=1e-12)
+    np.testing.assert_allclose(metrics.sma + metrics.std * k, upper.values[-count:], rtol=1e-9)
+    np.testing.assert_allclose(metrics.sma - metrics.std * k, lower.values[-count:], rtol=1e-9)
+
+
+def test_columns_match_the_dataframe():
+    obs = make_series(2000, seed=1)
+    assert_matches_frame(MarketMetrics.from_series(obs), obs)
+
+
+def test_bands_match_bollinger_bands():
+    obs = make_series(500, seed=2)
+    metrics = MarketMetrics.from_series(obs, window=50, k=3)
+    sma, upper, lower = bollinger_bands(get_obs_dataframe(obs), 50, 3)
+    np.testing.assert_allclose(metrics.bands(), (sma.iloc[-1], upper.iloc[-1], lower.iloc[-1]), rtol=1e-9)
+    assert np.isnan(metrics.sma[:49]).all() and not np.isnan(metrics.sma[49:]).any()
+
+
+def test_updates_keep_the_last_snapshots():
+    obs = make_series(3000, seed=3)
+    metrics = MarketMetrics(500)
+    for size in range(1, len(obs.t) + 1):
+        metrics.update(OrderBookSeries(obs.t[:size], obs.data[:size]))
+    assert len(metrics) == 500
+    assert_matches_frame(metrics, obs)
+
+
+def test_resync_keeps_high_prices_exact(monkeypatch):
+    monkeypatch.setattr(metrics_module, 'RESYNC_INTERVAL', 100)
+    obs = make_series(1000, mid=60000.0, tick=0.0001, seed=4)
+    assert_matches_frame(MarketMetrics.from_series(obs), obs)
+
+
+def test_empty_sides_give_nans_like_pandas():
+    obs = make_series(200, seed=5)
+    obs.data['Pask'][50, 0] = np.nan
+    obs.data['Qask'][50, 0] = np.nan
+    obs.data['Qbid'][120, 0] = 0
+    obs.data['Qask'][120, 0] = 0
+    metrics = MarketMetrics.from_series(obs)
+    # The frame divides 0 by 0
+    with np.errstate(invalid='ignore'):
+        assert_matches_frame(metrics, obs)
+    assert np.isnan(metrics.sma[50:70]).all() and not np.isnan(metrics.sma[70:]).any()
@@ -0,0 +1,180 @@
+import time
+import pytest
+from makerbot.fixed import to_fixed
+from makerbot.helpers import Order
+from makerbot.orders import OrderTracker
+from synthetic import make_api_order
+
+# 2019-12-12T00:00:00Z, the placed_at of the synthetic orders
+EPOCH = 1576108800.0
+
+
+@pytest.fixture
+def tracker():
+    fills = []
+    tracker = OrderTracker(on_fill=lambda order, amount: fills.append((order.id, amount)))
+    tracker.fills = fills
+    return tracker
+
+
+def place(tracker, id, side='BUY', price='150', amount='1'):
+    """What place_order does with the id the exchange returned."""
+    return tracker.placed(Order(price, amount, side, amount_remaining=0, id=id, placed_at=EPOCH + id))
+
+
+def listed(id, side='BUY', price=150.0, amount=1.0, remaining=None, status='OPEN'):
+    return make_api_order(id, side, price, amount, remaining, status)
+
+
+def test_placed_orders_have_nothing_filled(tracker):
+    order = place(tracker, 1)
+    assert order.status == 'PENDING'
+    assert order.amount_remaining == to_fixed('1')
+    assert tracker.last_buy() is order
+    assert tracker.ledger.fills == 0
+
+
+def test_open_orders_hold_funds(tracker):
+    place(tracker, 1)
+    place(tracker, 2, 'SELL', '151', '2')
+    assert tracker.funds_in_open_orders() == 0
+    tracker.sync_active([listed(1), listed(2, 'SELL', 151.0, 2.0)])
+    assert tracker.funds_in_open_orders() == to_fixed('452')
+    assert tracker.lowest_sell().id == '2'
+    assert tracker.ledger.exposure == to_fixed('1')
+
+
+def test_partial_fills_are_booked(tracker):
+    place(tracker, 1)
+    tracker.sync_active([listed(1)])
+    tracker.sync_active([listed(1, remaining=0.25)])
+    assert tracker.get('1').amount_remaining == to_fixed('0.25')
+    assert tracker.fills == [('1', to_fixed('0.75'))]
+    assert tracker.ledger.inventory == to_fixed('0.75')
+    assert tracker.funds_in_open_orders() == to_fixed('37.5')
+
+
+def test_missing_orders_are_closed_without_a_fill(tracker):
+    place(tracker, 1)
+    tracker.sync_active([listed(1)])
+    closed = tracker.sync_active([])
+    assert [order.id for order in closed] == ['1']
+    assert tracker.get('1').status == 'CANCELLED'
+    assert tracker.funds_in_open_orders() == 0
+    assert tracker.fills == []
+    assert tracker.ledger.inventory == 0
+
+
+def test_confirmed_fills_are_booked(tracker):
+    place(tracker, 1)
+    tracker.sync_active([listed(1, remaining=0.5)])
+    tracker.sync_active([])
+    tracker.confirm([listed(1, remaining=0, status='FILLED')])
+    assert tracker.get('1').status == 'FILLED'
+    assert tracker.fills == [('1', to_fixed('0.5')), ('1', to_fixed('0.5'))]
+    assert tracker.ledger.inventory == to_fixed('1')
+
+
+def test_quick_fills_are_confirmed(tracker):
+    # Filled before any listing showed it
+    place(tracker, 1)
+    closed = tracker.sync_active([], known=tracker.tracked)
+    assert [order.id for order in closed] == ['1']
+    tracker.confirm([listed(1, remaining=0, status='FILLED')])
+    assert tracker.fills == [('1', to_fixed('1'))]
+
+
+def test_orders_placed_after_the_listing_stay_active(tracker):
+    place(tracker, 1)
+    known = tracker.tracked
+    place(tracker, 2)
+    closed = tracker.sync_active([listed(1)], known)
+    assert closed == []
+    assert tracker.get('2').status == 'PENDING'
+
+
+def test_reconcile_corrects_unconfirmed_orders(tracker):
+    place(tracker, 1)
+    place(tracker, 2)
+    tracker.sync_active([listed(1), listed(2)])
+    tracker.sync_active([])
+    tracker.confirm([])
+    assert tracker.fills == []
+    # The fill of 1 was listed late and 2 was missing by mistake
+    tracker.reconcile([listed(1, remaining=0, status='FILLED'), listed(2)])
+    assert tracker.fills == [('1', to_fixed('1'))]
+    assert tracker.last_buy().id == '2'
+    assert tracker.get('2').status == 'OPEN'
+    assert tracker.funds_in_open_orders() == to_fixed('150')
+
+
+def test_reconcile_cancels_missing_orders(tracker):
+    place(tracker, 1, 'SELL')
+    place(tracker, 2)
+    tracker.reconcile([listed(2)])
+    assert tracker.lowest_sell() is None
+    assert tracker.get('2').status == 'OPEN'
+    assert tracker.fills == []
+
+
+def test_own_cancels_are_not_revived(tracker):
+    place(tracker, 1)
+    tracker.sync_active([listed(1)])
+    tracker.cancelled('1')
+    # The listing lags behind the cancel
+    tracker.sync_active([listed(1)])
+    assert tracker.get('1').status == 'CANCELLED'
+    tracker.reconcile([listed(1)])
+    assert tracker.get('1').status == 'CANCELLED'
+    assert tracker.funds_in_open_orders() == 0
+
+
+def test_own_cancels_filled_before_are_booked(tracker):
+    place(tracker, 1, 'SELL')
+    tracker.sync_active([listed(1, 'SELL')])
+    tracker.cancelled('1')
+    tracker.reconcile([listed(1, 'SELL', remaining=0, status='FILLED')])
+    assert tracker.fills == [('1', to_fixed('1'))]
+    assert tracker.ledger.inventory == -to_fixed('1')
+
+
+def test_reconcile_prunes_closed_orders(tracker):
+    for id in range(1, 5):
+        place(tracker, id, 'SELL', str(150 + id))
+    place(tracker, 5)
+    tracker.cancelled('1')
+    tracker.cancelled('5')
+    tracker.reconcile([listed(2, 'SELL', 152.0, remaining=0, status='FILLED'), listed(3, 'SELL', 153.0)])
+    # 4 was cancelled by the exchange, 5 is still the last buy
+    assert len(tracker) == 2 and tracker.tracked == 5
+    assert [order.id for order in tracker.active_sells()] == ['3']
+    assert tracker.last_buy().id == '5'
+    # Pruned orders listed again are not tracked or booked again
+    tracker.reconcile([listed(2, 'SELL', 152.0, remaining=0, status='FILLED'), listed(3, 'SELL', 153.0)])
+    tracker.confirm([listed(2, 'SELL', 152.0, remaining=0, status='FILLED')])
+    assert '2' not in tracker and len(tracker) == 2
+    assert tracker.fills == [('2', to_fixed('1'))]
+    place(tracker, 6)
+    tracker.reconcile([listed(3, 'SELL', 153.0), listed(6)])
+    assert len(tracker) == 2 and tracker.last_buy().id == '6'
+
+
+def test_indexes_follow_the_statuses(tracker):
+    for id in range(1, 6):
+        place(tracker, id, 'SELL', str(150 + id))
+    tracker.sync_active([listed(id, 'SELL', 150.0 + id) for id in range(1, 6)])
+    tracker.cancelled('1')
+    tracker.sync_active([listed(id, 'SELL', 150.0 + id) for id in range(3, 6)])
+    tracker.confirm([listed(2, 'SELL', 152.0, remaining=0, status='FILLED')])
+    assert tracker.lowest_sell().id == '3'
+    assert [order.id for order in tracker.active_sells()] == ['3', '4', '5']
+    assert [order.id for order in tracker.by_status('FILLED')] == ['2']
+    assert [order.id for order in tracker.by_status('CANCELLED', side='SELL')] == ['1']
+
+
+def test_placed_at_is_in_epoch_seconds():
+    api_order = Order.from_api(listed(5))
+    assert api_order.placed_at == EPOCH + 5
+    assert Order('150', '1', 'BUY', placed_at='2019-12-12T01:00:00+01:00').placed_at == EPOCH
+    local = Order('150', '1', 'BUY', placed_at=time.time())
+    assert sorted([local, api_order], key=lambda o: o.placed_at) == [api_order, local]
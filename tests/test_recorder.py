@@ -0,0 +1,61 @@
+import numpy as np
+from synthetic import orderbook_stream
+from makerbot.helpers import OrderBookRing
+from makerbot.recorder import OrderBookRecorder, iter_recording, list_segments, load_segment
+
+
+def make_ring(count: int, depth: int = 10, float_type=np.float64, seed: int = 0) -> OrderBookRing:
+    ring = OrderBookRing(count, depth, float_type)
+    for idx, book in enumerate(orderbook_stream(count, depth=depth, seed=seed)):
+        ring.update(book, t=10**9 * (idx + 1))
+    return ring
+
+
+def record(root, ring, market='eth_usdc', segment_size=7):
+    recorder = OrderBookRecorder(str(root), segment_size)
+    for t, row in zip(ring.t, ring.data):
+        recorder.record(market, t, row)
+    recorder.close()
+    assert recorder.dropped == 0
+
+
+def test_segments_read_back_what_was_recorded(tmp_path):
+    ring = make_ring(30)
+    record(tmp_path, ring)
+    assert len(list_segments(str(tmp_path), 'eth_usdc')) == 5
+    parts = list(iter_recording(str(tmp_path), 'eth_usdc'))
+    np.testing.assert_array_equal(np.concatenate([obs.t for obs in parts]), ring.t)
+    np.testing.assert_array_equal(np.concatenate([obs.data for obs in parts]), ring.data)
+    assert parts[0].data.dtype == ring.data.dtype and parts[0].data.shape[1] == 10
+
+
+def test_longdouble_rows_round_trip(tmp_path):
+    ring = make_ring(5, depth=25, float_type=np.longdouble)
+    record(tmp_path, ring)
+    obs = load_segment(list_segments(str(tmp_path), 'eth_usdc')[0])
+    np.testing.assert_array_equal(obs.data, ring.data)
+
+
+def test_markets_are_recorded_apart(tmp_path):
+    record(tmp_path, make_ring(3, seed=1), 'eth_usdc')
+    record(tmp_path, make_ring(4, seed=2), 'btc_usdc')
+    assert [len(obs.t) for obs in iter_recording(str(tmp_path), 'btc_usdc')] == [4]
+    assert list(iter_recording(str(tmp_path), 'neo_usdc')) == []
+
+
+def test_time_range(tmp_path):
+    ring = make_ring(30)
+    record(tmp_path, ring)
+    start, end = ring.t[9], ring.t[23]
+    parts = list(iter_recording(str(tmp_path), 'eth_usdc', start, end))
+    np.testing.assert_array_equal(np.concatenate([obs.t for obs in parts]), ring.t[9:23])
+
+
+def test_rows_being_written_are_left_out(tmp_path):
+    ring = make_ring(3)
+    record(tmp_path, ring)
+    segment = list_segments(str(tmp_path), 'eth_usdc')[0]
+    # Half a snapshot written, its timestamp not yet
+    with open(segment + '.obs', 'ab') as obs_file:
+        obs_file.write(ring.data[0].tobytes()[:100])
+    np.testing.assert_array_equal(load_segment(segment).t, ring.t)
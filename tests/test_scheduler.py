@@ -0,0 +1,163 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from synthetic import make_orderbook
+from makerbot import scheduler as scheduler_module
+from makerbot.feed import MarketPoller
+from makerbot.scheduler import RequestScheduler, TokenBucket, backoff
+
+
+class Clock:
+    """Stands in for the time module of the scheduler."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler_module, 'time', clock)
+    return clock
+
+
+class Flaky:
+    """Fails the first failures calls."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, value):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError("call {} failed".format(self.calls))
+        return value
+
+
+def test_bucket_serves_the_burst_then_the_rate(clock):
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    clock.now += 0.2
+    assert bucket.wait_time() == pytest.approx(0.1)
+    clock.now += 10
+    # Refilled up to the burst only
+    assert bucket.wait_time(3) == 0 and bucket.wait_time(4) == pytest.approx(0.1)
+
+def test_bucket_without_rate_never_waits(clock):
+    bucket = TokenBucket(rate=None)
+    assert all(bucket.reserve() == 0 for _ in range(100))
+    assert bucket.wait_time(100) == 0
+
+def test_backoff_grows_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(scheduler_module.random, 'uniform', lambda low, high: high)
+    delays = [backoff(attempt) for attempt in range(10)]
+    assert delays[:3] == pytest.approx([0.1, 0.2, 0.4])
+    assert max(delays) == scheduler_module.RETRY_CAP
+
+def test_run_retries_until_it_succeeds(clock):
+    scheduler = RequestScheduler(rate=None, deadline=10)
+    func = Flaky(3)
+    assert scheduler.run(func, 'ok') == 'ok'
+    assert (func.calls, scheduler.retries, scheduler.failures) == (4, 3, 3)
+    assert len(clock.slept) == 3
+
+def test_run_raises_past_the_deadline(clock):
+    scheduler = RequestScheduler(rate=None, deadline=1)
+    func = Flaky(1000)
+    with pytest.raises(IOError):
+        scheduler.run(func, 'ok')
+    assert sum(clock.slept) < 1
+    assert scheduler.failures == scheduler.retries + 1
+
+def test_no_deadline_means_no_retries(clock):
+    scheduler = RequestScheduler(rate=None)
+    func = Flaky(1)
+    with pytest.raises(IOError):
+        scheduler.run(func, 'ok', deadline=0)
+    assert func.calls == 1 and scheduler.retries == 0
+
+def test_run_waits_for_tokens(clock):
+    scheduler = RequestScheduler(rate=2, burst=1)
+    for _ in range(3):
+        scheduler.run(Flaky(0), 'ok')
+    assert clock.slept == pytest.approx([0.5, 0.5])
+
+def test_call_retries_on_the_event_loop(monkeypatch):
+    monkeypatch.setattr(scheduler_module, 'RETRY_BASE', 0.001)
+    scheduler = RequestScheduler(rate=None, deadline=5)
+    func = Flaky(2)
+    assert asyncio.run(scheduler.call(func, 'ok')) == 'ok'
+    assert func.calls == 3 and scheduler.retries == 2
+    with pytest.raises(IOError):
+        asyncio.run(scheduler.call(Flaky(1), 'ok', deadline=0))
+
+
+class BookApi:
+    """Order books whose update_id changes only when told to."""
+
+    def __init__(self):
+        self.update_id = 0
+        self.fail = False
+
+    def get_order_book(self, market):
+        if self.fail:
+            raise IOError("no book")
+        return make_orderbook(update_id=self.update_id)
+
+
+def test_poll_interval_adapts_to_the_book():
+    api = BookApi()
+    poller = MarketPoller(api, RequestScheduler(rate=None), min_interval=0.05, max_interval=0.8)
+    subscription = poller.add('eth_usdc', 0.2).subscribe()
+
+    async def poll(times, changing=False):
+        for _ in range(times):
+            api.update_id += changing
+            await poller.poll('eth_usdc')
+        return poller.interval('eth_usdc')
+
+    assert asyncio.run(poll(1, True)) == pytest.approx(0.1)
+    assert asyncio.run(poll(5, True)) == pytest.approx(0.05)
+    assert asyncio.run(poll(2)) == pytest.approx(0.2)
+    assert asyncio.run(poll(5)) == pytest.approx(0.8)
+    api.fail = True
+    assert asyncio.run(poll(1, True)) == pytest.approx(0.8)
+    assert len(subscription.drain()) == 6
+
+def test_poll_headroom_fits_in_the_burst():
+    assert MarketPoller(BookApi(), RequestScheduler(rate=10, burst=5)).headroom == 2
+    assert MarketPoller(BookApi(), RequestScheduler(rate=10, burst=2)).headroom == 1
+    assert MarketPoller(BookApi(), RequestScheduler(rate=None, burst=0)).headroom == 2
+    with pytest.raises(Exception):
+        MarketPoller(BookApi(), RequestScheduler(rate=10, burst=0.5))
+
+def test_busy_markets_are_polled_more():
+    polls = {'busy': 0, 'idle': 0}
+
+    def get_order_book(market):
+        polls[market] += 1
+        # Only the busy book changes between polls
+        return make_orderbook(update_id=polls['busy'] if market == 'busy' else 0)
+
+    async def run():
+        poller = MarketPoller(SimpleNamespace(get_order_book=get_order_book), RequestScheduler(rate=None),
+                              min_interval=0.01, max_interval=0.2)
+        poller.add('busy', 0.05)
+        poller.add('idle', 0.05)
+        poller.start()
+        await asyncio.sleep(0.5)
+        poller.stop()
+
+    asyncio.run(run())
+    assert polls['busy'] > 3 * polls['idle'] > 0
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from synthetic import orderbook_stream
+from makerbot import helpers
+from makerbot.helpers import OrderBookRing, OrderBookSeries, RingBuffer, window_start
+
+
+def test_ring_buffer_keeps_the_last_rows_in_order():
+    ring = RingBuffer(4, np.int64)
+    assert len(ring) == 0 and len(ring.view()) == 0
+    for value in range(11):
+        ring.append(value)
+        assert list(ring.view()) == list(range(max(0, value - 3), value + 1))
+
+def test_ring_buffer_view_shares_its_storage():
+    ring = RingBuffer(3, np.int64)
+    for value in range(5):
+        ring.append(value)
+    view = ring.view()
+    assert np.shares_memory(view, ring._buf)
+    assert view.flags['C_CONTIGUOUS']
+
+def test_ring_buffer_rows_with_shape():
+    ring = RingBuffer(2, np.float64, (3,))
+    for value in range(3):
+        ring.append(np.full(3, value))
+    np.testing.assert_array_equal(ring.view(), [[1, 1, 1], [2, 2, 2]])
+
+def test_ring_buffer_capacity_of_one():
+    ring = RingBuffer(1, np.int64)
+    ring.append(1)
+    ring.append(2)
+    assert list(ring.view()) == [2]
+
+def test_ring_buffer_refuses_no_capacity():
+    with pytest.raises(Exception):
+        RingBuffer(0, np.int64)
+
+@pytest.mark.parametrize('size', [1, 7, 30])
+def test_ring_matches_append_backend(size):
+    ring = OrderBookRing(size)
+    obs = OrderBookSeries()
+    for book in orderbook_stream(40):
+        ring = ring.update(book, size)
+        obs = obs.update(book, size)
+        assert len(ring.t) == len(obs.t)
+        np.testing.assert_array_equal(ring.data, obs.data)
+    assert (np.diff(ring.t) >= np.timedelta64(0)).all()
+
+def seconds(*values):
+    return np.array([int(value * 1e9) for value in values], dtype='datetime64[ns]')
+
+def test_window_start_excludes_the_bound():
+    t = seconds(0, 1, 2, 5, 10, 15)
+    assert window_start(t, 5) == 5
+    assert window_start(t, 5.5) == 4
+    assert window_start(t, 100) == 0
+    assert window_start(t, 0) == 6
+
+def test_window_start_with_equal_times():
+    t = seconds(1, 2, 2, 2, 3)
+    assert window_start(t, 1) == 4
+    assert window_start(t, 1.5) == 1
+
+def test_window_is_a_view_of_the_last_seconds():
+    t = seconds(*range(20))
+    data = np.zeros((20, 2), dtype=helpers.OBS_DTYPE)
+    window = OrderBookSeries(t, data).window(4.5)
+    np.testing.assert_array_equal(window.t, t[15:])
+    assert np.shares_memory(window.data, data)
+
+def test_ring_windows_follow_updates(monkeypatch):
+    now = [0]
+    monkeypatch.setattr(helpers.time, 'time_ns', lambda: now[0])
+    ring = OrderBookRing(20)
+    obs = OrderBookSeries()
+    for book in orderbook_stream(30):
+        now[0] += 10**9
+        ring.update(book)
+        obs = obs.update(book, 20)
+        for length in (0.5, 3, 10, 100):
+            # Twice to hit the cached bounds
+            for _ in range(2):
+                window = ring.window(length)
+                np.testing.assert_array_equal(window.t, obs.window(length).t)
+                np.testing.assert_array_equal(window.data, obs.window(length).data)
@@ -0,0 +1,30 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from makerbot import core
+from makerbot.helpers import Order
+from makerbot.simulator import SimulatorApi
+
+
+def simulator(config) -> SimulatorApi:
+    return SimulatorApi({'eth_usdc': config}, seed=3)
+
+
+def test_latency_overlaps_between_calls(market_config):
+    api = simulator(market_config(sim_latency=0.2))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        start = time.perf_counter()
+        list(pool.map(lambda _: api.get_order_book('eth_usdc'), range(4)))
+        elapsed = time.perf_counter() - start
+    assert elapsed < 0.5
+
+
+def test_send_order_places_on_the_simulator(monkeypatch, market_config):
+    api = simulator(market_config())
+    monkeypatch.setattr(core, 'api', api, raising=False)
+    monkeypatch.setattr(core, 'logger', logging.getLogger('pymaker'), raising=False)
+    market = api.get_market('eth_usdc')
+    order = core.send_order(market, Order('100', '1', 'BUY'))
+    assert order.id is not None
+    listed = api.list_account_orders('eth_usdc').orders
+    assert [(listed_order.id, listed_order.amount.amount) for listed_order in listed] == [(order.id, '1')]
@@ -0,0 +1,46 @@
+import sys
+from makerbot import supervisor
+from makerbot.supervisor import Supervisor, shard
+
+
+def crash_until(path: str, runs: int):
+    """Exits with an error until it ran runs times."""
+    with open(path, 'a') as out:
+        out.write('run\n')
+    with open(path) as log:
+        if len(log.readlines()) < runs:
+            sys.exit(1)
+
+
+def test_markets_are_sharded_round_robin():
+    assert shard(['a', 'b', 'c', 'd', 'e'], 2) == [['a', 'c', 'e'], ['b', 'd']]
+    assert shard(['a'], 3) == [['a']]
+
+
+def test_crashed_processes_restart_with_a_growing_backoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, 'MIN_BACKOFF', 0.01)
+    path = str(tmp_path / 'runs')
+    processes = Supervisor(interval=0.01)
+    processes.add('worker-0', crash_until, path, 4)
+    processes.run()
+    with open(path) as log:
+        assert len(log.readlines()) == 4
+    assert processes.restarts == 3
+    assert processes._children[0].backoff == 0.08
+
+
+def test_backoff_is_capped_and_reset_after_a_stable_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(supervisor, 'MIN_BACKOFF', 0.01)
+    monkeypatch.setattr(supervisor, 'MAX_BACKOFF', 0.015)
+    processes = Supervisor(interval=0.01)
+    processes.add('worker-0', crash_until, str(tmp_path / 'capped'), 3)
+    processes.run()
+    assert processes._children[0].backoff == 0.015
+    # Every run counts as stable, the backoff starts over after each crash
+    monkeypatch.setattr(supervisor, 'MAX_BACKOFF', 60.0)
+    monkeypatch.setattr(supervisor, 'STABLE_UPTIME', 0)
+    processes = Supervisor(interval=0.01)
+    processes.add('worker-0', crash_until, str(tmp_path / 'stable'), 3)
+    processes.run()
+    assert processes.restarts == 2
+    assert processes._children[0].backoff == 0.02